@@ -0,0 +1,59 @@
+"""Syntetisk VidaXL feed til benchmarks.
+
+Skriver en CSV med samme kolonner som productsup-feedet (inkl. de lange
+beskrivende kolonner vi ikke bruger), deterministisk ud fra et seed.
+"""
+import csv
+import random
+import argparse
+
+FEED_COLUMNS = [
+    'SKU', 'Title', 'Description', 'Category', 'Brand', 'EAN',
+    'B2B price', 'Webshop price', 'Stock', 'Weight', 'Image 1', 'Image 2'
+]
+FIRST_SKU = 3000000
+
+
+def feed_rows(rows, seed=42):
+    """Yield feed rækker som dicts"""
+    rng = random.Random(seed)
+    for i in range(rows):
+        sku = FIRST_SKU + i
+        b2b_price = round(rng.uniform(5, 4000), 2)
+        yield {
+            'SKU': sku,
+            'Title': f"vidaXL Product {sku}",
+            'Description': f"Synthetic description for product {sku}. " * 8,
+            'Category': rng.choice(['Furniture', 'Garden', 'Lighting', 'Toys', 'Home']),
+            'Brand': 'vidaXL',
+            'EAN': f"87{sku:011d}",
+            'B2B price': b2b_price,
+            'Webshop price': round(b2b_price * 1.9, 2),
+            'Stock': rng.choice([0, 0, 1, 2, 5, 10, 25, 50, 100]),
+            'Weight': round(rng.uniform(0.1, 60), 2),
+            'Image 1': f"https://images.example.com/{sku}_1.jpg",
+            'Image 2': f"https://images.example.com/{sku}_2.jpg",
+        }
+
+
+def write_feed(path, rows, seed=42):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FEED_COLUMNS)
+        writer.writeheader()
+        writer.writerows(feed_rows(rows, seed))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='vidaxl_feed.csv')
+    args = parser.parse_args()
+
+    write_feed(args.out, args.rows, args.seed)
+    print(f"✅ Wrote {args.rows} rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
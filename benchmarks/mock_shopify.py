@@ -0,0 +1,364 @@
+"""Lokal mock af Shopify Admin GraphQL til benchmarks.
+
+Understøtter det scripts faktisk sender: productVariants paging, SKU
+search, updated_at og id-interval filtre, productVariantsBulkUpdate og
+inventorySetQuantities, med en
+leaky-bucket cost throttle (THROTTLED + extensions.cost) og konfigurerbar
+latency. Serverer også feedet på /feed.csv med ETag.
+
+Bulk queries: bulkOperationRunQuery starter en operation (én ad gangen,
+som i Shopify), currentBulkOperation melder den COMPLETED efter
+`bulk_polls` polls, og resultatet hentes på /bulk/<n>.jsonl - en optaget
+JSONL fil hvis `bulk_jsonl` er sat, ellers kataloget som variant nodes.
+Bulk mutations (staged upload) understøttes ikke.
+"""
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKET_SIZE = 1000.0
+RESTORE_RATE = 50.0
+MUTATION_COST = 10
+
+SKU_SEARCH = re.compile(r'"([^"]+)"')
+UPDATED_SINCE = re.compile(r"updated_at:>'([^']+)'")
+ID_RANGE = re.compile(r"id:(>=|<)(\d+)")
+CATALOG_CREATED = '2026-01-01T00:00:00Z'
+FIRST_ARG = re.compile(r'first:\s*(\d+)')
+PRODUCT_UPDATE = re.compile(r'(\w+):\s*productVariantsBulkUpdate\(productId:\s*\$(\w+),\s*variants:\s*\$(\w+)\)')
+
+
+def _now():
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def _retail_price(b2b_price):
+    return int(10 * math.ceil(float(b2b_price) * 1.60 / 10) - 1)
+
+
+class MockCatalog:
+    """Shopify-siden af benchmarket: varianter bygget ud fra feedet"""
+
+    def __init__(self, feed_rows, in_shop=0.9, drift=0.1, seed=7):
+        rng = random.Random(seed)
+        self.variants = []
+        for row in feed_rows:
+            if rng.random() > in_shop:
+                continue
+            n = len(self.variants) + 1
+            price = _retail_price(row['B2B price'])
+            cost = float(row['B2B price'])
+            inventory = int(row['Stock'])
+            # En del af kataloget afviger fra feedet, så diffen finder ændringer
+            if rng.random() < drift:
+                price += 10
+            if rng.random() < drift:
+                inventory += 1
+            self.variants.append({
+                'id': n,
+                'sku': str(row['SKU']),
+                'product_id': (n + 2) // 3,
+                'inventory_item_id': 500000 + n,
+                'price': float(price),
+                'cost': cost,
+                'inventory': inventory,
+                'updated_at': CATALOG_CREATED,
+            })
+        self.by_sku = {v['sku']: v for v in self.variants}
+        self.by_id = {v['id']: v for v in self.variants}
+        self.by_inventory_item = {v['inventory_item_id']: v for v in self.variants}
+
+    def node(self, v):
+        return {
+            'id': f"gid://shopify/ProductVariant/{v['id']}",
+            'sku': v['sku'],
+            'price': f"{v['price']:.2f}",
+            'inventoryQuantity': v['inventory'],
+            'updatedAt': v['updated_at'],
+            'product': {'id': f"gid://shopify/Product/{v['product_id']}"},
+            'inventoryItem': {
+                'id': f"gid://shopify/InventoryItem/{v['inventory_item_id']}",
+                'unitCost': {'amount': f"{v['cost']:.2f}"},
+            },
+        }
+
+
+def _id_filter(id_range):
+    """[('>=', '10'), ('<', '20')] -> predikat på variant ID"""
+    def where(v):
+        return all(v['id'] >= int(n) if op == '>=' else v['id'] < int(n) for op, n in id_range)
+    return where
+
+
+class MockShopifyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, catalog, feed_path=None, latency=0.0, host='127.0.0.1', port=0,
+                 bulk_jsonl=None, bulk_polls=1):
+        super().__init__((host, port), MockShopifyHandler)
+        self.catalog = catalog
+        self.feed_path = feed_path
+        self.latency = latency
+        self.bulk_jsonl = bulk_jsonl
+        self.bulk_polls = bulk_polls
+        self.bulk_operations = []  # [{id, status, polls, body}]
+        self.lock = threading.Lock()
+        self.available = BUCKET_SIZE
+        self.updated = time.monotonic()
+        self.reset_stats()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'throttled': 0, 'cost': 0, 'operations': {}}
+
+    def snapshot_stats(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+    def charge(self, operation, cost):
+        """Træk `cost` fra bucket; returnerer (ok, throttleStatus)"""
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(BUCKET_SIZE, self.available + (now - self.updated) * RESTORE_RATE)
+            self.updated = now
+            self.stats['requests'] += 1
+            ops = self.stats['operations']
+            ops[operation] = ops.get(operation, 0) + 1
+            ok = self.available >= cost
+            if ok:
+                self.available -= cost
+                self.stats['cost'] += cost
+            else:
+                self.stats['throttled'] += 1
+            status = {
+                'maximumAvailable': BUCKET_SIZE,
+                'currentlyAvailable': int(self.available),
+                'restoreRate': RESTORE_RATE,
+            }
+            return ok, status
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+class MockShopifyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/bulk/'):
+            return self._bulk_result()
+        if self.path != '/feed.csv' or not self.server.feed_path:
+            return self._send(404)
+        with open(self.server.feed_path, 'rb') as f:
+            body = f.read()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, headers={'ETag': etag})
+        self._send(200, body, 'text/csv', {'ETag': etag})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        query = payload.get('query', '')
+        variables = payload.get('variables') or {}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        operation, cost, handler = self._route(query, variables)
+        ok, status = self.server.charge(operation, cost)
+        extensions = {'cost': {
+            'requestedQueryCost': cost,
+            'actualQueryCost': cost if ok else None,
+            'throttleStatus': status,
+        }}
+        if not ok:
+            body = {'errors': [{'message': 'Throttled', 'extensions': {'code': 'THROTTLED'}}]}
+        else:
+            body = handler()
+        body['extensions'] = extensions
+        self._send(200, json.dumps(body).encode())
+
+    # --- operations -------------------------------------------------------
+
+    def _route(self, query, variables):
+        if 'bulkOperationRunQuery' in query:
+            return 'bulkOperationRunQuery', 10, lambda: self._run_bulk_query(variables['query'])
+        if 'currentBulkOperation' in query:
+            return 'currentBulkOperation', 1, self._current_bulk_operation
+        if 'variantIdBounds' in query:
+            return 'variantIdBounds', 4, self._bounds
+        aliases = PRODUCT_UPDATE.findall(query)
+        if aliases:
+            # Hvert aliased felt koster som en selvstændig mutation
+            return 'productVariantsBulkUpdate', MUTATION_COST * len(aliases), \
+                lambda: {'data': {alias: self._product_update(variables[product], variables[variants])
+                                  for alias, product, variants in aliases}}
+        if 'productVariantsBulkUpdate' in query:
+            return 'productVariantsBulkUpdate', MUTATION_COST, lambda: self._bulk_update(variables)
+        if 'inventorySetQuantities' in query:
+            return 'inventorySetQuantities', MUTATION_COST, lambda: self._set_quantities(variables)
+        if 'productVariants' in query:
+            match = FIRST_ARG.search(query)
+            first = int(variables.get('first') or (match.group(1) if match else 250))
+            search = variables.get('query')
+            since = UPDATED_SINCE.search(search or '')
+            if since:
+                return 'productVariants:updated', first + 2, \
+                    lambda: self._page(first, variables.get('cursor'), lambda v: v['updated_at'] > since.group(1))
+            id_range = ID_RANGE.findall(search or '')
+            if id_range:
+                return 'productVariants:partition', first + 2, \
+                    lambda: self._page(first, variables.get('cursor'), _id_filter(id_range))
+            if search:
+                return 'productVariants:search', first + 2, lambda: self._search(search, first)
+            return 'productVariants:page', first + 2, lambda: self._page(first, variables.get('cursor'))
+        return 'unsupported', 1, lambda: {'errors': [{'message': 'Operation not supported by mock'}]}
+
+    # --- bulk operations --------------------------------------------------
+
+    def _run_bulk_query(self, query):
+        server = self.server
+        with server.lock:
+            running = server.bulk_operations[-1] if server.bulk_operations else None
+            if running and running['status'] == 'RUNNING':
+                return {'data': {'bulkOperationRunQuery': {'bulkOperation': None, 'userErrors': [{
+                    'field': None,
+                    'message': f"A bulk query operation for this app and shop is already in progress: {running['id']}",
+                }]}}}
+            if server.bulk_jsonl:
+                with open(server.bulk_jsonl, 'rb') as f:
+                    body = f.read()
+            else:
+                body = b''.join(json.dumps(server.catalog.node(v)).encode() + b'\n'
+                                for v in server.catalog.variants)
+            operation = {
+                'id': f"gid://shopify/BulkOperation/{len(server.bulk_operations) + 1}",
+                'status': 'RUNNING', 'polls': 0, 'body': body,
+            }
+            server.bulk_operations.append(operation)
+        return {'data': {'bulkOperationRunQuery': {
+            'bulkOperation': {'id': operation['id'], 'status': 'CREATED'}, 'userErrors': [],
+        }}}
+
+    def _current_bulk_operation(self):
+        server = self.server
+        with server.lock:
+            if not server.bulk_operations:
+                return {'data': {'currentBulkOperation': None}}
+            operation = server.bulk_operations[-1]
+            operation['polls'] += 1
+            if operation['status'] == 'RUNNING' and operation['polls'] >= server.bulk_polls:
+                operation['status'] = 'COMPLETED'
+            done = operation['status'] == 'COMPLETED'
+            number = len(server.bulk_operations)
+            objects = operation['body'].count(b'\n') if done else 0
+        return {'data': {'currentBulkOperation': {
+            'id': operation['id'],
+            'status': operation['status'],
+            'errorCode': None,
+            'objectCount': str(objects),
+            'url': f"{server.url}/bulk/{number}.jsonl" if done and operation['body'] else None,
+            'partialDataUrl': None,
+        }}}
+
+    def _bulk_result(self):
+        try:
+            number = int(self.path[len('/bulk/'):].split('.', 1)[0])
+            operation = self.server.bulk_operations[number - 1]
+        except (ValueError, IndexError):
+            return self._send(404)
+        self._send(200, operation['body'], 'application/jsonl')
+
+    def _bounds(self):
+        variants = self.server.catalog.variants
+        edges = lambda v: {'edges': [{'node': {'id': f"gid://shopify/ProductVariant/{v['id']}"}}]}
+        if not variants:
+            return {'data': {'lowest': {'edges': []}, 'highest': {'edges': []}}}
+        return {'data': {'lowest': edges(variants[0]), 'highest': edges(variants[-1])}}
+
+    def _page(self, first, cursor, where=None):
+        variants = self.server.catalog.variants
+        if where:
+            variants = [v for v in variants if where(v)]
+        start = int(cursor) if cursor else 0
+        page = variants[start:start + first]
+        end = start + len(page)
+        return {'data': {'productVariants': {
+            'edges': [{'node': self.server.catalog.node(v)} for v in page],
+            'pageInfo': {'hasNextPage': end < len(variants), 'endCursor': str(end)},
+        }}}
+
+    def _search(self, search, first):
+        catalog = self.server.catalog
+        skus = SKU_SEARCH.findall(search)
+        found = [catalog.by_sku[sku] for sku in skus if sku in catalog.by_sku][:first]
+        return {'data': {'productVariants': {
+            'edges': [{'node': catalog.node(v)} for v in found],
+        }}}
+
+    def _bulk_update(self, variables):
+        catalog = self.server.catalog
+        updated = []
+        for variant in variables.get('productVariants') or variables.get('variants') or []:
+            v = catalog.by_id.get(int(variant['id'].rsplit('/', 1)[-1]))
+            if not v:
+                continue
+            if 'price' in variant:
+                v['price'] = float(variant['price'])
+            if 'cost' in variant:
+                # ProductVariantsBulkInput har intet cost felt - den hører til inventoryItem
+                return {'data': {'productVariantsBulkUpdate': {'productVariants': None, 'userErrors': [
+                    {'field': ['variants', 'cost'], 'message': "Field 'cost' doesn't exist on ProductVariantsBulkInput"}
+                ]}}}
+            if (variant.get('inventoryItem') or {}).get('cost') is not None:
+                v['cost'] = float(variant['inventoryItem']['cost'])
+            for quantity in variant.get('inventoryQuantities') or []:
+                v['inventory'] = int(quantity['availableQuantity'])
+            v['updated_at'] = _now()
+            updated.append({'id': variant['id']})
+        return {'data': {'productVariantsBulkUpdate': {'productVariants': updated, 'userErrors': []}}}
+
+    def _product_update(self, product_id, variants):
+        """Ét produkts productVariantsBulkUpdate - varianter fra andre produkter giver userErrors"""
+        product = int(product_id.rsplit('/', 1)[-1])
+        foreign = [n for n, variant in enumerate(variants)
+                   if self.server.catalog.by_id.get(int(variant['id'].rsplit('/', 1)[-1]), {}).get('product_id') != product]
+        if foreign:
+            return {'productVariants': None, 'userErrors': [
+                {'field': ['variants', str(n), 'id'], 'message': 'Product variant does not exist'} for n in foreign
+            ]}
+        return self._bulk_update({'variants': variants})['data']['productVariantsBulkUpdate']
+
+    def _set_quantities(self, variables):
+        catalog = self.server.catalog
+        for quantity in variables['input']['quantities']:
+            v = catalog.by_inventory_item.get(int(quantity['inventoryItemId'].rsplit('/', 1)[-1]))
+            if v:
+                v['inventory'] = int(quantity['quantity'])
+                v['updated_at'] = _now()
+        return {'data': {'inventorySetQuantities': {
+            'inventoryAdjustmentGroup': {'id': 'gid://shopify/InventoryAdjustmentGroup/1'},
+            'userErrors': [],
+        }}}
@@ -0,0 +1,147 @@
+"""Offline benchmark af sync-pipelinen.
+
+Genererer et syntetisk VidaXL feed, starter en lokal mock af Shopify
+GraphQL og kører cache_shop_skus, direct sync diff'en og bulk updateren
+end-to-end mod den. Rapporterer wall time, antal requests, peak RSS og
+throughput pr. stage.
+
+    python benchmarks/run_benchmarks.py --rows 100000 --latency 0.05
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+from generate_feed import feed_rows, write_feed
+from mock_shopify import MockCatalog, MockShopifyServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (stage, script, hvad throughput tælles i)
+STAGES = [
+    ('cache_shop_skus', 'cache_shop_skus.py', 'variants'),
+    ('direct_sync_diff', 'sync_vidaxl_direct.py', 'feed_rows'),
+    ('bulk_update', 'sync_to_shopify_bulk.py', 'changes'),
+]
+
+
+def count_changes(workdir):
+    path = os.path.join(workdir, 'matrixify_delta_update.csv')
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return max(0, sum(1 for _ in f) - 1)
+
+
+def run_stage(name, script, env, workdir, server):
+    """Kør ét script som subprocess og mål wall time, requests og peak RSS"""
+    server.reset_stats()
+    log_path = os.path.join(workdir, f"{name}.log")
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(REPO_DIR, script)],
+            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        # wait4 giver rusage for netop denne child
+        _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    stats = server.snapshot_stats()
+    return {
+        'stage': name,
+        'exit_code': os.waitstatus_to_exitcode(status),
+        'wall_seconds': round(wall, 3),
+        'requests': stats['requests'],
+        'throttled': stats['throttled'],
+        'cost': stats['cost'],
+        'operations': stats['operations'],
+        'peak_rss_mb': round(rusage.ru_maxrss / 1024, 1),
+        'log': log_path,
+    }
+
+
+def print_table(results):
+    print(f"\n{'stage':<18}{'wall s':>9}{'requests':>10}{'throttled':>10}"
+          f"{'peak MB':>9}{'items':>9}{'items/s':>11}")
+    for r in results:
+        print(f"{r['stage']:<18}{r['wall_seconds']:>9.2f}{r['requests']:>10}{r['throttled']:>10}"
+              f"{r['peak_rss_mb']:>9.1f}{r['items']:>9}{r['throughput_per_second']:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='feed rows (10k-500k)')
+    parser.add_argument('--latency', type=float, default=0.05, help='mock latency per request (s)')
+    parser.add_argument('--in-shop', type=float, default=0.9, help='share of feed SKUs in the shop')
+    parser.add_argument('--drift', type=float, default=0.1, help='share of variants that differ')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--report-dir', default='reports')
+    parser.add_argument('--keep-workdir', action='store_true')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='vidaxl_bench_')
+    print(f"🧪 Benchmark: {args.rows} rows, {args.latency*1000:.0f} ms latency, workdir {workdir}")
+
+    feed_path = write_feed(os.path.join(workdir, 'feed.csv'), args.rows, args.seed)
+    catalog = MockCatalog(feed_rows(args.rows, args.seed), args.in_shop, args.drift)
+    server = MockShopifyServer(catalog, feed_path, args.latency).start()
+    print(f"  Mock Shopify with {len(catalog.variants)} variants on {server.url}")
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO_DIR,
+        SHOPIFY_ACCESS_TOKEN='benchmark',
+        SHOPIFY_API_URL=f"{server.url}/graphql",
+        SHOPIFY_SNAPSHOT_MODE='paged',
+        VIDAXL_URL=f"{server.url}/feed.csv",
+        TEST_MODE='false',
+        # Mock'en understøtter bulk queries, men ikke bulk mutations (staged upload)
+        BULK_MUTATION_THRESHOLD=str(10 ** 9),
+    )
+
+    results = []
+    for name, script, unit in STAGES:
+        print(f"▶️  {name}...")
+        result = run_stage(name, script, env, workdir, server)
+        result['items'] = {
+            'variants': len(catalog.variants),
+            'feed_rows': args.rows,
+            'changes': count_changes(workdir),
+        }[unit]
+        result['unit'] = unit
+        result['throughput_per_second'] = (
+            round(result['items'] / result['wall_seconds'], 1) if result['wall_seconds'] else 0
+        )
+        results.append(result)
+        if result['exit_code'] != 0:
+            print(f"❌ {name} exited with {result['exit_code']} - see {result['log']}")
+            break
+
+    server.shutdown()
+    print_table(results)
+
+    os.makedirs(args.report_dir, exist_ok=True)
+    report_file = os.path.join(
+        args.report_dir, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(report_file, 'w') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(),
+            'rows': args.rows,
+            'latency': args.latency,
+            'variants': len(catalog.variants),
+            'stages': results,
+        }, f, indent=2)
+    print(f"\n📄 Report saved to: {report_file}")
+
+    if not args.keep_workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,111 +1,121 @@
-import requests
-import json
 import os
 from datetime import datetime
+import instrumentation
+from catalog import CatalogBuilder
+from sku_index import index_entry
+from shopify_bulk import bulk_snapshot, use_bulk_snapshot
+from shopify_client import shared_client
+from shopify_paging import fetch_partitioned, FETCH_PARTITIONS
+from state_store import StateStore
+from sync_config import SHOPIFY_STORE, TOKEN_ENV
 
 # Shopify credentials
-SHOPIFY_STORE = 'b7916a-38.myshopify.com'
-SHOPIFY_TOKEN = os.environ['SHOPIFY_ACCESS_TOKEN']
+SHOPIFY_TOKEN = os.environ[TOKEN_ENV]
 
-def fetch_all_skus_graphql():
-    """Hent alle SKUs via GraphQL - MEGET hurtigere!"""
+client = shared_client(SHOPIFY_STORE, SHOPIFY_TOKEN)
+
+BULK_VARIANTS_QUERY = """
+{
+  productVariants {
+    edges {
+      node {
+        id
+        sku
+        product {
+          id
+        }
+        inventoryItem {
+          id
+        }
+      }
+    }
+  }
+}
+"""
+
+def add_variant(index, node):
+    """Variant node -> SKU + IDs i kataloget (tomme SKUs springes over)"""
+    sku = node.get('sku')
+    if sku and sku.strip():
+        variant_id, product_id, inventory_item_id = index_entry(node)
+        index.add(str(sku).strip(), variant_id=variant_id, product_id=product_id,
+                  inventory_item_id=inventory_item_id)
+
+def fetch_all_variants_bulk():
+    """Hent alle SKUs + IDs via en Bulk Operation (streamet JSONL)"""
+    index = CatalogBuilder()
+    for node in bulk_snapshot(client, BULK_VARIANTS_QUERY):
+        add_variant(index, node)
+    return index.build()
+
+VARIANTS_PAGE_QUERY = """
+query getVariants($cursor: String, $query: String) {
+  productVariants(first: 250, after: $cursor, query: $query) {
+    edges {
+      node {
+        id
+        sku
+        product {
+          id
+        }
+        inventoryItem {
+          id
+        }
+      }
+    }
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+  }
+}
+"""
+
+def fetch_all_variants_graphql():
+    """Hent alle SKUs + variant/produkt/inventory IDs via GraphQL som Catalog"""
+    if use_bulk_snapshot():
+        return fetch_all_variants_bulk()
+    
     print(f"🚀 Fetching SKUs via GraphQL...")
     
-    all_skus = set()
-    has_next_page = True
-    cursor = None
-    page_count = 0
+    index = CatalogBuilder()
     
-    while has_next_page:
-        query = """
-        query getVariants($cursor: String) {
-          productVariants(first: 250, after: $cursor) {
-            edges {
-              node {
-                sku
-              }
-            }
-            pageInfo {
-              hasNextPage
-              endCursor
-            }
-          }
-        }
-        """
-        
-        response = requests.post(
-            f"https://{SHOPIFY_STORE}/admin/api/2024-01/graphql.json",
-            headers={
-                'X-Shopify-Access-Token': SHOPIFY_TOKEN,
-                'Content-Type': 'application/json'
-            },
-            json={
-                'query': query,
-                'variables': {'cursor': cursor}
-            }
-        )
-        
-        if response.status_code != 200:
-            print(f"❌ Error: {response.status_code}")
-            print(response.text)
-            break
-            
-        data = response.json()
-        
-        if 'errors' in data:
-            print(f"❌ GraphQL errors: {data['errors']}")
-            break
-            
-        variants = data['data']['productVariants']
-        
-        # Extract SKUs
-        for edge in variants['edges']:
-            sku = edge['node'].get('sku')
-            if sku and sku.strip():
-                all_skus.add(str(sku).strip())
-        
-        # Pagination
-        has_next_page = variants['pageInfo']['hasNextPage']
-        cursor = variants['pageInfo']['endCursor']
-        page_count += 1
-        
-        print(f"  Progress: {len(all_skus)} SKUs... (Page {page_count})")
+    # Variant ID partitioner pages parallelt; fejl afbryder hele kørslen -
+    # et halvt katalog må ikke fjerne IDs
+    for node in fetch_partitioned(client, VARIANTS_PAGE_QUERY, FETCH_PARTITIONS):
+        add_variant(index, node)
+        if len(index) % 5000 == 0:
+            print(f"  Progress: {len(index)} SKUs...")
     
-    return sorted(list(all_skus))
+    return index.build()
+
+def fetch_all_skus_graphql():
+    """Hent alle SKUs via GraphQL - MEGET hurtigere!"""
+    return fetch_all_variants_graphql().keys()
 
 def main():
     print(f"🚀 Shop SKU Cache - {datetime.now()}")
     
     try:
-        # Fetch all SKUs
-        skus = fetch_all_skus_graphql()
-        print(f"✅ Found {len(skus)} total SKUs")
-        
-        # Save to JSON
-        output = {
-            'skus': skus,
-            'count': len(skus),
-            'updated': datetime.now().isoformat()
-        }
-        
-        with open('shop_skus.json', 'w') as f:
-            json.dump(output, f, indent=2)
+        # Fetch all SKUs + IDs
+        with instrumentation.stage('shopify_fetch') as record:
+            index = fetch_all_variants_graphql()
+            record['variants'] = len(index)
+        print(f"✅ Found {len(index)} total SKUs")
         
-        print(f"💾 Saved to shop_skus.json")
+        # Update the state store - only changed/removed SKUs are written
+        with instrumentation.stage('state_sync') as record, StateStore() as store:
+            changed, removed = store.sync_index(index)
+            record.update(changed=changed, removed=removed)
+        print(f"💾 State store: {changed} SKUs updated, {removed} removed")
         
     except Exception as e:
         print(f"❌ Error: {e}")
+        instrumentation.current_run().fail()
         import traceback
         traceback.print_exc()
-        
-        # Create empty file so workflows don't fail
-        with open('shop_skus.json', 'w') as f:
-            json.dump({
-                'skus': [],
-                'count': 0,
-                'updated': datetime.now().isoformat(),
-                'error': str(e)
-            }, f, indent=2)
+        # Behold eksisterende state store så workflows ikke fejler
 
 if __name__ == "__main__":
-    main()
+    with instrumentation.tracked_run('cache_skus', client):
+        main()
@@ -0,0 +1,206 @@
+"""Kompakt in-memory katalog over Shopify varianter.
+
+I stedet for en dict af dicts (sku -> {'id', 'price', ...}) holdes
+snapshot'et som ét sorteret bytes-array af SKUs og parallelle typed numpy
+arrays. Opslag er binær søgning (O(log n)), og et helt feed kan joines
+mod kataloget i ét vectorized searchsorted-kald.
+
+180k varianter fylder ~11 MB her mod ~57 MB som dict af dicts.
+"""
+from array import array
+import numpy as np
+import pandas as pd
+from sku_index import variant_gid
+
+# kolonne -> (array typecode under opbygning, numpy dtype, default)
+COLUMNS = {
+    'variant_id': ('q', 'int64', 0),
+    'product_id': ('q', 'int64', 0),
+    'inventory_item_id': ('q', 'int64', 0),
+    'price': ('d', 'float64', float('nan')),
+    'cost': ('d', 'float64', float('nan')),
+    'inventory': ('i', 'int32', 0),
+    'updated_at': ('q', 'int64', 0),  # epoch sekunder, 0 = ukendt
+}
+
+
+def _encode_skus(skus):
+    """SKUs -> numpy bytes array; hurtig ASCII-sti, utf-8 for resten"""
+    try:
+        return np.asarray(skus, dtype='S')
+    except UnicodeEncodeError:
+        return np.array([str(sku).encode('utf-8') for sku in skus], dtype='S')
+
+
+def parse_timestamp(stamp):
+    """'2024-01-01T12:00:00Z' -> epoch sekunder"""
+    if not stamp:
+        return 0
+    return int(np.datetime64(stamp[:19], 's').astype('int64'))
+
+
+def format_timestamp(seconds):
+    if not seconds:
+        return None
+    return f"{np.datetime64(int(seconds), 's')}Z"
+
+
+class CatalogBuilder:
+    """Saml varianter i typed buffers - ingen dict pr. variant undervejs"""
+
+    def __init__(self):
+        self.skus = []
+        self.columns = {name: array(typecode) for name, (typecode, _, _) in COLUMNS.items()}
+
+    def add(self, sku, **values):
+        self.skus.append(sku)
+        for name, (_, _, default) in COLUMNS.items():
+            value = values.get(name)
+            self.columns[name].append(default if value is None else value)
+
+    def __len__(self):
+        return len(self.skus)
+
+    def build(self):
+        """Sorter på SKU; ved dubletter vinder højeste variant ID.
+
+        Det svarer til "sidst set" i Shopify's ID-sorterede paging, men
+        afhænger ikke af rækkefølgen siderne kom ind i.
+        """
+        columns = {
+            name: np.frombuffer(self.columns[name], dtype=dtype)
+            if len(self.columns[name]) else np.empty(0, dtype=dtype)
+            for name, (_, dtype, _) in COLUMNS.items()
+        }
+        return _sorted_catalog(_encode_skus(self.skus), columns)
+
+
+def _sorted_catalog(skus, columns):
+    order = np.lexsort((columns['variant_id'], skus))
+    skus = skus[order]
+    keep = np.ones(len(skus), dtype=bool)
+    if len(skus):
+        keep[:-1] = skus[1:] != skus[:-1]
+    # De varianter dubletterne taber til - til reconcile-rapporten
+    duplicates = (skus[~keep], columns['variant_id'][order[~keep]])
+    order = order[keep]
+    return Catalog(skus[keep], {name: values[order] for name, values in columns.items()}, duplicates)
+
+
+class Catalog:
+    """Sorterede SKUs + parallelle kolonner (variant_id, price, cost, inventory, ...)
+
+    `duplicate_skus`/`duplicate_variant_ids` er de varianter der blev valgt
+    fra fordi en anden variant havde samme SKU (én række pr. fravalgt variant).
+    """
+
+    def __init__(self, skus, columns, duplicates=None):
+        self.skus = skus
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+        if duplicates is None:
+            duplicates = (skus[:0], np.empty(0, dtype='int64'))
+        self.duplicate_skus, self.duplicate_variant_ids = duplicates
+
+    def __len__(self):
+        return len(self.skus)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, sku):
+        return self.find(sku) >= 0
+
+    @property
+    def nbytes(self):
+        return self.skus.nbytes + sum(getattr(self, name).nbytes for name in COLUMNS)
+
+    # --- opslag -----------------------------------------------------------
+
+    def positions(self, skus):
+        """Vectorized opslag: position i kataloget pr. SKU, -1 hvis den mangler"""
+        wanted = _encode_skus(skus)
+        if not len(self.skus):
+            return np.full(len(wanted), -1, dtype='int64')
+        pos = np.searchsorted(self.skus, wanted)
+        pos = np.minimum(pos, len(self.skus) - 1)
+        return np.where(self.skus[pos] == wanted, pos, -1)
+
+    def find(self, sku):
+        return int(self.positions([sku])[0])
+
+    def record(self, sku):
+        """Én variant som fetch_shopify_products-record, eller None"""
+        i = self.find(sku)
+        if i < 0:
+            return None
+        return {
+            'id': variant_gid(int(self.variant_id[i])),
+            'price': float(self.price[i]),
+            'inventory': int(self.inventory[i]),
+            'cost': float(self.cost[i]),
+        }
+
+    # --- views ------------------------------------------------------------
+
+    def keys(self):
+        """SKUs som str, sorteret"""
+        return [sku.decode('utf-8') for sku in self.skus.tolist()]
+
+    def items(self):
+        """Index view: (sku, (variant_id, product_id, inventory_item_id)) som sku_index dicts"""
+        return zip(self.keys(), zip(
+            self.variant_id.tolist(), self.product_id.tolist(), self.inventory_item_id.tolist()
+        ))
+
+    def rows(self):
+        """(variant_id, sku, price, cost, inventory, updated_at, product_id, inventory_item_id) til state store'et"""
+        return zip(
+            self.variant_id.tolist(), self.keys(), self.price.tolist(), self.cost.tolist(),
+            self.inventory.tolist(), map(format_timestamp, self.updated_at.tolist()),
+            self.product_id.tolist(), self.inventory_item_id.tolist()
+        )
+
+    def high_water(self):
+        """Seneste updatedAt som ISO streng (Shopify's ur)"""
+        if not len(self) or not self.updated_at.max():
+            return None
+        return format_timestamp(self.updated_at.max())
+
+    def merge(self, changed):
+        """Nyt katalog med `changed` lagt ovenpå - matcher på variant ID, så omdøbte SKUs flytter"""
+        keep = ~np.isin(self.variant_id, changed.variant_id)
+        skus = np.concatenate([self.skus[keep], changed.skus])
+        columns = {
+            name: np.concatenate([getattr(self, name)[keep], getattr(changed, name)])
+            for name in COLUMNS
+        }
+        return _sorted_catalog(skus, columns)
+
+    def with_inventory(self, entries):
+        """Nyt katalog med lager fra [(variant_id, lager)] + de entries der ændrede noget.
+
+        Ukendte variant IDs ignoreres - de kommer med næste snapshot.
+        """
+        if not entries or not len(self):
+            return self, []
+        ids = np.fromiter((variant_id for variant_id, _ in entries), dtype='int64', count=len(entries))
+        values = np.fromiter((inventory for _, inventory in entries), dtype='int32', count=len(entries))
+        order = np.argsort(self.variant_id)
+        slot = np.minimum(np.searchsorted(self.variant_id, ids, sorter=order), len(order) - 1)
+        pos = order[slot]
+        known = self.variant_id[pos] == ids
+        pos, ids, values = pos[known], ids[known], values[known]
+        changed = self.inventory[pos] != values
+        inventory = self.inventory.copy()
+        inventory[pos[changed]] = values[changed]
+        columns = {name: getattr(self, name) for name in COLUMNS}
+        columns['inventory'] = inventory
+        catalog = Catalog(self.skus, columns, (self.duplicate_skus, self.duplicate_variant_ids))
+        return catalog, list(zip(ids[changed].tolist(), values[changed].tolist()))
+
+    def to_frame(self):
+        return pd.DataFrame({
+            'sku': self.keys(),
+            **{name: getattr(self, name) for name in COLUMNS},
+        })
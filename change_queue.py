@@ -0,0 +1,119 @@
+"""Persistent change queue i state store'et.
+
+Updateren læser ikke længere én flad CSV pr. kørsel. Hver ny ændring
+lægges i en kø keyed på SKU (pending_changes), og køen coalescer ved
+ankomst:
+- sidste værdi vinder,
+- felter der stadig mangler fra tidligere kørsler følger med,
+- højeste prioritet bevares.
+
+Pris- og kostfelter hvis målværdi allerede er Shopify's sidst bekræftede
+værdi (shop_variants: snapshot'et plus updaterens egne bekræftelser)
+droppes, og en SKU uden felter tilbage forsvinder fra køen. Lager droppes
+aldrig på den måde - salg trækker lager i Shopify uden at snapshot'et ser
+det, og inventorySetQuantities er idempotent. Updateren dræner køen
+og lægger det der ikke nåede ud tilbage med settle().
+
+En fuld diff mod Shopify (direct sync) kalder retain() med sine SKUs: en
+SKU i køen som diff'en ikke længere har med, står allerede rigtigt i
+Shopify (eller er ude af feedet), og dens gamle målværdi ville være stale.
+"""
+from diff_engine import CHANGE_FIELDS, TOLERANCE
+
+
+def parse_changed_fields(value):
+    """'price;stock' -> change flags. Older CSVs without the column update everything"""
+    if value is None:
+        return {field: True for field in CHANGE_FIELDS}
+    fields = set(value.split(';'))
+    return {field: field in fields for field in CHANGE_FIELDS}
+
+
+def queue_entries(changes):
+    """Updater changes -> (sku, price, cost, inventory, fields, priority) rækker"""
+    return [
+        (c['sku'], str(c['price']), str(c['cost']), str(c['inventory']),
+         ';'.join(field for field in CHANGE_FIELDS if c['changes'][field]), c.get('priority', 0))
+        for c in changes
+    ]
+
+
+def coalesce(changes, queued=()):
+    """Én change pr. SKU - senere værdier vinder, flag og prioritet akkumuleres"""
+    merged = {}
+    for change in (*queued, *changes):
+        previous = merged.get(change['sku'])
+        if previous is not None:
+            change = {
+                **change,
+                'changes': {field: change['changes'][field] or previous['changes'][field]
+                            for field in CHANGE_FIELDS},
+                'priority': max(change.get('priority', 0), previous.get('priority', 0)),
+            }
+        merged[change['sku']] = change
+    return list(merged.values())
+
+
+def _same(value, confirmed):
+    if confirmed is None:
+        return False
+    try:
+        return abs(float(value) - confirmed) <= TOLERANCE
+    except (TypeError, ValueError):
+        return False
+
+
+def settled(change, confirmed):
+    """Slå pris/kost fra hvis målværdien allerede står i Shopify - lager sendes altid"""
+    state = confirmed.get(change['sku'])
+    if state is None:
+        return change
+    price, cost, _ = state
+    matches = {
+        'price': _same(change['price'], price),
+        'cost': _same(change['cost'], cost),
+        'stock': False,
+    }
+    return {**change, 'changes': {field: change['changes'][field] and not matches[field]
+                                  for field in CHANGE_FIELDS}}
+
+
+class ChangeQueue:
+    """Køen i `store` - push ved ankomst, drain + settle i updateren"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def load(self):
+        """Køens changes, højeste prioritet først"""
+        return [
+            {'sku': sku, 'price': price, 'cost': cost, 'inventory': inventory,
+             'changes': parse_changed_fields(fields), 'priority': priority}
+            for sku, price, cost, inventory, fields, priority in self.store.load_pending_changes()
+        ]
+
+    def push(self, changes):
+        """Coalesce `changes` ind i køen. Returnerer (i køen, droppet som allerede bekræftet)"""
+        merged = coalesce(changes, self.load())
+        confirmed = self.store.confirmed_state()
+        queued = [change for change in (settled(change, confirmed) for change in merged)
+                  if any(change['changes'].values())]
+        self.store.replace_pending_changes(queue_entries(queued))
+        return len(queued), len(merged) - len(queued)
+
+    def retain(self, skus):
+        """Efter en fuld diff: drop køens SKUs som ikke er i `skus`. Returnerer antal droppet"""
+        keep = set(skus)
+        queued = self.load()
+        current = [change for change in queued if change['sku'] in keep]
+        if len(current) < len(queued):
+            self.store.replace_pending_changes(queue_entries(current))
+        return len(queued) - len(current)
+
+    def drain(self):
+        """Alt i køen - bliver liggende indtil settle(), så en afbrudt kørsel ikke taber noget"""
+        return self.load()
+
+    def settle(self, leftovers):
+        """Erstat køen med det der ikke nåede ud"""
+        return self.store.replace_pending_changes(queue_entries(leftovers))
@@ -0,0 +1,242 @@
+"""Append-only change log (CDC) ud af diff-trinnet.
+
+Hver kørsel af direct sync eller delta sync lægger sine ændringer i
+loggen som events med et globalt, stigende sekvensnummer:
+
+    {"seq": 1042, "run_id": "direct_sync_20261017_120000", "at": "...",
+     "sku": "8719883", "fields": "price;stock", "priority": 1000.0,
+     "old_price": 499.0, "price": 449, "old_cost": 280.0, "cost": 280.0,
+     "old_inventory": 3, "inventory": 0}
+
+Loggen er delt i segmenter (CHANGELOG_DIR/segment_<første seq>.jsonl),
+og et nyt segment startes når det aktive når SEGMENT_RECORDS events.
+Consumers (updateren, rapporter, alerting) har hver deres offset i
+CHANGELOG_DIR/offsets/<navn> og læser kun events efter det - uafhængigt
+af hinanden og uden at genlæse historikken.
+
+compact() slår de lukkede segmenter sammen til ét event pr. SKU: seneste
+værdier og seq, foreningen af alle events' ændrede felter, de ældste
+old_*-værdier og højeste prioritet. En consumer der er bagud mister derfor
+ingen felter. Sekvensnumrene bevares, så consumers blot ser huller.
+Workflows kører compact efter hver append og cacher changelog/ (inkl.
+offsets) sammen med sync_state.db - loggen ligger ikke i git.
+
+    python changelog.py status
+    python changelog.py tail <consumer> [--commit]
+    python changelog.py compact
+"""
+import os
+import sys
+import json
+import bisect
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from diff_engine import CHANGE_FIELDS, OLD_COLUMNS, changed_fields
+
+CHANGELOG_DIR = os.getenv('SYNC_CHANGELOG_DIR', 'changelog')
+SEGMENT_RECORDS = int(os.getenv('CHANGELOG_SEGMENT_RECORDS', '100000'))
+EVENT_COLUMNS = [
+    'seq', 'run_id', 'at', 'sku', 'fields', 'priority',
+    'old_price', 'price', 'old_cost', 'cost', 'old_inventory', 'inventory',
+]
+
+
+def _segment_name(first_seq):
+    return f"segment_{first_seq:012d}.jsonl"
+
+
+class ChangeLog:
+    """Segmenteret JSONL log med consumer offsets"""
+
+    def __init__(self, directory=CHANGELOG_DIR, segment_records=SEGMENT_RECORDS):
+        self.directory = directory
+        self.segment_records = segment_records
+        os.makedirs(os.path.join(directory, 'offsets'), exist_ok=True)
+
+    # --- segmenter --------------------------------------------------------
+
+    def segments(self):
+        """[(første seq, sti)] sorteret"""
+        names = sorted(n for n in os.listdir(self.directory)
+                       if n.startswith('segment_') and n.endswith('.jsonl'))
+        return [(int(n[len('segment_'):-len('.jsonl')]), os.path.join(self.directory, n)) for n in names]
+
+    @staticmethod
+    def _read_segment(path):
+        with open(path, 'r') as f:
+            for line in f:
+                if line.endswith('\n'):  # en halvskrevet sidste linje er ikke committet
+                    yield json.loads(line)
+
+    def _tail_of(self, path):
+        """(sidste seq, antal events) i et segment"""
+        last, count = None, 0
+        for event in self._read_segment(path):
+            last, count = event['seq'], count + 1
+        return last, count
+
+    def last_seq(self):
+        for first_seq, path in reversed(self.segments()):
+            last, _ = self._tail_of(path)
+            if last is not None:
+                return last
+        return 0
+
+    # --- skriv ------------------------------------------------------------
+
+    def append(self, changes, run_id):
+        """Læg en changes-tabel fra diff'en i loggen. Returnerer (første, sidste) seq"""
+        if not len(changes):
+            return None
+        events = pd.DataFrame({
+            'run_id': run_id,
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'sku': changes['sku'].astype(str).to_numpy(),
+            'fields': changed_fields(changes).to_numpy(),
+            'priority': changes['priority'].to_numpy() if 'priority' in changes else 0.0,
+        })
+        for column in ('price', 'cost', 'inventory'):
+            events[column] = changes[column].to_numpy()
+        for column in OLD_COLUMNS:
+            events[column] = changes[column].to_numpy() if column in changes else np.nan
+
+        segments = self.segments()
+        last, count = self._tail_of(segments[-1][1]) if segments else (None, 0)
+        first = (last if last is not None else self.last_seq()) + 1
+        events.insert(0, 'seq', np.arange(first, first + len(events)))
+        events = events[EVENT_COLUMNS]
+
+        # Fyld det aktive segment op, start nye efter behov
+        room = max(0, self.segment_records - count) if segments else 0
+        start = 0
+        while start < len(events):
+            if room:
+                path = segments[-1][1]
+                size = room
+            else:
+                path = os.path.join(self.directory, _segment_name(int(events['seq'].iat[start])))
+                size = self.segment_records
+            chunk = events.iloc[start:start + size]
+            with open(path, 'a') as f:
+                f.write(chunk.to_json(orient='records', lines=True, force_ascii=False).rstrip('\n') + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            start += len(chunk)
+            room = 0
+        return first, first + len(events) - 1
+
+    # --- læs --------------------------------------------------------------
+
+    def read(self, after=0, limit=None):
+        """Events med seq > `after`, i rækkefølge"""
+        segments = self.segments()
+        firsts = [first for first, _ in segments]
+        # Første segment der kan indeholde after+1
+        index = max(0, bisect.bisect_right(firsts, after + 1) - 1)
+        count = 0
+        for _, path in segments[index:]:
+            for event in self._read_segment(path):
+                if event['seq'] <= after:
+                    continue
+                yield event
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+    # --- consumer offsets -------------------------------------------------
+
+    def _offset_path(self, consumer):
+        return os.path.join(self.directory, 'offsets', consumer)
+
+    def offset(self, consumer):
+        path = self._offset_path(consumer)
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'r') as f:
+            return int(f.read().strip() or 0)
+
+    def commit(self, consumer, seq):
+        """Gem consumerens offset atomisk (hver consumer har sin egen fil)"""
+        path = self._offset_path(consumer)
+        with open(f"{path}.tmp", 'w') as f:
+            f.write(str(int(seq)))
+        os.replace(f"{path}.tmp", path)
+
+    def poll(self, consumer, limit=None):
+        """Nye events for `consumer` siden sidste commit - committes ikke"""
+        return list(self.read(self.offset(consumer), limit))
+
+    # --- compaction -------------------------------------------------------
+
+    @staticmethod
+    def _merge(earlier, later):
+        """Ét event for to events på samme SKU - intet ændret felt går tabt"""
+        fields = set(filter(None, (earlier['fields'] or '').split(';')))
+        fields.update(filter(None, (later['fields'] or '').split(';')))
+        merged = dict(later)
+        merged['fields'] = ';'.join(field for field in CHANGE_FIELDS if field in fields)
+        merged['priority'] = max(earlier.get('priority') or 0, later.get('priority') or 0)
+        for column in OLD_COLUMNS:
+            merged[column] = earlier.get(column)
+        return merged
+
+    def compact(self):
+        """Slå lukkede segmenter sammen til ét event pr. SKU (se _merge).
+
+        Det aktive (sidste) segment røres ikke. Returnerer (events før, events efter).
+        """
+        segments = self.segments()
+        sealed = segments[:-1]
+        if not sealed:
+            return 0, 0
+        latest = {}
+        before = 0
+        for _, path in sealed:
+            for event in self._read_segment(path):
+                known = latest.get(event['sku'])
+                latest[event['sku']] = event if known is None else self._merge(known, event)
+                before += 1
+        kept = sorted(latest.values(), key=lambda event: event['seq'])
+
+        first_seq = sealed[0][0]
+        tmp_path = os.path.join(self.directory, f"{_segment_name(first_seq)}.compacting")
+        with open(tmp_path, 'w') as f:
+            for event in kept:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        # Det nye segment overtager det første segments navn; resten fjernes bagefter
+        os.replace(tmp_path, sealed[0][1])
+        for _, path in sealed[1:]:
+            os.remove(path)
+        return before, len(kept)
+
+    def status(self):
+        segments = self.segments()
+        offsets = {name: self.offset(name) for name in sorted(os.listdir(os.path.join(self.directory, 'offsets')))
+                   if not name.endswith('.tmp')}
+        return {'segments': len(segments), 'last_seq': self.last_seq(), 'offsets': offsets}
+
+
+def main():
+    log = ChangeLog()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if command == 'status':
+        print(json.dumps(log.status(), indent=2))
+    elif command == 'tail':
+        consumer = sys.argv[2]
+        events = log.poll(consumer)
+        for event in events:
+            print(json.dumps(event, ensure_ascii=False))
+        if events and '--commit' in sys.argv:
+            log.commit(consumer, events[-1]['seq'])
+    elif command == 'compact':
+        before, after = log.compact()
+        print(f"🗜️ Compacted {before} events to {after}")
+    else:
+        sys.exit(f"Unknown command: {command}")
+
+
+if __name__ == "__main__":
+    main()
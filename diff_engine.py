@@ -0,0 +1,197 @@
+"""Kolonnebaseret diff mellem VidaXL feedet og Shopify.
+
+Udsalgspriser beregnes for hele feedet på én gang, feedet joines mod
+Shopify kataloget på SKU, og ændringer findes med boolske masker i
+stedet for en iterrows-løkke.
+"""
+import numpy as np
+import pandas as pd
+from pricing import CATEGORY_COLUMN, PricingRules
+from sku_index import variant_gid
+
+PRICE_MARKUP = 1.60
+TOLERANCE = 0.01
+
+# Matrixify ignorerer ukendte kolonner; updateren bruger dem til at vælge sti
+CHANGED_FIELDS_COLUMN = 'Changed Fields'
+CHANGE_FIELDS = ('price', 'cost', 'stock')
+
+PRIORITY_COLUMN = 'Priority'
+
+MATRIXIFY_COLUMNS = [
+    'Variant SKU', 'Variant Price', 'Variant Cost',
+    'Variant Inventory Qty', 'Variant Command', CHANGED_FIELDS_COLUMN, PRIORITY_COLUMN
+]
+CHANGE_COLUMNS = [
+    'sku', 'price', 'cost', 'inventory',
+    'price_changed', 'cost_changed', 'stock_changed', 'priority'
+]
+# Værdierne før ændringen (NaN for nye SKUs) - til change loggen
+OLD_COLUMNS = ['old_price', 'old_cost', 'old_inventory']
+
+# Forretningsmæssig vægt pr. ændring - updateren sender højeste score først
+PRIORITY_WEIGHTS = {
+    'stock_out': 1000,      # lager går til 0: vi oversælger
+    'below_cost': 800,      # ny kostpris over nuværende udsalgspris: tab pr. salg
+    'back_in_stock': 300,   # lager tilbage: tabt salg indtil opdateret
+    'price_drop': 500,      # fuld vægt ved 100% prisfald
+    'price_rise': 250,
+    'new': 100,             # ingen kendt gammel værdi
+}
+
+
+def retail_prices(b2b_prices, markup=PRICE_MARKUP):
+    """Beregn dansk salgspris for en hel kolonne: markup og rund op til x9.
+
+    Ugyldige B2B-priser giver 0, ligesom den gamle calculate_retail_price.
+    Referencen for standardreglen i pricing.py - feed_frame bruger regelmotoren.
+    """
+    prices = pd.to_numeric(pd.Series(b2b_prices), errors='coerce').to_numpy(dtype='float64')
+    retail = 10 * np.ceil(prices * markup / 10) - 1
+    return np.where(np.isfinite(retail), retail, 0).astype('int64')
+
+
+def priority_scores(price, cost, inventory, old_price, old_inventory, weights=PRIORITY_WEIGHTS):
+    """Vectorized prioritet for ændringer; gamle værdier er NaN for nye SKUs"""
+    price = np.asarray(price, dtype='float64')
+    cost = np.asarray(cost, dtype='float64')
+    inventory = np.asarray(inventory, dtype='float64')
+    old_price = np.asarray(old_price, dtype='float64')
+    old_inventory = np.asarray(old_inventory, dtype='float64')
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stock_out = (inventory <= 0) & (old_inventory > 0)
+        back_in_stock = (inventory > 0) & (old_inventory <= 0)
+        below_cost = (old_price > 0) & (cost >= old_price)
+        relative = np.minimum(1.0, np.abs(price - old_price) / np.maximum(old_price, 1.0))
+    relative = np.nan_to_num(relative)
+
+    score = (
+        weights['stock_out'] * stock_out
+        + weights['below_cost'] * below_cost
+        + weights['back_in_stock'] * back_in_stock
+        + np.where(price < old_price, weights['price_drop'], weights['price_rise']) * relative
+        + weights['new'] * np.isnan(old_price)
+    )
+    return np.round(score, 1)
+
+
+def feed_frame(feed, markup=PRICE_MARKUP, rules=None):
+    """VidaXL feed (SKU, B2B price, Stock) -> sku, price, cost, inventory.
+
+    Udsalgsprisen kommer fra `rules` (pricing.PricingRules), eller den flade
+    `markup` uden regler. Feedet kan indeholde samme SKU flere gange; sidste
+    forekomst vinder.
+    """
+    rules = rules or PricingRules(markup)
+    cost = pd.to_numeric(feed['B2B price'], errors='coerce')
+    skus = feed['SKU'].astype(str).to_numpy()
+    categories = feed[CATEGORY_COLUMN] if CATEGORY_COLUMN in feed else None
+    frame = pd.DataFrame({
+        'sku': skus,
+        'price': rules.price(cost, skus, categories),
+        'cost': cost.to_numpy(dtype='float64'),
+        'inventory': feed['Stock'].to_numpy(dtype='int64'),
+    })
+    duplicated = frame['sku'].duplicated(keep='last').to_numpy()
+    if duplicated.any():
+        frame = frame[~duplicated].reset_index(drop=True)
+    return frame
+
+
+def diff_against_shopify(feed, catalog, markup=PRICE_MARKUP, rules=None):
+    """Find ændringer mellem feedet og Shopify kataloget.
+
+    Feedet joines mod Catalog'et med ét searchsorted-opslag. Returnerer en
+    DataFrame med CHANGE_COLUMNS (+ id og numeriske Shopify IDs) for de SKUs der findes i begge og
+    hvor pris, kostpris eller lager afviger.
+    """
+    current = feed_frame(feed, markup, rules)
+    pos = catalog.positions(current['sku'].to_numpy())
+    found = pos >= 0
+    current = current[found].reset_index(drop=True)
+    pos = pos[found]
+
+    price_changed = np.abs(current['price'].to_numpy() - catalog.price[pos]) > TOLERANCE
+    cost_changed = np.abs(current['cost'].to_numpy() - catalog.cost[pos]) > TOLERANCE
+    stock_changed = current['inventory'].to_numpy() != catalog.inventory[pos]
+
+    current['price_changed'] = price_changed
+    current['cost_changed'] = cost_changed
+    current['stock_changed'] = stock_changed
+    current['priority'] = priority_scores(
+        current['price'], current['cost'], current['inventory'],
+        catalog.price[pos], catalog.inventory[pos]
+    )
+    current['old_price'] = catalog.price[pos]
+    current['old_cost'] = catalog.cost[pos]
+    current['old_inventory'] = catalog.inventory[pos]
+
+    mask = price_changed | cost_changed | stock_changed
+    changes = current.loc[mask, CHANGE_COLUMNS + OLD_COLUMNS].reset_index(drop=True)
+    changes['id'] = [variant_gid(variant_id) for variant_id in catalog.variant_id[pos[mask]].tolist()]
+    for column in ('variant_id', 'product_id', 'inventory_item_id'):
+        changes[column] = getattr(catalog, column)[pos[mask]]
+    return changes
+
+
+def diff_against_previous(current, previous):
+    """Find ændringer siden sidste kørsel.
+
+    `current` er en feed_frame, `previous` er de sidst kendte værdier fra
+    state store'et (sku, price, cost, inventory). Nye SKUs tæller som ændret.
+    """
+    merged = current.merge(
+        previous[['sku', 'price', 'cost', 'inventory']],
+        on='sku', how='left', suffixes=('', '_old')
+    )
+
+    is_new = merged['price_old'].isna()
+    price_changed = (merged['price'] != merged['price_old']) | is_new
+    # Rækker uden kendt kostpris (fx migreret fra last_prices.csv) følger prisen
+    cost_changed = (
+        merged['cost_old'].notna() & ((merged['cost'] - merged['cost_old']).abs() > TOLERANCE)
+    ) | price_changed
+    stock_changed = (merged['inventory'] != merged['inventory_old']) | is_new
+
+    merged['price_changed'] = price_changed
+    merged['cost_changed'] = cost_changed
+    merged['stock_changed'] = stock_changed
+    merged['priority'] = priority_scores(
+        merged['price'], merged['cost'], merged['inventory'],
+        merged['price_old'], merged['inventory_old']
+    )
+
+    merged = merged.rename(columns={
+        'price_old': 'old_price', 'cost_old': 'old_cost', 'inventory_old': 'old_inventory'
+    })
+
+    mask = price_changed | cost_changed | stock_changed
+    return merged.loc[mask, CHANGE_COLUMNS + OLD_COLUMNS].reset_index(drop=True)
+
+
+def changed_fields(changes):
+    """Change-flag kolonnerne som 'price;cost;stock' strenge"""
+    fields = pd.Series('', index=changes.index)
+    for field in CHANGE_FIELDS:
+        flag = f'{field}_changed'
+        if flag in changes:
+            fields = fields + np.where(changes[flag], f'{field};', '')
+        else:
+            fields = fields + f'{field};'
+    return fields.str.rstrip(';')
+
+
+def write_matrixify_csv(changes, path='matrixify_delta_update.csv'):
+    """Skriv en changes-tabel (sku, price, cost, inventory + flags) som Matrixify CSV"""
+    output = pd.DataFrame({
+        'Variant SKU': changes['sku'],
+        'Variant Price': changes['price'],
+        'Variant Cost': changes['cost'],
+        'Variant Inventory Qty': changes['inventory'],
+        'Variant Command': 'UPDATE',
+        CHANGED_FIELDS_COLUMN: changed_fields(changes),
+        PRIORITY_COLUMN: changes['priority'] if 'priority' in changes else 0,
+    }, columns=MATRIXIFY_COLUMNS)
+    output.to_csv(path, index=False)
+    return len(output)
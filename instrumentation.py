@@ -0,0 +1,208 @@
+"""Struktureret instrumentering af sync-kørsler.
+
+Hver kørsel får ét RunMetrics objekt med tider pr. stage (feed download,
+parse, Shopify fetch, diff, CSV write, ID-opslag, mutation batches),
+tællere og klient-statistik (requests, retries, GraphQL cost, bytes).
+Ved afslutning skrives det som JSON lines i reports/ ved siden af de
+eksisterende rapporter, og som Prometheus textfile hvis
+SYNC_PROMETHEUS_FILE er sat.
+
+Biblioteksmoduler kalder de modul-level helpers (stage, observe, count),
+som rammer den aktive kørsel - eller en anonym kørsel der aldrig skrives.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_DIR = 'reports'
+# Fx /var/lib/node_exporter/vidaxl_{job}.prom - {job} udfyldes pr. script
+PROMETHEUS_FILE = os.getenv('SYNC_PROMETHEUS_FILE')
+PROMETHEUS_PREFIX = 'vidaxl_sync'
+
+CLIENT_COUNTERS = (
+    'request_count', 'retry_count', 'cost_consumed', 'cost_requested',
+    'throttle_wait_seconds', 'bytes_sent', 'bytes_received',
+)
+
+
+class RunMetrics:
+    """Stage-tider og tællere for én kørsel af ét script"""
+
+    def __init__(self, job):
+        self.job = job
+        self.run_id = f"{job}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.started = time.time()
+        self.stages = []
+        self.counters = {}
+        self.clients = []
+        self.status = 'ok'
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Tag tid på en blok; kalderen kan tilføje felter til den yieldede record"""
+        record = {'stage': name, **fields}
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record['status'] = 'error'
+            raise
+        finally:
+            record.setdefault('status', 'ok')
+            self.observe(name, time.perf_counter() - start, **record)
+
+    def observe(self, name, seconds, **fields):
+        """Registrer en stage der er timet andetsteds (fx en mutation batch)"""
+        record = {'stage': name, 'seconds': round(seconds, 4), 'at': round(time.time() - self.started, 3)}
+        record.update((k, v) for k, v in fields.items() if k != 'stage')
+        with self._lock:
+            self.stages.append(record)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def fail(self):
+        """Markér kørslen som fejlet uden at rejse (scripts der fanger deres egne fejl)"""
+        self.status = 'error'
+
+    def track_client(self, client):
+        """Tag ShopifyClient'ens tællere med i rapporten"""
+        if client is not None and client not in self.clients:
+            self.clients.append(client)
+
+    def client_metrics(self):
+        totals = {name: 0 for name in CLIENT_COUNTERS}
+        min_available = None
+        for client in self.clients:
+            for name in CLIENT_COUNTERS:
+                totals[name] += getattr(client, name, 0)
+            if client.min_available is not None:
+                min_available = client.min_available if min_available is None \
+                    else min(min_available, client.min_available)
+            totals['cost_available'] = client.maximum_available
+        totals['throttle_wait_seconds'] = round(totals['throttle_wait_seconds'], 3)
+        totals['min_cost_available'] = min_available
+        return totals
+
+    def stage_totals(self):
+        """name -> calls, total og max sekunder"""
+        totals = {}
+        for record in self.stages:
+            entry = totals.setdefault(record['stage'], {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            entry['calls'] += 1
+            entry['seconds'] += record['seconds']
+            entry['max_seconds'] = max(entry['max_seconds'], record['seconds'])
+        for entry in totals.values():
+            entry['seconds'] = round(entry['seconds'], 3)
+        return totals
+
+    def summary(self, status=None):
+        return {
+            'type': 'run',
+            'run_id': self.run_id,
+            'job': self.job,
+            'status': status or self.status,
+            'started': datetime.fromtimestamp(self.started).isoformat(),
+            'elapsed_seconds': round(time.time() - self.started, 3),
+            'stages': self.stage_totals(),
+            'counters': dict(self.counters),
+            'client': self.client_metrics(),
+        }
+
+    def write(self, status=None, directory=METRICS_DIR):
+        """Skriv stage records + run summary som JSON lines"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"metrics_{self.run_id}.jsonl")
+        summary = self.summary(status)
+        with open(path, 'w') as f:
+            for record in self.stages:
+                f.write(json.dumps({'type': 'stage', 'run_id': self.run_id, **record}) + '\n')
+            f.write(json.dumps(summary) + '\n')
+        if PROMETHEUS_FILE:
+            write_prometheus(summary, PROMETHEUS_FILE.format(job=self.job))
+        return path
+
+
+def prometheus_lines(summary):
+    job = summary['job']
+    p = PROMETHEUS_PREFIX
+    lines = [
+        f'{p}_last_run_timestamp_seconds{{job="{job}"}} {time.time():.0f}',
+        f'{p}_run_success{{job="{job}"}} {int(summary["status"] == "ok")}',
+        f'{p}_run_seconds{{job="{job}"}} {summary["elapsed_seconds"]}',
+    ]
+    for name, entry in summary['stages'].items():
+        lines.append(f'{p}_stage_seconds{{job="{job}",stage="{name}"}} {entry["seconds"]}')
+        lines.append(f'{p}_stage_calls{{job="{job}",stage="{name}"}} {entry["calls"]}')
+    for name, value in {**summary['counters'], **summary['client']}.items():
+        if value is not None:
+            lines.append(f'{p}_{name}{{job="{job}"}} {value}')
+    return lines
+
+
+def write_prometheus(summary, path):
+    """Prometheus textfile (node_exporter textfile collector) - skrevet atomisk"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(prometheus_lines(summary)) + '\n')
+    os.replace(tmp_path, path)
+
+
+# --- aktiv kørsel ---------------------------------------------------------
+
+_current = RunMetrics('untracked')
+
+
+def current_run():
+    return _current
+
+
+def start_run(job, *clients):
+    global _current
+    _current = RunMetrics(job)
+    for client in clients:
+        _current.track_client(client)
+    return _current
+
+
+def finish_run(status=None):
+    path = _current.write(status)
+    print(f"📈 Metrics saved to: {path}")
+    return path
+
+
+@contextmanager
+def tracked_run(job, *clients):
+    """Start en kørsel og skriv metrics bagefter - også når den fejler"""
+    metrics = start_run(job, *clients)
+    status = None
+    try:
+        yield metrics
+    except SystemExit as e:
+        status = 'error' if e.code else None
+        raise
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        finish_run(status)
+
+
+def stage(name, **fields):
+    return _current.stage(name, **fields)
+
+
+def observe(name, seconds, **fields):
+    _current.observe(name, seconds, **fields)
+
+
+def count(name, value=1):
+    _current.count(name, value)
@@ -0,0 +1,124 @@
+"""Regelbaseret prisberegning for hele feedet på én gang.
+
+En deklarativ regeltabel (JSON) kompileres til numpy arrays:
+- bånd: markup efter B2B-pris, slået op med searchsorted,
+- kategori: markup pr. feed-kategori (vinder over båndet),
+- SKU: fast udsalgspris eller markup pr. SKU (vinder over alt),
+efterfulgt af afrunding ('x9': op til nærmeste ...9, 'none': hele kroner).
+
+    {
+      "version": "2026-10",
+      "markup": 1.6,
+      "bands": [[0, 2.0], [100, 1.6], [1000, 1.45]],
+      "categories": {"Havemøbler": 1.7},
+      "skus": {"8719883": {"price": 499}, "8718475": {"markup": 1.3}}
+    }
+
+Uden regelfil er reglen den flade markup med x9-afrunding, og resultatet
+er identisk med diff_engine.retail_prices() og den gamle
+calculate_retail_price. Kategori- og SKU-regler regnes kun for de rækker de
+rammer. Regelversionen er et fingerprint af hele tabellen.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+ROUNDING = ('x9', 'none')
+CATEGORY_COLUMN = os.getenv('VIDAXL_CATEGORY_COLUMN', 'Category')
+
+
+def _as_float(values):
+    return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype='float64')
+
+
+def round_prices(raw, rounding='x9'):
+    """Rå udsalgspriser -> int64; ugyldige priser giver 0"""
+    if rounding == 'x9':
+        rounded = 10 * np.ceil(raw / 10) - 1
+    else:
+        rounded = np.ceil(raw)
+    return np.where(np.isfinite(rounded), rounded, 0).astype('int64')
+
+
+class PricingRules:
+    """Kompileret regeltabel"""
+
+    def __init__(self, markup, bands=(), categories=None, skus=None, rounding='x9', version=None):
+        if rounding not in ROUNDING:
+            raise ValueError(f"Unknown rounding '{rounding}', expected one of {ROUNDING}")
+        bands = sorted((float(low), float(band_markup)) for low, band_markup in bands)
+        self.markup = float(markup)
+        self.rounding = rounding
+        self.band_edges = np.array([low for low, _ in bands], dtype='float64')
+        self.band_markups = np.array([band_markup for _, band_markup in bands], dtype='float64')
+        self.categories = {str(name): float(value) for name, value in (categories or {}).items()}
+        skus = skus or {}
+        self.sku_prices = {str(sku): float(rule['price']) for sku, rule in skus.items() if 'price' in rule}
+        self.sku_markups = {str(sku): float(rule['markup']) for sku, rule in skus.items()
+                            if 'markup' in rule and 'price' not in rule}
+        self.version = version or self._fingerprint(
+            self.markup, self.rounding, self.band_edges.tolist(), self.band_markups.tolist(),
+            sorted(self.categories.items()),
+            sorted(self.sku_prices.items()), sorted(self.sku_markups.items())
+        )
+
+    @staticmethod
+    def _fingerprint(*parts):
+        return hashlib.sha1(json.dumps(parts).encode()).hexdigest()[:12]
+
+    # --- bånd -------------------------------------------------------------
+
+    def band_markup(self, b2b):
+        """Markup pr. B2B-pris; under laveste bånd gælder grund-markup'en"""
+        if not len(self.band_edges):
+            return np.full(len(b2b), self.markup)
+        band = np.searchsorted(self.band_edges, b2b, side='right') - 1
+        return np.where(band >= 0, self.band_markups[np.maximum(band, 0)], self.markup)
+
+    def band_prices(self, b2b):
+        """Udsalgspris efter bånd"""
+        return round_prices(b2b * self.band_markup(b2b), self.rounding)
+
+    # --- hele feedet ------------------------------------------------------
+
+    def price(self, b2b, skus=None, categories=None):
+        """Udsalgspriser (int64) for en kolonne af B2B-priser.
+
+        `skus` og `categories` er parallelle kolonner; uden dem gælder kun
+        båndene.
+        """
+        b2b = _as_float(b2b)
+        prices = self.band_prices(b2b)
+
+        if categories is not None and self.categories:
+            markup = pd.Series(categories).astype(str).map(self.categories).to_numpy(dtype='float64')
+            hit = ~np.isnan(markup)
+            prices[hit] = round_prices(b2b[hit] * markup[hit], self.rounding)
+
+        if skus is not None and (self.sku_markups or self.sku_prices):
+            skus = pd.Series(skus).astype(str)
+            markup = skus.map(self.sku_markups).to_numpy(dtype='float64')
+            hit = ~np.isnan(markup)
+            prices[hit] = round_prices(b2b[hit] * markup[hit], self.rounding)
+            fixed = skus.map(self.sku_prices).to_numpy(dtype='float64')
+            hit = ~np.isnan(fixed)
+            prices[hit] = fixed[hit].astype('int64')
+        return prices
+
+
+def load_rules(path=None, markup=None):
+    """Regler fra `path`, eller den flade `markup` hvis der ikke er nogen fil"""
+    if not path or not os.path.exists(path):
+        return PricingRules(markup)
+    with open(path, 'r') as f:
+        table = json.load(f)
+    return PricingRules(
+        table.get('markup', markup),
+        bands=table.get('bands', ()),
+        categories=table.get('categories'),
+        skus=table.get('skus'),
+        rounding=table.get('rounding', 'x9'),
+        version=table.get('version'),
+    )
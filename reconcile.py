@@ -0,0 +1,214 @@
+"""Reconciliation af hele feedet mod Shopify - før der bruges mutation budget.
+
+Feedets SKU-mængde joines mod et Shopify snapshot i ét vectorized
+searchsorted-pass (samme join som diff'en) og deles i:
+
+- feed_only: SKUs i feedet som butikken ikke har,
+- shop_only: varianter i butikken som feedet ikke har,
+- drift: SKUs i begge hvor pris, kostpris eller lager afviger,
+- duplicates: SKUs der optræder flere gange i feedet eller på flere varianter.
+
+Resultatet skrives som RECONCILE_DIR/<tid>/summary.json plus detaljer
+pr. kategori i CSV-partitioner à RECONCILE_PARTITION_ROWS rækker; kun
+summary.json kopieres til reports/reconcile_<tid>.json. Partitionerne er
+for store til git - workflowen gemmer dem som artifact. En
+mapping-fejl (fx 100/100 not_found) ses dermed på få sekunder på tværs af
+alle SKUs. Er match-raten under RECONCILE_MIN_MATCH_RATE, slutter scriptet
+med exit code 1, så en workflow kan stoppe før updateren.
+
+    python reconcile.py
+
+RECONCILE_SNAPSHOT=stored bruger state store'ets snapshot i stedet for at
+hente et nyt; det gemte snapshot har kun én variant pr. SKU, så Shopify
+dubletter kræver et friskt snapshot.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import instrumentation
+from diff_engine import TOLERANCE, feed_frame
+from pricing import load_rules
+from state_store import StateStore
+from sync_config import PRICE_MARKUP, PRICING_RULES_FILE, VIDAXL_URL
+from vidaxl_feed import read_feed
+
+RECONCILE_SNAPSHOT = os.getenv('RECONCILE_SNAPSHOT', 'fresh')
+RECONCILE_DIR = os.getenv('RECONCILE_DIR', 'reconcile')
+RECONCILE_PARTITION_ROWS = int(os.getenv('RECONCILE_PARTITION_ROWS', '50000'))
+RECONCILE_MIN_MATCH_RATE = float(os.getenv('RECONCILE_MIN_MATCH_RATE', '0.5'))
+SAMPLE_SKUS = 20
+DUPLICATE_COLUMNS = ['sku', 'source', 'count', 'dropped_variant_ids']
+
+
+def feed_duplicates(feed):
+    """SKUs der står mere end én gang i feedet, med antal"""
+    skus = feed['SKU'].astype(str)
+    counts = skus[skus.duplicated(keep=False)].value_counts()
+    return pd.DataFrame({'sku': counts.index.to_numpy(), 'source': 'feed',
+                         'count': counts.to_numpy(), 'dropped_variant_ids': ''})
+
+
+def shop_duplicates(catalog):
+    """SKUs på flere varianter i butikken; kataloget beholder højeste variant ID"""
+    if not len(catalog.duplicate_skus):
+        return pd.DataFrame(columns=DUPLICATE_COLUMNS)
+    frame = pd.DataFrame({
+        'sku': np.char.decode(catalog.duplicate_skus, 'utf-8'),
+        'variant_id': catalog.duplicate_variant_ids.astype(str),
+    })
+    grouped = frame.groupby('sku', sort=True)['variant_id']
+    return pd.DataFrame({
+        'sku': grouped.size().index.to_numpy(),
+        'source': 'shop',
+        'count': grouped.size().to_numpy() + 1,
+        'dropped_variant_ids': grouped.agg(';'.join).to_numpy(),
+    })
+
+
+def reconcile(feed, catalog, markup=PRICE_MARKUP, rules=None):
+    """Rå feed + Catalog -> dict af detalje-DataFrames (feed_only, shop_only, drift, duplicates)"""
+    current = feed_frame(feed, markup, rules)
+    pos = catalog.positions(current['sku'].to_numpy())
+    found = pos >= 0
+
+    in_feed = np.zeros(len(catalog), dtype=bool)
+    in_feed[pos[found]] = True
+    shop = catalog.to_frame()
+
+    matched = current[found].reset_index(drop=True)
+    pos = pos[found]
+    price_drift = matched['price'].to_numpy() - catalog.price[pos]
+    cost_drift = matched['cost'].to_numpy() - catalog.cost[pos]
+    stock_drift = matched['inventory'].to_numpy() - catalog.inventory[pos]
+    with np.errstate(invalid='ignore'):
+        drift = pd.DataFrame({
+            'sku': matched['sku'],
+            'variant_id': catalog.variant_id[pos],
+            'feed_price': matched['price'],
+            'shop_price': catalog.price[pos],
+            'price_drift': price_drift,
+            'feed_cost': matched['cost'],
+            'shop_cost': catalog.cost[pos],
+            'cost_drift': cost_drift,
+            'feed_inventory': matched['inventory'],
+            'shop_inventory': catalog.inventory[pos],
+            'stock_drift': stock_drift,
+            'price_changed': np.abs(price_drift) > TOLERANCE,
+            'cost_changed': np.abs(cost_drift) > TOLERANCE,
+            'stock_changed': stock_drift != 0,
+        })
+    drift = drift[drift['price_changed'] | drift['cost_changed'] | drift['stock_changed']]
+
+    return {
+        'feed_only': current[~found].reset_index(drop=True),
+        'shop_only': shop.loc[~in_feed, ['sku', 'variant_id', 'product_id', 'price', 'cost', 'inventory']]
+                         .reset_index(drop=True),
+        'drift': drift.reset_index(drop=True),
+        'duplicates': pd.concat([feed_duplicates(feed), shop_duplicates(catalog)], ignore_index=True),
+    }
+
+
+def summarize(feed, catalog, details):
+    feed_skus = int(feed['SKU'].nunique())
+    matched = feed_skus - len(details['feed_only'])
+    drift = details['drift']
+    duplicates = details['duplicates']
+    return {
+        'feed_rows': len(feed),
+        'feed_skus': feed_skus,
+        'shop_skus': len(catalog),
+        'shop_variants': len(catalog) + len(catalog.duplicate_skus),
+        'matched': matched,
+        'match_rate': round(matched / feed_skus, 4) if feed_skus else 0.0,
+        'feed_only': len(details['feed_only']),
+        'shop_only': len(details['shop_only']),
+        'drift': {
+            'skus': len(drift),
+            'price': int(drift['price_changed'].sum()),
+            'cost': int(drift['cost_changed'].sum()),
+            'stock': int(drift['stock_changed'].sum()),
+            'price_drift_sum': round(float(drift.loc[drift['price_changed'], 'price_drift'].sum()), 2),
+        },
+        'duplicates': {
+            'feed': int((duplicates['source'] == 'feed').sum()),
+            'shop': int((duplicates['source'] == 'shop').sum()),
+        },
+        'samples': {name: frame['sku'].head(SAMPLE_SKUS).tolist() for name, frame in details.items()},
+    }
+
+
+def write_report(summary, details, directory):
+    """summary.json + <kategori>/part-NNN.csv"""
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    for name, frame in details.items():
+        files[name] = []
+        for number, start in enumerate(range(0, len(frame), RECONCILE_PARTITION_ROWS)):
+            path = os.path.join(directory, name, f"part-{number:03d}.csv")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            frame.iloc[start:start + RECONCILE_PARTITION_ROWS].to_csv(path, index=False)
+            files[name].append(os.path.relpath(path, directory))
+    with open(os.path.join(directory, 'summary.json'), 'w') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), **summary, 'files': files}, f, indent=2)
+    return directory
+
+
+def load_catalog(store):
+    if RECONCILE_SNAPSHOT == 'stored':
+        return store.load_snapshot()
+    # Importeres først her - direct kræver access token ved import
+    from sync_vidaxl_direct import fetch_shopify_products
+    return fetch_shopify_products()
+
+
+def main():
+    print(f"🔎 VidaXL/Shopify Reconciliation - {datetime.now()}")
+    with instrumentation.stage('feed_fetch'):
+        feed = read_feed(VIDAXL_URL)
+    print(f"✅ Loaded {len(feed)} feed rows")
+
+    with StateStore() as store, instrumentation.stage('shopify_fetch') as record:
+        catalog = load_catalog(store)
+        record['variants'] = len(catalog)
+    print(f"✅ Loaded {len(catalog)} Shopify SKUs ({RECONCILE_SNAPSHOT} snapshot)")
+
+    started = time.perf_counter()
+    with instrumentation.stage('reconcile', rows=len(feed)):
+        details = reconcile(feed, catalog, PRICE_MARKUP, load_rules(PRICING_RULES_FILE, PRICE_MARKUP))
+        summary = summarize(feed, catalog, details)
+    summary['seconds'] = round(time.perf_counter() - started, 2)
+
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    directory = os.path.join(RECONCILE_DIR, stamp)
+    summary_file = f"reports/reconcile_{stamp}.json"
+    with instrumentation.stage('report_write'):
+        write_report(summary, details, directory)
+        os.makedirs('reports', exist_ok=True)
+        shutil.copyfile(os.path.join(directory, 'summary.json'), summary_file)
+    for name in ('matched', 'feed_only', 'shop_only'):
+        instrumentation.count(f'reconcile_{name}', summary[name])
+    instrumentation.count('reconcile_drift', summary['drift']['skus'])
+
+    print(f"\n📊 RECONCILIATION ({summary['seconds']}s):")
+    print(f"  Feed SKUs: {summary['feed_skus']:,}  Shop SKUs: {summary['shop_skus']:,}")
+    print(f"  Matched: {summary['matched']:,} ({summary['match_rate']:.1%})")
+    print(f"  Feed only: {summary['feed_only']:,}  Shop only: {summary['shop_only']:,}")
+    print(f"  Drift: {summary['drift']['skus']:,} (price {summary['drift']['price']:,}, "
+          f"cost {summary['drift']['cost']:,}, stock {summary['drift']['stock']:,})")
+    print(f"  Duplicates: feed {summary['duplicates']['feed']:,}, shop {summary['duplicates']['shop']:,}")
+    print(f"\n📄 Summary saved to: {summary_file} (details in {directory}/)")
+
+    if summary['match_rate'] < RECONCILE_MIN_MATCH_RATE:
+        print(f"❌ Match rate {summary['match_rate']:.1%} below {RECONCILE_MIN_MATCH_RATE:.0%} "
+              f"- check the SKU mapping before updating")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    with instrumentation.tracked_run('reconcile'):
+        main()
@@ -0,0 +1,196 @@
+"""Shopify Bulk Operations - fuld katalog-snapshot i ét server-side job.
+
+bulkOperationRunQuery starter eksporten, currentBulkOperation polles indtil
+den er færdig, og resultatet (JSONL) streames linje for linje så hele
+kataloget aldrig skal ligge i hukommelsen som ét JSON-svar.
+
+Bulk mutations går samme vej: variablerne skrives som JSONL, uploades via
+stagedUploadsCreate og køres med bulkOperationRunMutation.
+
+Shopify kører kun én bulk query pr. butik ad gangen. Kører en anden
+allerede (fx cache-jobbet), venter run_bulk_query på at den bliver færdig.
+"""
+import os
+import json
+import time
+from shopify_client import ShopifyError, http_session
+
+# Bulk snapshot i stedet for productVariants(first: 250) paging
+SNAPSHOT_MODE = os.getenv('SHOPIFY_SNAPSHOT_MODE', 'paged')
+POLL_INTERVAL = float(os.getenv('SHOPIFY_BULK_POLL_INTERVAL', '5'))
+BULK_TIMEOUT = float(os.getenv('SHOPIFY_BULK_TIMEOUT', '3600'))
+
+RUN_QUERY_MUTATION = """
+mutation runBulkQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation {
+      id
+      status
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+RUN_MUTATION_MUTATION = """
+mutation runBulkMutation($mutation: String!, $stagedUploadPath: String!) {
+  bulkOperationRunMutation(mutation: $mutation, stagedUploadPath: $stagedUploadPath) {
+    bulkOperation {
+      id
+      status
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+STAGED_UPLOAD_MUTATION = """
+mutation stagedUpload($input: [StagedUploadInput!]!) {
+  stagedUploadsCreate(input: $input) {
+    stagedTargets {
+      url
+      resourceUrl
+      parameters {
+        name
+        value
+      }
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+CURRENT_OPERATION_QUERY = """
+query currentOperation($type: BulkOperationType!) {
+  currentBulkOperation(type: $type) {
+    id
+    status
+    errorCode
+    objectCount
+    url
+    partialDataUrl
+  }
+}
+"""
+
+FINISHED_STATUSES = {'COMPLETED', 'FAILED', 'CANCELED', 'EXPIRED'}
+
+
+class BulkOperationError(ShopifyError):
+    pass
+
+
+def use_bulk_snapshot():
+    return SNAPSHOT_MODE == 'bulk'
+
+
+def _in_progress(errors):
+    return any('already in progress' in (error.get('message') or '') for error in errors)
+
+
+def run_bulk_query(client, query):
+    """Start en bulk query og returner operationens ID - venter hvis en anden kører"""
+    started = time.time()
+    while True:
+        data = client.query(RUN_QUERY_MUTATION, {'query': query})
+        result = data['bulkOperationRunQuery']
+        if not result['userErrors']:
+            return result['bulkOperation']['id']
+        if not _in_progress(result['userErrors']) or time.time() - started > BULK_TIMEOUT:
+            raise BulkOperationError(f"Bulk query rejected: {result['userErrors']}")
+        operation = client.query(CURRENT_OPERATION_QUERY, {'type': 'QUERY'})['currentBulkOperation']
+        print(f"  ⏳ Another bulk query is {(operation or {}).get('status')} - waiting for it to finish")
+        time.sleep(POLL_INTERVAL)
+
+
+def wait_for_bulk_operation(client, operation_id, operation_type='QUERY'):
+    """Poll currentBulkOperation indtil den er færdig og returner resultat-URL"""
+    started = time.time()
+    while True:
+        operation = client.query(CURRENT_OPERATION_QUERY, {'type': operation_type})['currentBulkOperation']
+        if not operation or operation['id'] != operation_id:
+            raise BulkOperationError(f"Bulk operation {operation_id} is no longer current")
+
+        if operation['status'] in FINISHED_STATUSES:
+            if operation['status'] != 'COMPLETED':
+                raise BulkOperationError(
+                    f"Bulk operation {operation['status']}: {operation.get('errorCode')}"
+                )
+            print(f"  ✅ Bulk operation completed - {operation['objectCount']} objects")
+            return operation['url']
+
+        if time.time() - started > BULK_TIMEOUT:
+            raise BulkOperationError(f"Bulk operation timed out after {BULK_TIMEOUT}s")
+
+        print(f"  ⏳ Bulk operation {operation['status']} - {operation['objectCount']} objects so far")
+        time.sleep(POLL_INTERVAL)
+
+
+def stream_jsonl(url):
+    """Stream en JSONL resultatfil linje for linje"""
+    if not url:
+        # Shopify returnerer ingen URL når resultatet er tomt
+        return
+    with http_session().get(url, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def bulk_snapshot(client, query):
+    """Kør en bulk query og stream resultatet som dicts"""
+    print("📦 Starting bulk operation snapshot...")
+    operation_id = run_bulk_query(client, query)
+    url = wait_for_bulk_operation(client, operation_id)
+    yield from stream_jsonl(url)
+
+
+def staged_upload(client, path, filename='bulk_op_vars.jsonl'):
+    """Upload en JSONL fil via stagedUploadsCreate og returner stagedUploadPath"""
+    data = client.query(STAGED_UPLOAD_MUTATION, {'input': [{
+        'resource': 'BULK_MUTATION_VARIABLES',
+        'filename': filename,
+        'mimeType': 'text/jsonl',
+        'httpMethod': 'POST'
+    }]})
+    result = data['stagedUploadsCreate']
+    if result['userErrors']:
+        raise BulkOperationError(f"Staged upload rejected: {result['userErrors']}")
+
+    target = result['stagedTargets'][0]
+    params = {p['name']: p['value'] for p in target['parameters']}
+    with open(path, 'rb') as f:
+        response = http_session().post(
+            target['url'],
+            data=params,
+            files={'file': (filename, f, 'text/jsonl')}
+        )
+    response.raise_for_status()
+    return params['key']
+
+
+def run_bulk_mutation(client, mutation, variables_path):
+    """Upload variabler, kør én bulk mutation og stream resultatlinjerne"""
+    print("📦 Uploading bulk mutation variables...")
+    staged_path = staged_upload(client, variables_path)
+
+    data = client.query(RUN_MUTATION_MUTATION, {
+        'mutation': mutation,
+        'stagedUploadPath': staged_path
+    })
+    result = data['bulkOperationRunMutation']
+    if result['userErrors']:
+        raise BulkOperationError(f"Bulk mutation rejected: {result['userErrors']}")
+
+    url = wait_for_bulk_operation(client, result['bulkOperation']['id'], 'MUTATION')
+    yield from stream_jsonl(url)
@@ -0,0 +1,253 @@
+"""Fælles Shopify GraphQL klient.
+
+Én pooled requests.Session pr. butik, flere requests i luften via en
+thread pool, pacing efter `extensions.cost.throttleStatus` i stedet for
+faste sleeps, og retry med backoff på 429/5xx og THROTTLED.
+"""
+import os
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+API_VERSION = '2024-01'
+MAX_WORKERS = int(os.getenv('SHOPIFY_MAX_WORKERS', '4'))
+MAX_RETRIES = int(os.getenv('SHOPIFY_MAX_RETRIES', '5'))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+DEFAULT_QUERY_COST = 10
+
+# Shopify standard plan: 1000 points bucket, 50 points/sekund
+DEFAULT_BUCKET_SIZE = 1000.0
+DEFAULT_RESTORE_RATE = 50.0
+# throttleStatus er bucket'en da Shopify trak prisen, ikke da svaret kom frem -
+# så mange sekunders restore holdes i reserve, før en stor request sendes
+RESERVE_MARGIN_SECONDS = 1.0
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ShopifyError(Exception):
+    pass
+
+
+def graphql_url(store):
+    """GraphQL endpoint - SHOPIFY_API_URL kan pege på en lokal stand-in"""
+    return os.getenv('SHOPIFY_API_URL') or f"https://{store}/admin/api/{API_VERSION}/graphql.json"
+
+
+def _new_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_http_session = None
+
+
+def http_session():
+    """Delt session til almindelige GETs (feed, rå filer)"""
+    global _http_session
+    if _http_session is None:
+        _http_session = _new_session(MAX_WORKERS)
+    return _http_session
+
+
+def _is_throttled(body):
+    return any(
+        (error.get('extensions') or {}).get('code') == 'THROTTLED'
+        for error in body.get('errors') or []
+    )
+
+
+class ShopifyClient:
+    """Rate-limit-aware GraphQL klient for én butik"""
+
+    def __init__(self, store, token, max_workers=MAX_WORKERS, max_retries=MAX_RETRIES):
+        self.store = store
+        self.url = graphql_url(store)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.session = _new_session(max_workers)
+        self.session.headers.update({
+            'X-Shopify-Access-Token': token,
+            'Content-Type': 'application/json'
+        })
+        self._pool = None
+        self._lock = threading.Lock()
+
+        # Throttle state - opdateres fra hvert svar
+        self.maximum_available = DEFAULT_BUCKET_SIZE
+        self.currently_available = DEFAULT_BUCKET_SIZE
+        self.restore_rate = DEFAULT_RESTORE_RATE
+        self._throttle_updated = time.monotonic()
+        self._reserved = 0.0
+        self._query_costs = {}
+
+        # Tællere til rapporter
+        self.request_count = 0
+        self.retry_count = 0
+        self.cost_consumed = 0.0
+        self.cost_requested = 0.0
+        self.min_available = None
+        self.throttle_wait_seconds = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    # --- throttling -------------------------------------------------------
+
+    def _estimated_cost(self, query, default=DEFAULT_QUERY_COST):
+        key = hashlib.md5(query.encode()).hexdigest()
+        return key, self._query_costs.get(key, default)
+
+    def _available_now(self):
+        elapsed = time.monotonic() - self._throttle_updated
+        restored = self.currently_available + elapsed * self.restore_rate
+        return min(self.maximum_available, restored) - self._reserved
+
+    def _reserve(self, cost):
+        """Vent til bucket har plads til `cost` og reserver den"""
+        cost = min(cost, self.maximum_available)
+        while True:
+            with self._lock:
+                margin = min(RESERVE_MARGIN_SECONDS * self.restore_rate, self.maximum_available - cost)
+                available = self._available_now() - margin
+                if available >= cost:
+                    self._reserved += cost
+                    return cost
+                wait = (cost - available) / self.restore_rate
+                self.throttle_wait_seconds += wait
+            time.sleep(wait)
+
+    def _release(self, reserved, key, body):
+        cost = (body.get('extensions') or {}).get('cost') if body else None
+        with self._lock:
+            self._reserved -= reserved
+            if not cost:
+                return
+            if cost.get('requestedQueryCost') is not None:
+                self._query_costs[key] = cost['requestedQueryCost']
+                self.cost_requested += cost['requestedQueryCost']
+            if cost.get('actualQueryCost') is not None:
+                self.cost_consumed += cost['actualQueryCost']
+            status = cost.get('throttleStatus') or {}
+            if status:
+                self.maximum_available = float(status['maximumAvailable'])
+                available = float(status['currentlyAvailable'])
+                if self._reserved > 0:
+                    # Svar kommer ikke i rækkefølge: mens andre requests er i luften kan
+                    # en ældre status vise mere plads end der er - så må den kun trække ned
+                    restored = (time.monotonic() - self._throttle_updated) * float(status['restoreRate'])
+                    available = min(available, self.currently_available + restored)
+                self.currently_available = available
+                if self.min_available is None or self.currently_available < self.min_available:
+                    self.min_available = self.currently_available
+                self.restore_rate = float(status['restoreRate'])
+                self._throttle_updated = time.monotonic()
+
+    def estimated_cost(self, query):
+        """Sidst observerede requestedQueryCost for denne query"""
+        return self._estimated_cost(query)[1]
+
+    def budget_available(self):
+        """Estimeret antal points der er til rådighed lige nu"""
+        with self._lock:
+            return max(0.0, self._available_now())
+
+    # --- requests ---------------------------------------------------------
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+        return delay * (0.5 + random.random() / 2)
+
+    def execute(self, query, variables=None, cost=None):
+        """Send én GraphQL request og returner hele JSON-svaret.
+
+        Retrier 429/5xx, netværksfejl og THROTTLED; rejser ShopifyError
+        hvis svaret stadig fejler efter max_retries forsøg. `cost` er
+        kalderens estimat for en query der ikke er set før.
+        """
+        payload = {'query': query, 'variables': variables or {}}
+
+        for attempt in range(self.max_retries + 1):
+            # Estimatet opdateres af hvert svar - også et THROTTLED svar
+            key, estimate = self._estimated_cost(query, cost or DEFAULT_QUERY_COST)
+            reserved = self._reserve(estimate)
+            response = None
+            body = None
+            try:
+                with self._lock:
+                    self.request_count += 1
+                response = self.session.post(self.url, json=payload, timeout=60)
+                with self._lock:
+                    self.bytes_sent += len(response.request.body or b'')
+                    self.bytes_received += len(response.content)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    if response.status_code != 200:
+                        raise ShopifyError(f"HTTP {response.status_code}: {response.text[:500]}")
+                    body = response.json()
+                    if not _is_throttled(body):
+                        # Selve round trip'en uden ventetid i bucket'en, og antal forsøg
+                        body.setdefault('extensions', {})['client'] = {
+                            'seconds': response.elapsed.total_seconds(), 'attempts': attempt + 1
+                        }
+                        return body
+            except (requests.ConnectionError, requests.Timeout) as e:
+                print(f"⚠️ Network error: {e}")
+            finally:
+                self._release(reserved, key, body)
+
+            if attempt == self.max_retries:
+                break
+            with self._lock:
+                self.retry_count += 1
+            delay = self._backoff(attempt, response)
+            reason = response.status_code if response is not None else 'network'
+            if body is not None:
+                reason = 'THROTTLED'
+            print(f"  🔁 Retry {attempt + 1}/{self.max_retries} in {delay:.1f}s ({reason})")
+            time.sleep(delay)
+
+        raise ShopifyError(f"Request failed after {self.max_retries} retries")
+
+    def query(self, query, variables=None):
+        """Som execute, men returnerer `data` og rejser ShopifyError ved errors"""
+        body = self.execute(query, variables)
+        if body.get('errors'):
+            raise ShopifyError(f"GraphQL errors: {body['errors']}")
+        return body['data']
+
+    def submit(self, query, variables=None, cost=None):
+        """Kør execute i baggrunden - returnerer en Future"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._pool.submit(self.execute, query, variables, cost)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        self.session.close()
+
+
+_clients = {}
+
+
+def shared_client(store, token):
+    """Én klient - og dermed ét rate-limit budget - pr. butik i processen"""
+    key = (store, token)
+    if key not in _clients:
+        _clients[key] = ShopifyClient(store, token)
+    return _clients[key]
@@ -0,0 +1,34 @@
+"""SKU → Shopify ID index: numeriske IDs og GID'er.
+
+Indexet (sku -> (variant_id, product_id, inventory_item_id)) ligger i
+state store'et (StateStore.load_ids), så updateren ikke skal søge
+varianter frem via GraphQL.
+"""
+
+
+def numeric_id(gid):
+    """gid://shopify/ProductVariant/123 -> 123"""
+    if not gid:
+        return 0
+    return int(str(gid).rsplit('/', 1)[-1])
+
+
+def variant_gid(variant_id):
+    return f"gid://shopify/ProductVariant/{variant_id}"
+
+
+def product_gid(product_id):
+    return f"gid://shopify/Product/{product_id}"
+
+
+def inventory_item_gid(inventory_item_id):
+    return f"gid://shopify/InventoryItem/{inventory_item_id}"
+
+
+def index_entry(node):
+    """Byg (variant_id, product_id, inventory_item_id) fra en GraphQL variant node"""
+    return (
+        numeric_id(node.get('id')),
+        numeric_id((node.get('product') or {}).get('id')),
+        numeric_id((node.get('inventoryItem') or {}).get('id')),
+    )
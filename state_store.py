@@ -0,0 +1,317 @@
+"""Lokal SQLite state store.
+
+Holder sidst kendte pris, kostpris og lager pr. SKU samt Shopify IDs, så
+hver kørsel kun skriver de rækker der er ændret i stedet for at omskrive
+last_prices.csv og shop_skus.json i fuld længde.
+
+shop_variants er det sidste Shopify snapshot (pris, kostpris, lager og
+IDs pr. variant), så direct sync kun skal hente varianter ændret siden sidst.
+
+update_journal er updaterens checkpoint: hvilke SKUs der er bekræftet
+opdateret til hvilke værdier for en given input-fil, så en afbrudt kørsel
+kan genoptages uden at sende de samme mutations igen.
+
+pending_changes er change queue'en (se change_queue.py): én ventende
+ændring pr. SKU, inklusive det der ikke nåede ud inden for sidste
+kørsels budget.
+"""
+import sqlite3
+from datetime import datetime
+import pandas as pd
+from catalog import CatalogBuilder, parse_timestamp
+
+STATE_DB = 'sync_state.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sku_state (
+    sku TEXT PRIMARY KEY,
+    price REAL,
+    cost REAL,
+    stock INTEGER,
+    variant_id INTEGER,
+    product_id INTEGER,
+    inventory_item_id INTEGER,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS shop_variants (
+    variant_id INTEGER PRIMARY KEY,
+    sku TEXT,
+    price REAL,
+    cost REAL,
+    inventory INTEGER,
+    updated_at TEXT,
+    product_id INTEGER,
+    inventory_item_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS update_journal (
+    input_hash TEXT,
+    phase TEXT,
+    sku TEXT,
+    value TEXT,
+    variant_id INTEGER,
+    applied_at TEXT,
+    PRIMARY KEY (input_hash, phase, sku)
+);
+CREATE TABLE IF NOT EXISTS pending_changes (
+    sku TEXT PRIMARY KEY,
+    price TEXT,
+    cost TEXT,
+    inventory TEXT,
+    fields TEXT,
+    priority REAL,
+    queued_at TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+# Kolonner tilføjet efter første version - ældre databaser får dem med ALTER TABLE
+SNAPSHOT_ID_COLUMNS = ('product_id', 'inventory_item_id')
+
+
+class StateStore:
+    def __init__(self, path=STATE_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(shop_variants)')}
+        missing = [column for column in SNAPSHOT_ID_COLUMNS if column not in columns]
+        if not missing:
+            return
+        with self.conn:
+            for column in missing:
+                self.conn.execute(f'ALTER TABLE shop_variants ADD COLUMN {column} INTEGER')
+            # Det gemte snapshot har ingen IDs - næste kørsel henter et fuldt
+            self.conn.execute("DELETE FROM meta WHERE key = 'snapshot_full_refresh'")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- meta -------------------------------------------------------------
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO meta (key, value) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                (key, str(value))
+            )
+
+    # --- feed værdier -----------------------------------------------------
+
+    def load_prices(self):
+        """Sidst kendte feed-værdier som DataFrame (sku, price, cost, inventory)"""
+        return pd.read_sql_query(
+            'SELECT sku, price, cost, stock AS inventory FROM sku_state '
+            'WHERE price IS NOT NULL',
+            self.conn
+        )
+
+    def has_prices(self):
+        row = self.conn.execute('SELECT 1 FROM sku_state WHERE price IS NOT NULL LIMIT 1').fetchone()
+        return row is not None
+
+    def upsert_prices(self, changes):
+        """Upsert kun de ændrede rækker (sku, price, cost, inventory)"""
+        now = datetime.now().isoformat()
+        rows = zip(
+            changes['sku'],
+            changes['price'].astype(float),
+            changes['cost'].astype(float),
+            changes['inventory'].astype(int),
+        )
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO sku_state (sku, price, cost, stock, updated_at) '
+                'VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(sku) DO UPDATE SET price = excluded.price, '
+                'cost = excluded.cost, stock = excluded.stock, '
+                'updated_at = excluded.updated_at',
+                ((sku, price, cost, stock, now) for sku, price, cost, stock in rows)
+            )
+        return len(changes)
+
+    # --- Shopify IDs ------------------------------------------------------
+
+    def load_index(self):
+        """sku -> (variant_id, product_id, inventory_item_id)"""
+        rows = self.conn.execute(
+            'SELECT sku, variant_id, product_id, inventory_item_id FROM sku_state '
+            'WHERE variant_id IS NOT NULL'
+        )
+        return {sku: (variant_id, product_id, inventory_item_id)
+                for sku, variant_id, product_id, inventory_item_id in rows}
+
+    def load_ids(self):
+        """sku -> (variant_id, product_id, inventory_item_id) for updateren.
+
+        sku_state fra cache-jobbet, med snapshot'et (opdateret hver direct
+        sync) lagt ovenpå; ved dubletter vinder højeste variant ID.
+        """
+        index = self.load_index()
+        rows = self.conn.execute(
+            'SELECT sku, variant_id, product_id, inventory_item_id FROM shop_variants '
+            'WHERE product_id > 0 AND inventory_item_id > 0 ORDER BY variant_id'
+        )
+        index.update((sku, (variant_id, product_id, inventory_item_id))
+                     for sku, variant_id, product_id, inventory_item_id in rows)
+        return index
+
+    def shop_skus(self):
+        rows = self.conn.execute('SELECT sku FROM sku_state WHERE variant_id IS NOT NULL')
+        return {sku for (sku,) in rows}
+
+    def sync_index(self, index):
+        """Gør de gemte IDs lig `index` - skriver kun forskellene"""
+        current = self.load_index()
+        now = datetime.now().isoformat()
+        changed = [
+            (sku, *ids, now) for sku, ids in index.items()
+            if current.get(sku) != tuple(ids)
+        ]
+        removed = [(now, sku) for sku in current.keys() - index.keys()]
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO sku_state (sku, variant_id, product_id, inventory_item_id, updated_at) '
+                'VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(sku) DO UPDATE SET variant_id = excluded.variant_id, '
+                'product_id = excluded.product_id, '
+                'inventory_item_id = excluded.inventory_item_id, '
+                'updated_at = excluded.updated_at',
+                changed
+            )
+            self.conn.executemany(
+                'UPDATE sku_state SET variant_id = NULL, product_id = NULL, '
+                'inventory_item_id = NULL, updated_at = ? WHERE sku = ?',
+                removed
+            )
+        return len(changed), len(removed)
+
+    # --- Shopify snapshot -------------------------------------------------
+
+    def load_snapshot(self):
+        """Det gemte Shopify snapshot som Catalog"""
+        builder = CatalogBuilder()
+        rows = self.conn.execute(
+            'SELECT variant_id, sku, price, cost, inventory, updated_at, product_id, inventory_item_id '
+            'FROM shop_variants ORDER BY variant_id'
+        )
+        for variant_id, sku, price, cost, inventory, updated_at, product_id, inventory_item_id in rows:
+            builder.add(sku, variant_id=variant_id, product_id=product_id,
+                        inventory_item_id=inventory_item_id, price=price, cost=cost,
+                        inventory=inventory, updated_at=parse_timestamp(updated_at))
+        return builder.build()
+
+    def _write_snapshot(self, catalog):
+        self.conn.executemany(
+            'INSERT INTO shop_variants (variant_id, sku, price, cost, inventory, updated_at, '
+            'product_id, inventory_item_id) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(variant_id) DO UPDATE SET sku = excluded.sku, '
+            'price = excluded.price, cost = excluded.cost, '
+            'inventory = excluded.inventory, updated_at = excluded.updated_at, '
+            'product_id = excluded.product_id, inventory_item_id = excluded.inventory_item_id',
+            catalog.rows()
+        )
+
+    def replace_snapshot(self, catalog):
+        """Fuld refresh - varianter der ikke er med længere forsvinder"""
+        with self.conn:
+            self.conn.execute('DELETE FROM shop_variants')
+            self._write_snapshot(catalog)
+        return len(catalog)
+
+    def merge_snapshot(self, catalog):
+        """Inkrementel refresh - upsert på variant ID, så ændrede SKUs flytter med"""
+        with self.conn:
+            self._write_snapshot(catalog)
+        return len(catalog)
+
+    def confirmed_state(self):
+        """sku -> (price, cost, inventory) som Shopify sidst er set eller bekræftet med"""
+        rows = self.conn.execute(
+            'SELECT sku, price, cost, inventory FROM shop_variants ORDER BY variant_id'
+        )
+        # Ved dubletter vinder højeste variant ID, som i Catalog
+        return {sku: (price, cost, inventory) for sku, price, cost, inventory in rows}
+
+    def confirm_variants(self, phase, entries):
+        """Skriv bekræftede mutations ind i snapshot'et.
+
+        entries er (variant_id, price, cost) for 'variant' og
+        (variant_id, inventory) for 'inventory'. Kun kendte varianter
+        opdateres; nye varianter kommer med næste snapshot.
+        """
+        if phase == 'inventory':
+            sql = 'UPDATE shop_variants SET inventory = ? WHERE variant_id = ?'
+            rows = ((inventory, variant_id) for variant_id, inventory in entries)
+        else:
+            sql = ('UPDATE shop_variants SET price = COALESCE(?, price), '
+                   'cost = COALESCE(?, cost) WHERE variant_id = ?')
+            rows = ((price, cost, variant_id) for variant_id, price, cost in entries)
+        with self.conn:
+            self.conn.executemany(sql, rows)
+
+    # --- update journal ---------------------------------------------------
+
+    def journal_applied(self, input_hash, phase):
+        """sku -> value der allerede er bekræftet for denne input-fil og fase"""
+        rows = self.conn.execute(
+            'SELECT sku, value FROM update_journal WHERE input_hash = ? AND phase = ?',
+            (input_hash, phase)
+        )
+        return dict(rows)
+
+    def journal_record(self, input_hash, phase, entries):
+        """Gem bekræftede (sku, value, variant_id) - committes med det samme"""
+        now = datetime.now().isoformat()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO update_journal (input_hash, phase, sku, value, variant_id, applied_at) '
+                'VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(input_hash, phase, sku) DO UPDATE SET value = excluded.value, '
+                'variant_id = excluded.variant_id, applied_at = excluded.applied_at',
+                ((input_hash, phase, sku, value, variant_id, now) for sku, value, variant_id in entries)
+            )
+
+    def journal_prune(self, input_hash):
+        """Glem journaler for andre input-filer - de beskriver ikke Shopify's nuværende tilstand"""
+        with self.conn:
+            cursor = self.conn.execute('DELETE FROM update_journal WHERE input_hash != ?', (input_hash,))
+        return cursor.rowcount
+
+    # --- change queue -------------------------------------------------------
+
+    def load_pending_changes(self):
+        """Køen: (sku, price, cost, inventory, fields, priority), højeste prioritet først"""
+        return self.conn.execute(
+            'SELECT sku, price, cost, inventory, fields, priority FROM pending_changes '
+            'ORDER BY priority DESC'
+        ).fetchall()
+
+    def replace_pending_changes(self, entries):
+        """Erstat køen med `entries` (sku, price, cost, inventory, fields, priority) i én transaktion"""
+        now = datetime.now().isoformat()
+        with self.conn:
+            self.conn.execute('DELETE FROM pending_changes')
+            self.conn.executemany(
+                'INSERT INTO pending_changes (sku, price, cost, inventory, fields, priority, queued_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((*entry, now) for entry in entries)
+            )
+        return len(entries)
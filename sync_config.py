@@ -0,0 +1,69 @@
+"""Fælles konfiguration for sync-scripts og orchestratoren.
+
+Standardværdierne er den ene butik / det ene feed scripts altid har kørt
+mod; hvert felt kan overskrives med en env variabel. Orchestratoren
+læser en liste af targets fra SYNC_TARGETS_FILE (JSON):
+
+    [
+      {"name": "dk", "store": "b7916a-38.myshopify.com",
+       "location_id": "97768178013", "feed_url": "https://...vidaXL_dk_dropshipping.csv",
+       "markup": 1.6, "rules_file": "pricing_dk.json", "apply": true},
+      {"name": "se", "store": "other.myshopify.com", "token_env": "SHOPIFY_TOKEN_SE",
+       "location_id": "...", "feed_url": "https://...vidaXL_se_dropshipping.csv"}
+    ]
+
+Manglende felter falder tilbage til standardværdierne. Hver butik har
+sit eget access token i env variablen `token_env`.
+"""
+import os
+import json
+from diff_engine import PRICE_MARKUP as DEFAULT_MARKUP
+from pricing import load_rules
+
+SHOPIFY_STORE = os.getenv('SHOPIFY_STORE', 'b7916a-38.myshopify.com')
+TOKEN_ENV = 'SHOPIFY_ACCESS_TOKEN'
+LOCATION_ID = os.getenv('SHOPIFY_LOCATION_ID', '97768178013')
+VIDAXL_URL = os.getenv('VIDAXL_URL', "https://transport.productsup.io/de8254c69e698a08e904/channel/188044/vidaXL_dk_dropshipping.csv")
+PRICE_MARKUP = float(os.getenv('PRICE_MARKUP', DEFAULT_MARKUP))
+# Prisregler (se pricing.py); uden fil gælder PRICE_MARKUP fladt
+PRICING_RULES_FILE = os.getenv('PRICING_RULES_FILE', 'pricing_rules.json')
+
+TARGETS_FILE = os.getenv('SYNC_TARGETS_FILE', 'sync_targets.json')
+
+
+class SyncTarget:
+    """Én (feed, butik, lokation, prisregel) kombination"""
+
+    def __init__(self, name, store=SHOPIFY_STORE, token_env=TOKEN_ENV, location_id=LOCATION_ID,
+                 feed_url=VIDAXL_URL, markup=PRICE_MARKUP, rules_file=PRICING_RULES_FILE, apply=False):
+        self.name = name
+        self.store = store
+        self.token_env = token_env
+        self.location_id = str(location_id)
+        self.feed_url = feed_url
+        self.markup = float(markup)
+        self.rules_file = rules_file
+        self.apply = bool(apply)
+
+    def rules(self):
+        return load_rules(self.rules_file, self.markup)
+
+    @property
+    def token(self):
+        return os.environ[self.token_env]
+
+    def __repr__(self):
+        return f"SyncTarget({self.name!r}, store={self.store!r}, location={self.location_id!r})"
+
+
+def load_targets(path=TARGETS_FILE):
+    """Targets fra config-filen - uden fil er det den ene standard-target"""
+    if not os.path.exists(path):
+        return [SyncTarget('default')]
+    with open(path, 'r') as f:
+        entries = json.load(f)
+    targets = [SyncTarget(**entry) for entry in entries]
+    names = [target.name for target in targets]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate target names in {path}: {names}")
+    return targets
@@ -0,0 +1,198 @@
+"""Daemon mode for direct sync.
+
+Kører fetch/diff(/apply) løkken fra sync_vidaxl_direct.py på et fast
+interval med jitter i én langlivet proces, i stedet for en kold cron-start
+hver time. Feed state og Shopify kataloget (med IDs) bliver i
+hukommelsen mellem cyklerne, så en cyklus kun koster det inkrementelle
+arbejde: en conditional GET på feedet og varianter ændret siden sidst.
+
+En lille HTTP server på 127.0.0.1 svarer på /healthz (JSON, 503 hvis
+sidste vellykkede cyklus er for gammel) og /metrics (Prometheus text).
+
+    SYNC_INTERVAL_SECONDS=3600 SYNC_DAEMON_APPLY=true python sync_daemon.py
+"""
+import os
+import json
+import time
+import random
+import signal
+import threading
+import traceback
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import instrumentation
+import sync_vidaxl_direct as direct
+from state_store import StateStore
+from vidaxl_feed import load_feed_state, save_feed_state
+
+INTERVAL_SECONDS = float(os.getenv('SYNC_INTERVAL_SECONDS', '3600'))
+JITTER_SECONDS = float(os.getenv('SYNC_JITTER_SECONDS', '120'))
+HEALTH_HOST = os.getenv('SYNC_HEALTH_HOST', '127.0.0.1')
+HEALTH_PORT = int(os.getenv('SYNC_HEALTH_PORT', '8787'))
+# Send ændringerne til Shopify i samme cyklus (ellers kun Matrixify CSV)
+APPLY_CHANGES = os.getenv('SYNC_DAEMON_APPLY', 'false').lower() == 'true'
+
+
+class SyncDaemon:
+    """Warm state + schedule for direct sync"""
+
+    def __init__(self, store):
+        self.store = store
+        self.feed_state = load_feed_state()
+        self.catalog = None
+        self.stop_event = threading.Event()
+
+        self.started = time.time()
+        self.cycles = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_cycle = None
+        self.last_success = None
+        self.last_summary = None
+
+    # --- warm state -------------------------------------------------------
+
+    def index(self):
+        """SKU index fra kataloget i hukommelsen - samme IDs som snapshot'et i store'et"""
+        return dict(self.catalog.items())
+
+    # --- cyklus -----------------------------------------------------------
+
+    def cycle(self):
+        print(f"\n🔁 Sync cycle {self.cycles + 1} - {datetime.now()}")
+        metrics = instrumentation.start_run('daemon_cycle', direct.client)
+        status = 'ok'
+        try:
+            changes, new_feed_state, self.catalog = direct.sync_once(
+                self.store, self.feed_state, self.catalog
+            )
+            if changes is not None:
+                if APPLY_CHANGES and len(changes):
+                    self.apply()
+                save_feed_state(new_feed_state)
+                self.feed_state = new_feed_state
+            self.last_success = time.time()
+            self.consecutive_failures = 0
+        except Exception as e:
+            status = 'error'
+            self.failures += 1
+            self.consecutive_failures += 1
+            print(f"❌ Cycle failed: {e}")
+            traceback.print_exc()
+            # Et katalog fra en halv cyklus må ikke genbruges
+            self.catalog = None
+        finally:
+            self.cycles += 1
+            self.last_cycle = time.time()
+            self.last_summary = metrics.summary(status)
+            instrumentation.finish_run(status)
+
+    def apply(self):
+        # Importeres først her - updateren loader dotenv og sin konfiguration ved import
+        import sync_to_shopify_bulk as updater
+        changes = updater.read_changes()
+        with instrumentation.stage('apply', changes=len(changes)):
+            updated, not_found, skipped, deferred = updater.apply_changes(changes, self.store, self.index())
+        instrumentation.count('updated', updated)
+        instrumentation.count('not_found', not_found)
+        instrumentation.count('skipped', skipped)
+        instrumentation.count('deferred', deferred)
+
+    def next_delay(self):
+        return max(0.0, INTERVAL_SECONDS + random.uniform(-JITTER_SECONDS, JITTER_SECONDS))
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.cycle()
+            delay = self.next_delay()
+            print(f"💤 Next cycle in {delay/60:.1f} minutes")
+            self.stop_event.wait(delay)
+        print("👋 Sync daemon stopped")
+
+    def stop(self, *_):
+        self.stop_event.set()
+
+    # --- health -----------------------------------------------------------
+
+    def healthy(self):
+        """Sund hvis sidste vellykkede cyklus er yngre end to intervaller"""
+        reference = self.last_success or self.started
+        return time.time() - reference < 2 * (INTERVAL_SECONDS + JITTER_SECONDS)
+
+    def health(self):
+        return {
+            'status': 'ok' if self.healthy() else 'stale',
+            'uptime_seconds': round(time.time() - self.started),
+            'cycles': self.cycles,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'last_cycle': self.last_cycle and datetime.fromtimestamp(self.last_cycle).isoformat(),
+            'last_success': self.last_success and datetime.fromtimestamp(self.last_success).isoformat(),
+            'catalog_variants': len(self.catalog) if self.catalog is not None else None,
+            'catalog_bytes': self.catalog.nbytes if self.catalog is not None else None,
+        }
+
+    def metrics_text(self):
+        p = instrumentation.PROMETHEUS_PREFIX
+        lines = [
+            f'{p}_daemon_up 1',
+            f'{p}_daemon_healthy {int(self.healthy())}',
+            f'{p}_daemon_cycles_total {self.cycles}',
+            f'{p}_daemon_failures_total {self.failures}',
+            f'{p}_daemon_consecutive_failures {self.consecutive_failures}',
+        ]
+        if self.last_success:
+            lines.append(f'{p}_daemon_last_success_timestamp_seconds {self.last_success:.0f}')
+        if self.catalog is not None:
+            lines.append(f'{p}_daemon_catalog_variants {len(self.catalog)}')
+        if self.last_summary:
+            lines.extend(instrumentation.prometheus_lines(self.last_summary))
+        return '\n'.join(lines) + '\n'
+
+
+def health_handler(daemon):
+    class HealthHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, content_type):
+            body = body.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/healthz':
+                status = 200 if daemon.healthy() else 503
+                self._send(status, json.dumps(daemon.health()), 'application/json')
+            elif self.path == '/metrics':
+                self._send(200, daemon.metrics_text(), 'text/plain; version=0.0.4')
+            else:
+                self._send(404, '', 'text/plain')
+
+    return HealthHandler
+
+
+def main():
+    print(f"🚀 VidaXL Sync Daemon - {datetime.now()}")
+    print(f"📍 Interval: {INTERVAL_SECONDS/60:.0f} min ± {JITTER_SECONDS:.0f}s, apply: {APPLY_CHANGES}")
+
+    with StateStore() as store:
+        daemon = SyncDaemon(store)
+        signal.signal(signal.SIGTERM, daemon.stop)
+        signal.signal(signal.SIGINT, daemon.stop)
+
+        server = ThreadingHTTPServer((HEALTH_HOST, HEALTH_PORT), health_handler(daemon))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"🩺 Health endpoint on http://{HEALTH_HOST}:{server.server_address[1]}/healthz")
+
+        try:
+            daemon.run()
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Config-drevet sync af flere VidaXL feeds og Shopify butikker.
+
+Kører fetch/diff(/apply) for hver target i sync_config.load_targets():
+- hvert distinkt feed hentes og parses én gang (conditional GET pr. URL)
+  og deles med sine targets som en pickle under WORK_DIR,
+- targets shardes pr. butik, og hver butik kører i sin egen proces med sin
+  egen ShopifyClient, så butikkernes rate-limit budgetter er isolerede,
+- targets på samme butik kører efter hinanden i butikkens proces og deler
+  dens budget,
+- hver target har sin egen mappe (WORK_DIR/<name>) med state store, CSV,
+  changeset, SKU index, metrics og log.
+
+Samlet wall time følger den langsomste butik, ikke summen.
+
+    SYNC_TARGETS_FILE=sync_targets.json python sync_orchestrator.py
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import traceback
+import multiprocessing
+from contextlib import redirect_stdout, redirect_stderr
+from datetime import datetime
+import pandas as pd
+import instrumentation
+from vidaxl_feed import concat_chunks, fetch_feed_if_changed, load_feed_state, save_feed_state
+
+WORK_DIR = os.path.abspath(os.getenv('SYNC_WORK_DIR', 'targets'))
+FEED_STATES_FILE = os.path.join(WORK_DIR, 'feed_states.json')
+MAX_PROCESSES = int(os.getenv('SYNC_MAX_PROCESSES', '4'))
+
+
+def feed_path(url):
+    return os.path.join(WORK_DIR, 'feeds', f"{hashlib.sha1(url.encode()).hexdigest()[:12]}.pkl")
+
+
+def fetch_feeds(targets, states):
+    """Hent hvert feed én gang. Returnerer (url -> (pickle, new_state), targets der skal køre).
+
+    Et uændret feed springes over - medmindre en target endnu ikke har
+    synket den nuværende version (ny target, eller fejl sidste gang).
+    """
+    by_url = {}
+    for target in targets:
+        by_url.setdefault(target.feed_url, []).append(target)
+
+    feeds, due = {}, []
+    for url, url_targets in by_url.items():
+        known = states['feeds'].get(url, {})
+        behind = [t for t in url_targets if states['targets'].get(t.name) != known.get('sha256')]
+        print(f"📥 Fetching feed for {', '.join(t.name for t in url_targets)}")
+        with instrumentation.stage('feed_fetch', url=url):
+            chunks, new_state = fetch_feed_if_changed(url, {} if behind else known)
+        if chunks is None:
+            print("  ✅ Feed unchanged - skipping its targets")
+            continue
+        feed = concat_chunks(chunks)
+        feed.to_pickle(feed_path(url))
+        print(f"  ✅ {len(feed)} rows shared with {len(url_targets)} targets")
+        feeds[url] = (feed_path(url), new_state)
+        due.extend(t for t in url_targets if states['targets'].get(t.name) != new_state['sha256'])
+    return feeds, due
+
+
+def run_target(target, feed_file):
+    """fetch/diff(/apply) for én target - i butikkens proces, med cwd i target-mappen"""
+    import sync_vidaxl_direct as direct
+    from state_store import StateStore
+
+    result = {'target': target.name, 'store': target.store, 'status': 'ok'}
+    with instrumentation.tracked_run(f"target_{target.name}", direct.client):
+        feed = pd.read_pickle(feed_file)
+        with StateStore() as store:
+            changes, _ = direct.sync_feed(store, feed, markup=target.markup, rules=target.rules())
+            result['changes'] = len(changes)
+            if target.apply and len(changes):
+                import sync_to_shopify_bulk as updater
+                updated, not_found, skipped, deferred = updater.apply_changes(
+                    updater.read_changes(), store, location_id=target.location_id
+                )
+                result.update(updated=updated, not_found=not_found, skipped=skipped, deferred=deferred)
+    return result
+
+
+def run_shard(store, entries, feeds):
+    """Alle targets for én butik, i en frisk proces pr. butik (spawn, maxtasksperchild=1).
+
+    Targets kommer som dicts og sync-modulerne importeres først her, efter
+    butikkens env er sat - så deres modul-level config og klient er
+    butikkens egne.
+    """
+    os.environ['SHOPIFY_STORE'] = store
+    os.environ['SHOPIFY_ACCESS_TOKEN'] = os.environ[entries[0]['token_env']]
+    from sync_config import SyncTarget
+    targets = [SyncTarget(**entry) for entry in entries]
+
+    results = []
+    for target in targets:
+        workdir = os.path.join(WORK_DIR, target.name)
+        os.makedirs(workdir, exist_ok=True)
+        os.chdir(workdir)
+        started = time.time()
+        with open('sync.log', 'a') as log, redirect_stdout(log), redirect_stderr(log):
+            print(f"\n🚀 {target!r} - {datetime.now()}")
+            feed_file, feed_state = feeds[target.feed_url]
+            try:
+                result = run_target(target, feed_file)
+            except Exception as e:
+                traceback.print_exc()
+                result = {'target': target.name, 'store': store, 'status': 'error', 'error': str(e)}
+        # Kun en vellykket target markeres som synket med denne feed-version
+        result['feed_sha256'] = feed_state['sha256'] if result['status'] == 'ok' else None
+        result['seconds'] = round(time.time() - started, 1)
+        results.append(result)
+    return results
+
+
+def main():
+    from sync_config import load_targets
+    print(f"🚀 VidaXL Sync Orchestrator - {datetime.now()}")
+    targets = load_targets()
+    for target in targets:
+        # Workers kører med cwd i target-mappen
+        target.rules_file = target.rules_file and os.path.abspath(target.rules_file)
+    os.makedirs(os.path.join(WORK_DIR, 'feeds'), exist_ok=True)
+    states = {'feeds': {}, 'targets': {}, **load_feed_state(FEED_STATES_FILE)}
+
+    feeds, due = fetch_feeds(targets, states)
+    if not due:
+        print("✅ All targets up to date")
+        return
+
+    shards = {}
+    for target in due:
+        shards.setdefault(target.store, []).append(vars(target))
+    print(f"🧩 {len(due)} targets on {len(shards)} stores, {min(MAX_PROCESSES, len(shards))} processes")
+
+    # spawn: hver butik får en ren interpreter, så modul-level klient og config er dens egne
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(min(MAX_PROCESSES, len(shards)), maxtasksperchild=1) as pool:
+        jobs = {store: pool.apply_async(run_shard, (store, shard, feeds)) for store, shard in shards.items()}
+        results = []
+        for store, job in jobs.items():
+            try:
+                results.extend(job.get())
+            except Exception as e:
+                # Fx manglende token - butikkens targets fejler, de andre kører videre
+                print(f"❌ Store {store} failed: {e}")
+                results.extend({'target': entry['name'], 'store': store, 'status': 'error',
+                                'error': str(e), 'feed_sha256': None, 'seconds': 0}
+                               for entry in shards[store])
+
+    for url, (_, state) in feeds.items():
+        states['feeds'][url] = state
+    for result in results:
+        if result['feed_sha256']:
+            states['targets'][result['target']] = result['feed_sha256']
+    save_feed_state(states, FEED_STATES_FILE)
+
+    print(f"\n{'target':<16}{'store':<32}{'status':<8}{'changes':>9}{'updated':>9}{'seconds':>9}")
+    for r in results:
+        print(f"{r['target']:<16}{r['store']:<32}{r['status']:<8}{r.get('changes', 0):>9}"
+              f"{r.get('updated', 0):>9}{r['seconds']:>9}")
+    failed = [r for r in results if r['status'] != 'ok']
+    instrumentation.count('targets', len(results))
+    instrumentation.count('targets_failed', len(failed))
+
+    os.makedirs('reports', exist_ok=True)
+    report_file = f"reports/orchestrator_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(report_file, 'w') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), 'targets': results}, f, indent=2)
+    print(f"\n📄 Report saved to: {report_file}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    with instrumentation.tracked_run('orchestrator'):
+        main()
@@ -1,25 +1,57 @@
 import os
 import csv
 import time
-import requests
+import hashlib
+import math
+import tempfile
 import json
 from datetime import datetime
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
 from dotenv import load_dotenv
+import instrumentation
+from sku_index import index_entry, inventory_item_gid, product_gid, variant_gid
+from diff_engine import CHANGE_FIELDS, CHANGED_FIELDS_COLUMN, PRIORITY_COLUMN
+from changelog import ChangeLog
+from changeset import CHANGESET_FILE, read_changeset
+from change_queue import ChangeQueue, coalesce, parse_changed_fields, queue_entries
+from shopify_bulk import run_bulk_mutation
+from shopify_client import shared_client, ShopifyError
+from state_store import StateStore
+from sync_config import LOCATION_ID, SHOPIFY_STORE, TOKEN_ENV
 
 load_dotenv()
 
 # Config
-SHOPIFY_STORE = "b7916a-38.myshopify.com"
-SHOPIFY_TOKEN = os.getenv('SHOPIFY_ACCESS_TOKEN')
-LOCATION_ID = "97768178013"
-BATCH_SIZE = 100
-TEST_MODE = True  # Set to False for full run
+SHOPIFY_TOKEN = os.getenv(TOKEN_ENV)
+BATCH_SIZE = 100  # startstørrelse - BatchSizer tilpasser den undervejs
+INVENTORY_BATCH_SIZE = 250  # inventorySetQuantities takes up to 250 quantities
+MIN_BATCH_SIZE = 10
+MAX_BATCH_SIZE = 250  # productVariantsBulkUpdate og inventorySetQuantities tager højst 250
+MAX_REQUEST_COST = 1000  # Shopify's grænse for én query
+TARGET_BATCH_LATENCY = float(os.getenv('TARGET_BATCH_LATENCY_SECONDS', '5'))
+USER_ERROR_SHRINK_RATE = 0.1  # andel af en batch med userErrors der får den til at skrumpe
+TEST_MODE = os.getenv('TEST_MODE', 'true').lower() == 'true'  # Set to false for full run
+BULK_MUTATION_THRESHOLD = int(os.getenv('BULK_MUTATION_THRESHOLD', '5000'))
+CHANGES_FILE = 'matrixify_delta_update.csv'
+# 'changeset': seneste diff (.npy/CSV); 'changelog': alle nye events siden updaterens offset
+CHANGES_SOURCE = os.getenv('UPDATER_SOURCE', 'changeset')
+CHANGELOG_CONSUMER = 'updater'
+JOURNAL_FLUSH_RECORDS = 1000  # bulk mode: checkpoint hver N resultat-linjer
+# Budget pr. kørsel (0 = ingen grænse) - resten gemmes til næste kørsel
+UPDATE_TIME_BUDGET_SECONDS = float(os.getenv('UPDATE_TIME_BUDGET_SECONDS', '0'))
+UPDATE_COST_BUDGET = float(os.getenv('UPDATE_COST_BUDGET', '0'))
+# Felter hver fase sender
+PHASE_FIELDS = {'variant': ('price', 'cost'), 'inventory': ('stock',)}
+
+client = shared_client(SHOPIFY_STORE, SHOPIFY_TOKEN)
 
 def read_csv_changes():
     """Read changes from CSV file"""
     changes = []
     try:
-        with open('matrixify_delta_update.csv', 'r') as f:
+        with open(CHANGES_FILE, 'r') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 if row.get('Variant SKU'):
@@ -27,7 +59,9 @@ def read_csv_changes():
                         'sku': row['Variant SKU'],
                         'price': row['Variant Price'],
                         'cost': row['Variant Cost'],
-                        'inventory': row['Variant Inventory Qty']
+                        'inventory': row['Variant Inventory Qty'],
+                        'changes': parse_changed_fields(row.get(CHANGED_FIELDS_COLUMN)),
+                        'priority': float(row.get(PRIORITY_COLUMN) or 0)
                     })
         print(f"📁 Loaded {len(changes)} changes from CSV")
         return changes
@@ -35,136 +69,770 @@ def read_csv_changes():
         print(f"❌ Error reading CSV: {e}")
         return []
 
-def find_and_update_smart(changes):
-    """Smart update: Find variants and update in same batch"""
-    total_updated = 0
-    total_not_found = 0
-    update_log = []  # Log for rapport
+def read_changes():
+    """Læs det binære changeset fra diff'en; CSV'en er fallback for ældre diffs"""
+    if not os.path.exists(CHANGESET_FILE):
+        return read_csv_changes()
+    try:
+        changes = read_changeset(CHANGESET_FILE)
+    except Exception as e:
+        print(f"❌ Error reading {CHANGESET_FILE}: {e}")
+        return read_csv_changes()
+    print(f"📁 Loaded {len(changes)} changes from {CHANGESET_FILE}")
+    return changes
+
+def event_value(value):
+    return 'nan' if value is None else str(float(value))
+
+def read_changelog_changes(log):
+    """Nye events i change loggen siden updaterens offset -> (changes, sidste seq).
+
+    Flere events for samme SKU slås sammen af køen/coalesce i apply_changes.
+    """
+    events = log.poll(CHANGELOG_CONSUMER)
+    changes = [
+        {
+            'sku': event['sku'],
+            'price': event_value(event['price']),
+            'cost': event_value(event['cost']),
+            'inventory': str(int(event['inventory'] or 0)),
+            'changes': parse_changed_fields(event['fields']),
+            'priority': float(event.get('priority') or 0)
+        }
+        for event in events
+    ]
+    last_seq = events[-1]['seq'] if events else None
+    print(f"📁 Loaded {len(changes)} events from the change log (after seq {log.offset(CHANGELOG_CONSUMER)})")
+    return changes, last_seq
+
+def seed_index(sku_index, changes):
+    """Tilføj IDs diff'en allerede kendte for SKUs indexet mangler - sparer søgninger"""
+    seeded = 0
+    for change in changes:
+        ids = change.get('ids')
+        if ids and change['sku'] not in sku_index:
+            sku_index[change['sku']] = ids
+            seeded += 1
+    if seeded:
+        print(f"📇 Added {seeded} SKUs to the index from the changeset")
+
+def _finite(value):
+    try:
+        return math.isfinite(float(value))
+    except (TypeError, ValueError):
+        return False
+
+def drop_unknown_values(changes):
+    """Slå price/cost fra hvor målværdien ikke er et tal (fx 'nan' fra en manglende B2B pris)"""
+    known = []
+    for change in changes:
+        flags = change['changes']
+        unknown = [field for field in ('price', 'cost') if flags[field] and not _finite(change[field])]
+        if unknown:
+            change = {**change, 'changes': {**flags, **{field: False for field in unknown}}}
+        if any(change['changes'].values()):
+            known.append(change)
+    dropped = len(changes) - len(known)
+    if dropped:
+        print(f"⚠️ Skipped {dropped} changes without a usable price/cost")
+    return known
+
+def prioritize(changes):
+    """Højeste prioritet først; stabil, så filrækkefølgen afgør ved lighed"""
+    return sorted(changes, key=lambda c: -c.get('priority', 0))
+
+SEARCH_VARIANTS_QUERY = """
+query findVariants($first: Int!, $query: String!) {
+  productVariants(first: $first, query: $query) {
+    edges {
+      node {
+        id
+        sku
+        product {
+          id
+        }
+        inventoryItem {
+          id
+        }
+      }
+    }
+  }
+}
+"""
+
+def search_term(sku):
+    """SKU som quoted term i Shopify's search syntax - backslash og " escapes"""
+    return '"%s"' % str(sku).replace('\\', '\\\\').replace('"', '\\"')
+
+def search_variants(skus):
+    """Fallback: find variants by SKU search for SKUs missing in the index"""
+    # Search string goes in as a variable - inline quotes broke the GraphQL document
+    variables = {'first': len(skus), 'query': f"sku:({' OR '.join(map(search_term, skus))})"}
     
-    # Process in batches
-    for i in range(0, len(changes), BATCH_SIZE):
-        batch = changes[i:i+BATCH_SIZE]
-        print(f"\n🔄 Processing batch {i//BATCH_SIZE + 1}/{(len(changes)-1)//BATCH_SIZE + 1}")
+    found = {}
+    started = time.perf_counter()
+    try:
+        # query rejser ShopifyError ved errors - også når data er null
+        data = client.query(SEARCH_VARIANTS_QUERY, variables)
+    except ShopifyError as e:
+        print(f"❌ SKU search failed: {e}")
+        instrumentation.observe('id_resolution', time.perf_counter() - started,
+                                skus=len(skus), found=0, status='error')
+        return found
+    
+    if data and data['productVariants']:
+        for edge in data['productVariants']['edges']:
+            node = edge['node']
+            found[node['sku']] = index_entry(node)
+    
+    instrumentation.observe('id_resolution', time.perf_counter() - started,
+                            skus=len(skus), found=len(found), status='ok')
+    return found
+
+# Én aliased productVariantsBulkUpdate pr. produkt i batchen
+PRODUCT_UPDATE_FIELD = """
+  p%(n)d: productVariantsBulkUpdate(productId: $productId%(n)d, variants: $variants%(n)d) {
+    productVariants {
+      id
+    }
+    userErrors {
+      field
+      message
+    }
+  }"""
+
+def bulk_update_mutation(products):
+    """Mutation med `products` aliased productVariantsBulkUpdate felter (p0, p1, ...)"""
+    arguments = ', '.join(f"$productId{n}: ID!, $variants{n}: [ProductVariantsBulkInput!]!"
+                          for n in range(products))
+    fields = ''.join(PRODUCT_UPDATE_FIELD % {'n': n} for n in range(products))
+    return f"mutation bulkUpdate({arguments}) {{{fields}\n}}\n"
+
+INVENTORY_SET_MUTATION = """
+mutation setQuantities($input: InventorySetQuantitiesInput!) {
+  inventorySetQuantities(input: $input) {
+    inventoryAdjustmentGroup {
+      id
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+def variant_input(change, sku_index):
+    """ProductVariantsBulkInput - only the fields that actually changed"""
+    variant = {"id": variant_gid(sku_index[change['sku']][0])}
+    if change['changes']['price']:
+        variant['price'] = change['price']
+    if change['changes']['cost']:
+        # Kostpris ligger på inventory item'et, ikke på varianten
+        variant['inventoryItem'] = {"cost": change['cost']}
+    return variant
+
+def group_by_product(changes, sku_index):
+    """Samme produkts varianter efter hinanden, ordnet efter gruppens højeste prioritet.
+    
+    Returnerer (changes, keys) - keys er produkt ID'et (eller SKU'en hvis
+    produktet ikke kendes endnu), så batches kan skæres mellem produkter.
+    """
+    groups = {}
+    for change in changes:
+        entry = sku_index.get(change['sku'])
+        key = entry[1] if entry and entry[1] else change['sku']
+        groups.setdefault(key, []).append(change)
+    ordered = [(key, change) for key, group in groups.items() for change in group]
+    return [change for _, change in ordered], [key for key, _ in ordered]
+
+def variant_update_request(batch, sku_index):
+    """Aliased productVariantsBulkUpdate pr. produkt for the price/cost changes in a batch.
+    
+    Returnerer (query, variables, parts); hver part er (result key, changes).
+    """
+    products = {}
+    for change in batch:
+        if change['sku'] in sku_index:
+            products.setdefault(sku_index[change['sku']][1], []).append(change)
+    variables, parts = {}, []
+    for n, (product_id, product_changes) in enumerate(products.items()):
+        variables[f'productId{n}'] = product_gid(product_id)
+        variables[f'variants{n}'] = [variant_input(change, sku_index) for change in product_changes]
+        parts.append((f'p{n}', product_changes))
+    return bulk_update_mutation(len(parts)), variables, parts
+
+def inventory_request(batch, sku_index, location_id=LOCATION_ID):
+    """inventorySetQuantities input keyed by inventory item ID"""
+    sent = [change for change in batch if change['sku'] in sku_index]
+    quantities = [{
+        "inventoryItemId": inventory_item_gid(sku_index[change['sku']][2]),
+        "locationId": f"gid://shopify/Location/{location_id}",
+        "quantity": int(change['inventory'])
+    } for change in sent]
+    variables = {'input': {
+        "name": "available",
+        "reason": "correction",
+        "ignoreCompareQuantity": True,
+        "quantities": quantities
+    }}
+    return INVENTORY_SET_MUTATION, variables, [('inventorySetQuantities', sent)]
+
+def changes_sha256(changes):
+    """Identificerer det drænede sæt changes i update journalen"""
+    digest = hashlib.sha256()
+    for entry in sorted(queue_entries(changes)):
+        digest.update(repr(entry).encode())
+    return digest.hexdigest()
+
+def change_value(phase, change):
+    """Kanonisk målværdi for journalen - de felter mutationen faktisk sender"""
+    if phase == 'inventory':
+        return f"inventory={int(change['inventory'])}"
+    return ';'.join(f"{field}={change[field]}" for field in ('price', 'cost') if change['changes'][field])
+
+def confirmed_values(phase, changes, sku_index):
+    """(variant_id, værdier...) for de felter fasen sendte - None for felter der ikke blev sendt"""
+    if phase == 'inventory':
+        return [(sku_index[c['sku']][0], int(c['inventory'])) for c in changes if c['sku'] in sku_index]
+    return [
+        (sku_index[c['sku']][0],
+         float(c['price']) if c['changes']['price'] else None,
+         float(c['cost']) if c['changes']['cost'] else None)
+        for c in changes if c['sku'] in sku_index
+    ]
+
+class UpdateJournal:
+    """Checkpoint journal for ét sæt changes, gemt i state store'et.
+    
+    Bekræftelser skrives også ind i Shopify snapshot'et, så køen kan
+    droppe ændringer der allerede står i butikken.
+    """
+    
+    def __init__(self, store, input_hash):
+        self.store = store
+        self.input_hash = input_hash
+    
+    def applied(self, phase):
+        return self.store.journal_applied(self.input_hash, phase)
+    
+    def record(self, phase, changes, sku_index):
+        entries = [(c['sku'], change_value(phase, c), sku_index[c['sku']][0])
+                   for c in changes if c['sku'] in sku_index]
+        if entries:
+            self.store.journal_record(self.input_hash, phase, entries)
+            self.store.confirm_variants(phase, confirmed_values(phase, changes, sku_index))
+
+def max_in_flight(cost):
+    """How many batches of `cost` points the current budget allows in flight"""
+    cost = max(cost, 1)
+    return max(1, min(client.max_workers, int(client.budget_available() // cost)))
+
+class BatchSizer:
+    """Batch size for one phase, adjusted after every response.
+    
+    Grows 25% when the bucket is at least half full and the response came
+    back within TARGET_BATCH_LATENCY; halves on throttling, transport errors
+    or a userErrors rate above USER_ERROR_SHRINK_RATE; shrinks 25% when
+    latency is over target. The ceiling is what one request may cost
+    (MAX_REQUEST_COST, the bucket size) at the observed cost per change.
+    """
+    
+    def __init__(self, label, size, maximum=MAX_BATCH_SIZE, minimum=MIN_BATCH_SIZE):
+        self.label = label
+        self.size = float(size)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cost_per_change = None
+        self.cost_per_part = None  # pr. aliased felt - mutationer koster pr. felt, ikke pr. variant
+        self.sizes = []
+    
+    def limit(self):
+        if not self.cost_per_change:
+            return self.maximum
+        request_cost = min(MAX_REQUEST_COST, client.maximum_available)
+        return max(self.minimum, min(self.maximum, int(request_cost // self.cost_per_change)))
+    
+    def next_size(self):
+        size = int(max(self.minimum, min(self.size, self.limit())))
+        self.sizes.append(size)
+        return size
+    
+    def estimated_cost(self, parts, query):
+        if self.cost_per_part:
+            return self.cost_per_part * parts
+        return client.estimated_cost(query)
+    
+    def observe(self, count, parts, planned, latency, body=None, failed=False, error_rate=0.0):
+        """Update the size from one finished batch of `count` changes in `parts` fields (planned as `planned`)"""
+        extensions = (body or {}).get('extensions') or {}
+        cost = extensions.get('cost') or {}
+        request = extensions.get('client') or {}
+        if cost.get('requestedQueryCost') and count:
+            observed = cost['requestedQueryCost'] / count
+            self.cost_per_change = observed if self.cost_per_change is None \
+                else 0.7 * self.cost_per_change + 0.3 * observed
+            self.cost_per_part = cost['requestedQueryCost'] / parts
+        # Server latency without the client's pacing; a retried request was throttled
+        latency = request.get('seconds', latency)
+        throttled = request.get('attempts', 1) > 1
         
-        # Build SKU list for find query
-        sku_list = [f'"{change["sku"]}"' for change in batch]
+        before = int(self.size)
+        if failed or throttled or error_rate > USER_ERROR_SHRINK_RATE:
+            self.size *= 0.5
+        elif latency > TARGET_BATCH_LATENCY:
+            self.size *= 0.75
+        elif count >= 0.9 * planned and client.budget_available() >= client.maximum_available / 2:
+            self.size *= 1.25
+        self.size = max(self.minimum, min(self.size, self.limit()))
+        if int(self.size) != before:
+            print(f"  📐 {self.label} batch size {before} → {int(self.size)}")
+
+class UpdateRun:
+    """Counters and update log shared by the update phases of one run"""
+    
+    def __init__(self, sku_index, journal=None):
+        self.sku_index = sku_index
+        self.journal = journal
+        self.updated_skus = set()
+        self.skipped_skus = set()
+        self.not_found = 0
+        self.searched = 0
+        self.latencies = []
+        self.update_log = []  # Log for rapport
+        self._logged = set()
+        self.deferred = {}  # sku -> change med de felter der ikke nåede ud
+        self.started = time.time()
+        self.cost_at_start = client.cost_consumed
+    
+    @property
+    def updated(self):
+        return len(self.updated_skus)
+    
+    def pending(self, phase, changes):
+        """Spring changes over som journalen allerede har bekræftet med samme værdi"""
+        if self.journal is None or not changes:
+            return changes
+        applied = self.journal.applied(phase)
+        todo = [c for c in changes if applied.get(c['sku']) != change_value(phase, c)]
+        if len(todo) < len(changes):
+            done = [c['sku'] for c in changes if applied.get(c['sku']) == change_value(phase, c)]
+            self.skipped_skus.update(done)
+            print(f"⏭️ {phase}: skipping {len(changes) - len(todo)} changes already applied")
+        return todo
+    
+    def checkpoint(self, phase, changes):
+        if self.journal is not None:
+            self.journal.record(phase, changes, self.sku_index)
+    
+    def over_budget(self):
+        if UPDATE_TIME_BUDGET_SECONDS and time.time() - self.started >= UPDATE_TIME_BUDGET_SECONDS:
+            return True
+        return bool(UPDATE_COST_BUDGET) and client.cost_consumed - self.cost_at_start >= UPDATE_COST_BUDGET
+    
+    def defer(self, phase, changes):
+        """Gem fasens felter til næste kørsel"""
+        for change in changes:
+            entry = self.deferred.setdefault(
+                change['sku'], {**change, 'changes': dict.fromkeys(CHANGE_FIELDS, False)}
+            )
+            for field in PHASE_FIELDS[phase]:
+                entry['changes'][field] = entry['changes'][field] or change['changes'][field]
+    
+    def plan(self, label, changes, batch_size, build_request, group=None):
+        """Fasens ventende changes, højeste prioritet først, og dens BatchSizer.
         
-        # Find variants by SKU
-        find_query = f"""
-        {{
-          productVariants(first: {len(batch)}, query: "sku:({' OR '.join(sku_list)})") {{
-            edges {{
-              node {{
-                id
-                sku
-              }}
-            }}
-          }}
-        }}
+        Batches skæres først i pipeline(), med den størrelse sizeren er nået
+        til. `group` giver (changes, keys) så en batch ikke deler en gruppe
+        (fx et produkts varianter) når det kan undgås.
         """
+        changes = prioritize(self.pending(label, changes))
+        keys = None
+        if group is not None:
+            changes, keys = group(changes, self.sku_index)
+        return {'label': label, 'changes': changes, 'keys': keys, 'next': 0, 'batches': 0,
+                'build_request': build_request, 'sizer': BatchSizer(label, batch_size)}
+    
+    def next_batch(self, plans):
+        """Næste batch fra den fase hvis næste change har højest prioritet.
         
-        response = requests.post(
-            f"https://{SHOPIFY_STORE}/admin/api/2024-01/graphql.json",
-            headers={
-                'X-Shopify-Access-Token': SHOPIFY_TOKEN,
-                'Content-Type': 'application/json'
-            },
-            json={'query': find_query}
-        )
-        
-        # Map SKU to variant info
-        variants = {}
-        data = response.json()
-        
-        if 'data' in data and data['data']['productVariants']:
-            for edge in data['data']['productVariants']['edges']:
-                node = edge['node']
-                variants[node['sku']] = {
-                    'id': node['id']
-                }
-        
-        # Build bulk update mutation
-        variants_to_update = []
+        Returnerer (prioritet, plan, batch_no, changes, planlagt størrelse) eller None.
+        """
+        waiting = [plan for plan in plans if plan['next'] < len(plan['changes'])]
+        if not waiting:
+            return None
+        plan = max(waiting, key=lambda p: p['changes'][p['next']].get('priority', 0))
+        start = plan['next']
+        size = plan['sizer'].next_size()
+        end = min(start + size, len(plan['changes']))
+        keys = plan['keys']
+        if keys is not None:
+            # Hele gruppen med, inden for sizerens loft
+            while end < len(keys) and keys[end] == keys[end - 1] and end - start < plan['sizer'].maximum:
+                end += 1
+        plan['next'] = end
+        plan['batches'] += 1
+        batch = plan['changes'][start:end]
+        return batch[0].get('priority', 0), plan, plan['batches'], batch, size
+    
+    def missing(self, batch):
+        # Only search for SKUs the index doesn't know
+        return list(dict.fromkeys(c['sku'] for c in batch if c['sku'] not in self.sku_index))
+    
+    def log_batch(self, batch):
+        """Log found/not_found once per SKU across all phases"""
         for change in batch:
-            if change['sku'] in variants:
-                v = variants[change['sku']]
-                variants_to_update.append({
-                    "id": v['id'],
-                    "price": change['price'],
-                    "cost": change['cost'],
-                    "inventoryQuantities": [{
-                        "locationId": f"gid://shopify/Location/{LOCATION_ID}",
-                        "availableQuantity": int(change['inventory'])
-                    }]
-                })
+            if change['sku'] in self._logged:
+                continue
+            self._logged.add(change['sku'])
+            if change['sku'] in self.sku_index:
                 # Log successful mapping
-                update_log.append({
+                self.update_log.append({
                     'sku': change['sku'],
                     'status': 'found',
                     'price': change['price'],
                     'inventory': change['inventory']
                 })
             else:
-                total_not_found += 1
+                self.not_found += 1
                 print(f"⚠️ SKU not found: {change['sku']}")
-                update_log.append({
+                self.update_log.append({
                     'sku': change['sku'],
                     'status': 'not_found'
                 })
+    
+    def pipeline(self, *plans):
+        """Resolve upcoming batches while earlier mutations are in flight.
         
-        # Execute bulk update if we have variants
-        if variants_to_update:
-            mutation = """
-            mutation bulkUpdate($productVariants: [ProductVariantsBulkInput!]!) {
-              productVariantsBulkUpdate(productVariants: $productVariants) {
-                productVariants {
-                  id
-                }
-                userErrors {
-                  field
-                  message
-                }
-              }
-            }
-            """
+        Batches from all phases are interleaved by priority, so a stock-out
+        isn't queued behind every price batch, and each batch is cut at the
+        size its phase's BatchSizer has reached. Dispatch stops when the
+        budget runs out; the rest is deferred to the next run.
+        """
+        in_flight = {}    # future -> (plan, batch_no, count, planned, parts, started)
+        sku_futures = {}  # sku -> future of the batch currently updating it
+        finished = {}     # future -> time the response arrived
+        
+        def complete(future):
+            plan, batch_no, count, planned, parts, started = in_flight.pop(future)
+            label = plan['label']
+            sent = [change for _, changes in parts for change in changes]
+            for change in sent:
+                if sku_futures.get(change['sku']) is future:
+                    del sku_futures[change['sku']]
             
-            update_response = requests.post(
-                f"https://{SHOPIFY_STORE}/admin/api/2024-01/graphql.json",
-                headers={
-                    'X-Shopify-Access-Token': SHOPIFY_TOKEN,
-                    'Content-Type': 'application/json'
-                },
-                json={
-                    'query': mutation,
-                    'variables': {
-                        'productVariants': variants_to_update
-                    }
-                }
-            )
+            try:
+                update_data = future.result()
+            except ShopifyError as e:
+                update_data = {'errors': str(e)}
+            latency = finished.pop(future, time.time()) - started
+            self.latencies.append(latency)
             
             # Check for errors
-            update_data = update_response.json()
+            status = 'error'
+            failed_changes = 0
             if 'errors' in update_data:
-                print(f"❌ GraphQL errors: {update_data['errors']}")
+                print(f"❌ {label} batch {batch_no} GraphQL errors: {update_data['errors']}")
+                # Transportfejl prøves igen næste kørsel
+                self.defer(label, sent)
             else:
-                result = update_data.get('data', {}).get('productVariantsBulkUpdate', {})
-                if result.get('userErrors'):
-                    print(f"⚠️ User errors: {result['userErrors']}")
-                else:
-                    updated_count = len(result.get('productVariants', []))
-                    total_updated += updated_count
-                    print(f"✅ Updated {updated_count} variants in batch")
+                data = update_data.get('data') or {}
+                confirmed = []
+                for key, changes in parts:
+                    result = data.get(key) or {}
+                    if result.get('userErrors'):
+                        failed_changes += len(changes)
+                        print(f"⚠️ {label} batch {batch_no} user errors: {result['userErrors']}")
+                    else:
+                        confirmed.extend(changes)
+                if confirmed:
+                    self.updated_skus.update(change['sku'] for change in confirmed)
+                    # Durable checkpoint før næste batch behandles
+                    self.checkpoint(label, confirmed)
+                    print(f"✅ {label} batch {batch_no}: updated {len(confirmed)} variants")
+                status = 'user_errors' if failed_changes else 'ok'
+            plan['sizer'].observe(count, len(parts), planned, latency, update_data, failed=status == 'error',
+                                  error_rate=failed_changes / count)
+            instrumentation.observe('mutation_batch', latency, phase=label, batch=batch_no,
+                                    variants=count, requests=len(parts), status=status)
+            
+            elapsed = time.time() - self.started
+            print(f"  ⏱️ {label} batch {batch_no}: {latency:.2f}s latency, "
+                  f"{self.updated/(elapsed/60):.0f} variants/minute so far")
         
-        # Rate limit pause
-        time.sleep(0.5)
+        def wait_for(futures):
+            # complete() blocks on the result
+            for future in futures:
+                if future in in_flight:
+                    complete(future)
+        
+        def resolve(batch):
+            missing = self.missing(batch)
+            self.searched += len(missing)
+            return resolver.submit(search_variants, missing) if missing else None
+        
+        with ThreadPoolExecutor(max_workers=1) as resolver:
+            # Resolve batch N+1 while batch N is being built and sent
+            upcoming = self.next_batch(plans)
+            lookahead = resolve(upcoming[3]) if upcoming else None
+            
+            while upcoming is not None:
+                priority, plan, batch_no, batch, planned = upcoming
+                label = plan['label']
+                if self.over_budget():
+                    deferred = len(batch)
+                    self.defer(label, batch)
+                    for rest in plans:
+                        deferred += len(rest['changes']) - rest['next']
+                        self.defer(rest['label'], rest['changes'][rest['next']:])
+                        rest['next'] = len(rest['changes'])
+                    print(f"\n⏸️ Budget exhausted - deferring {deferred} changes to the next run")
+                    break
+                remaining = len(plan['changes']) - plan['next']
+                print(f"\n🔄 Processing {label} batch {batch_no} ({len(batch)} changes, "
+                      f"{remaining} left, priority {priority:g})")
+                
+                if lookahead is not None:
+                    self.sku_index.update(lookahead.result())
+                upcoming = self.next_batch(plans)
+                lookahead = resolve(upcoming[3]) if upcoming else None
+                
+                self.log_batch(batch)
+                query, variables, parts = plan['build_request'](batch, self.sku_index)
+                count = sum(len(changes) for _, changes in parts)
+                if not count:
+                    continue
+                
+                # Per-SKU ordering: never update a SKU while an earlier batch still holds it
+                skus = [change['sku'] for _, changes in parts for change in changes]
+                wait_for({sku_futures[sku] for sku in skus if sku in sku_futures})
+                
+                # Cap in-flight work by the API cost budget
+                cost = plan['sizer'].estimated_cost(len(parts), query)
+                while len(in_flight) >= max_in_flight(cost):
+                    done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        complete(future)
+                
+                future = client.submit(query, variables, cost)
+                in_flight[future] = (plan, batch_no, count, planned, parts, time.time())
+                future.add_done_callback(lambda f: finished.setdefault(f, time.time()))
+                for sku in skus:
+                    sku_futures[sku] = future
+            
+            wait_for(list(in_flight))
+        
+        for plan in plans:
+            sizes = plan['sizer'].sizes
+            if sizes:
+                print(f"📐 {plan['label']}: batch size {sizes[0]} → {int(plan['sizer'].size)} "
+                      f"(max {max(sizes)}) over {plan['batches']} batches")
+    
+    def summary(self):
+        if self.deferred:
+            print(f"⏸️ Deferred {len(self.deferred)} SKUs to the next run")
+        if self.skipped_skus:
+            print(f"⏭️ Skipped {len(self.skipped_skus)} SKUs already applied by an earlier run")
+        if self.searched:
+            print(f"🔎 Searched {self.searched} SKUs missing from the index")
+        if self.latencies:
+            print(f"⏱️ Batch latency: avg {sum(self.latencies)/len(self.latencies):.2f}s, "
+                  f"max {max(self.latencies):.2f}s over {len(self.latencies)} batches")
+        print(f"📡 {client.request_count} requests, {client.retry_count} retries, "
+              f"{client.cost_consumed:.0f} cost points")
+
+def split_changes(changes):
+    """Price/cost changes go through productVariantsBulkUpdate, stock through inventorySetQuantities"""
+    variant_changes = [c for c in changes if c['changes']['price'] or c['changes']['cost']]
+    stock_changes = [c for c in changes if c['changes']['stock']]
+    return variant_changes, stock_changes
+
+def find_and_update_smart(changes, sku_index, journal=None, location_id=LOCATION_ID):
+    """Pipelined update: price/cost via bulk variant updates, stock via inventorySetQuantities"""
+    run = UpdateRun(sku_index, journal)
+    variant_changes, stock_changes = split_changes(changes)
+    print(f"📊 {len(variant_changes)} price/cost changes, {len(stock_changes)} stock changes")
+    
+    run.pipeline(
+        run.plan('variant', variant_changes, BATCH_SIZE, variant_update_request, group_by_product),
+        run.plan('inventory', stock_changes, INVENTORY_BATCH_SIZE,
+                 partial(inventory_request, location_id=location_id)),
+    )
+    run.log_batch(changes)
+    run.summary()
     
-    # Save detailed log
+    save_update_log(run.update_log, run.deferred)
+    
+    return run
+
+# productVariantsBulkUpdate er scoped til ét produkt i bulk mode
+BULK_OPERATION_MUTATION = """
+mutation bulkUpdate($productId: ID!, $variants: [ProductVariantsBulkInput!]!) {
+  productVariantsBulkUpdate(productId: $productId, variants: $variants) {
+    productVariants {
+      id
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+def resolve_missing(run, changes):
+    """Search all SKUs missing from the index, BATCH_SIZE per request"""
+    missing = run.missing(changes)
+    if not missing:
+        return
+    print(f"🔎 Searching {len(missing)} SKUs missing from the index")
+    run.searched += len(missing)
+    chunks = [missing[i:i+BATCH_SIZE] for i in range(0, len(missing), BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=client.max_workers) as pool:
+        for found in pool.map(search_variants, chunks):
+            run.sku_index.update(found)
+
+def bulk_update(changes, sku_index, journal=None, location_id=LOCATION_ID):
+    """Bulk mutation mode: one server-side job for price/cost, batched inventory for stock"""
+    run = UpdateRun(sku_index, journal)
+    with instrumentation.stage('id_resolution_bulk'):
+        resolve_missing(run, changes)
+    run.log_batch(changes)
+    variant_changes, stock_changes = split_changes(changes)
+    variant_changes = run.pending('variant', variant_changes)
+    
+    # One JSONL line per product; last change wins for repeated variants
+    products = {}
+    for change in variant_changes:
+        if change['sku'] not in sku_index:
+            continue
+        variant = variant_input(change, sku_index)
+        product_id = sku_index[change['sku']][1]
+        products.setdefault(product_id, {})[variant['id']] = (change, variant)
+    
+    line_changes = []
+    with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+        variables_path = f.name
+        for product_id, product_variants in products.items():
+            line_changes.append([change for change, _ in product_variants.values()])
+            f.write(json.dumps({
+                'productId': product_gid(product_id),
+                'variants': [variant for _, variant in product_variants.values()]
+            }) + '\n')
+    print(f"📝 Wrote {sum(map(len, line_changes))} variant updates for {len(line_changes)} products")
+    
+    # Stream the result file back into the update log
+    sku_status = {}
+    confirmed = []
+    answered = set()  # linjer med et result record
+    try:
+        if line_changes:
+            with instrumentation.stage('bulk_mutation', products=len(line_changes)):
+                for record in run_bulk_mutation(client, BULK_OPERATION_MUTATION, variables_path):
+                    answered.add(record['__lineNumber'])
+                    line = line_changes[record['__lineNumber']]
+                    skus = [change['sku'] for change in line]
+                    result = (record.get('data') or {}).get('productVariantsBulkUpdate') or {}
+                    errors = record.get('errors') or result.get('userErrors')
+                    if errors:
+                        for sku in skus:
+                            sku_status[sku] = {'status': 'error', 'errors': errors}
+                    else:
+                        run.updated_skus.update(skus)
+                        confirmed.extend(line)
+                        for sku in skus:
+                            sku_status[sku] = {'status': 'updated'}
+                    if len(confirmed) >= JOURNAL_FLUSH_RECORDS:
+                        run.checkpoint('variant', confirmed)
+                        confirmed = []
+    except (ShopifyError, requests.RequestException) as e:
+        # Staged upload og result-filen går uden om klienten og rejser requests-fejl
+        print(f"❌ Bulk mutation failed: {e}")
+    finally:
+        run.checkpoint('variant', confirmed)
+        os.remove(variables_path)
+    # Linjer uden svar (fejlet eller afbrudt operation) prøves igen næste kørsel, som transportfejl i pipeline()
+    unanswered = [change for n, line in enumerate(line_changes) if n not in answered for change in line]
+    if unanswered:
+        run.defer('variant', unanswered)
+        print(f"⏸️ Deferring {len(unanswered)} variant updates without a bulk result")
+    
+    for entry in run.update_log:
+        if entry['status'] == 'found' and entry['sku'] in sku_status:
+            entry.update(sku_status[entry['sku']])
+    
+    errors = sum(1 for status in sku_status.values() if status['status'] == 'error')
+    print(f"✅ Bulk mutation updated {run.updated} variants ({errors} SKUs with errors)")
+    
+    # Stock goes through the batched inventory path
+    run.pipeline(run.plan('inventory', stock_changes, INVENTORY_BATCH_SIZE,
+                          partial(inventory_request, location_id=location_id)))
+    run.summary()
+    
+    save_update_log(run.update_log, run.deferred)
+    
+    return run
+
+def apply_changes(changes, store, sku_index=None, use_queue=True, location_id=LOCATION_ID):
+    """Send changes til Shopify med checkpoint journal i `store`.
+    
+    Med `use_queue` lægges changes i change queue'en, og det er køen der
+    drænes: dubletter og allerede bekræftede værdier er coalescet væk, og
+    det der ikke når ud denne gang bliver i køen til næste kørsel.
+    
+    IDs kommer fra state store'et. Er det tomt (fx cache miss) og har
+    changes heller ingen IDs, stoppes kørslen i stedet for at søge hver
+    SKU frem enkeltvis.
+    
+    Returnerer (updated, not_found, skipped, deferred).
+    """
+    if sku_index is None:
+        with instrumentation.stage('index_load'):
+            sku_index = store.load_ids()
+        print(f"📇 Loaded {len(sku_index)} SKUs from {store.path}")
+    changes = drop_unknown_values(changes)
+    seed_index(sku_index, changes)
+    if changes and not sku_index:
+        raise SystemExit(f"❌ No Shopify IDs in {store.path} or the changes - "
+                         f"run cache_shop_skus.py or direct sync first")
+    
+    if use_queue:
+        queue = ChangeQueue(store)
+        queued, dropped = queue.push(changes)
+        print(f"📥 Change queue: {queued} SKUs pending, {dropped} dropped as already in Shopify")
+        instrumentation.count('queue_dropped', dropped)
+        changes = queue.drain()
+    else:
+        changes = coalesce(changes)
+    changes = prioritize(changes)
+    
+    # Checkpoint journal - en genstartet kørsel på samme changes springer bekræftede SKUs over
+    input_hash = changes_sha256(changes)
+    pruned = store.journal_prune(input_hash)
+    if pruned:
+        print(f"🧹 Cleared {pruned} journal entries from earlier runs")
+    journal = UpdateJournal(store, input_hash)
+    
+    # Smart update - bulk mutation for large change sets
+    if len(changes) >= BULK_MUTATION_THRESHOLD:
+        print(f"📦 {len(changes)} changes - using bulk mutation mode")
+        run = bulk_update(changes, sku_index, journal, location_id)
+    else:
+        run = find_and_update_smart(changes, sku_index, journal, location_id)
+    
+    if use_queue:
+        queue.settle(run.deferred.values())
+    return run.updated, run.not_found, len(run.skipped_skus), len(run.deferred)
+
+def save_update_log(update_log, deferred=()):
+    """Save detailed log"""
+    for entry in update_log:
+        if entry['sku'] in deferred and entry['status'] == 'found':
+            entry['status'] = 'deferred'
     log_file = f"reports/update_details_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
     os.makedirs('reports', exist_ok=True)
     with open(log_file, 'w') as f:
         json.dump(update_log, f, indent=2)
-    
-    return total_updated, total_not_found
 
 def main():
     print("🚀 Starting Shopify Bulk Update")
@@ -173,19 +841,35 @@ def main():
     print(f"📍 TEST MODE: {TEST_MODE}")
     
     # Read changes
-    changes = read_csv_changes()
+    log, last_seq = None, None
+    with instrumentation.stage('changes_read'):
+        if CHANGES_SOURCE == 'changelog':
+            log = ChangeLog()
+            changes, last_seq = read_changelog_changes(log)
+        else:
+            changes = read_changes()
     if not changes:
         return
     
-    # Apply test mode limit
+    # Apply test mode limit - de vigtigste først
+    changes = prioritize(changes)
     if TEST_MODE and len(changes) > 100:
-        print("⚠️ TEST MODE: Only processing first 100 changes")
+        print("⚠️ TEST MODE: Only processing the 100 highest-priority changes")
         changes = changes[:100]
     
-    # Smart update
     start_time = time.time()
-    updated, not_found = find_and_update_smart(changes)
+    with StateStore() as store:
+        # Test mode rører ikke køen
+        updated, not_found, skipped, deferred = apply_changes(changes, store, use_queue=not TEST_MODE)
+    # Udskudte ændringer ligger i køen, så offset'et kan flyttes forbi dem
+    if log is not None and not TEST_MODE:
+        log.commit(CHANGELOG_CONSUMER, last_seq)
     elapsed = time.time() - start_time
+    instrumentation.count('changes', len(changes))
+    instrumentation.count('updated', updated)
+    instrumentation.count('not_found', not_found)
+    instrumentation.count('skipped', skipped)
+    instrumentation.count('deferred', deferred)
     
     # Final results
     results = {
@@ -194,6 +878,8 @@ def main():
         'total_changes': len(changes),
         'updated': updated,
         'not_found': not_found,
+        'skipped_already_applied': skipped,
+        'deferred_to_next_run': deferred,
         'elapsed_seconds': round(elapsed, 2),
         'elapsed_minutes': round(elapsed/60, 1),
         'speed_per_minute': round(updated/(elapsed/60)) if elapsed > 0 else 0
@@ -203,6 +889,8 @@ def main():
     print(f"  Total changes: {results['total_changes']:,}")
     print(f"  Updated: {results['updated']:,}")
     print(f"  Not found: {results['not_found']:,}")
+    print(f"  Skipped (already applied): {results['skipped_already_applied']:,}")
+    print(f"  Deferred to next run: {results['deferred_to_next_run']:,}")
     print(f"  Time: {results['elapsed_minutes']} minutes")
     print(f"  Speed: {results['speed_per_minute']} products/minute")
     
@@ -216,4 +904,5 @@ def main():
     print(f"\n📄 Report saved to: {report_file}")
 
 if __name__ == "__main__":
-    main()
+    with instrumentation.tracked_run('bulk_update', client):
+        main()
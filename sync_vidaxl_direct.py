@@ -1,82 +1,151 @@
 import os  
-import requests
-import pandas as pd
-from datetime import datetime
-from io import StringIO
-import json
-import csv
+from datetime import datetime, timedelta
+import instrumentation
+from catalog import CatalogBuilder, parse_timestamp
+from change_queue import ChangeQueue
+from changelog import ChangeLog
+from changeset import write_changeset
+from diff_engine import diff_against_shopify, write_matrixify_csv
+from pricing import load_rules
+from shopify_bulk import bulk_snapshot, use_bulk_snapshot
+from shopify_client import shared_client
+from shopify_paging import fetch_partitioned
+from sku_index import numeric_id
+from state_store import StateStore
+from sync_config import PRICE_MARKUP, PRICING_RULES_FILE, SHOPIFY_STORE, TOKEN_ENV, VIDAXL_URL
+from vidaxl_feed import concat_chunks, fetch_feed_if_changed, load_feed_state, save_feed_state
 
 # Config
-SHOPIFY_STORE = 'b7916a-38.myshopify.com'
-SHOPIFY_TOKEN = os.environ['SHOPIFY_ACCESS_TOKEN']
-VIDAXL_URL = "https://transport.productsup.io/de8254c69e698a08e904/channel/188044/vidaXL_dk_dropshipping.csv"
-PRICE_MARKUP = 1.60
-
-def calculate_retail_price(b2b_price):
-    """Beregn dansk salgspris"""
-    try:
-        import math
-        price = float(b2b_price) * PRICE_MARKUP
-        return int(10 * math.ceil(price / 10) - 1)
-    except:
-        return 0
-
-def fetch_shopify_products():
-    """Hent ALLE produkter fra Shopify med GraphQL - HURTIGT!"""
-    print("🚀 Fetching all products from Shopify...")
-    
-    products = {}
+SHOPIFY_TOKEN = os.environ[TOKEN_ENV]
+
+client = shared_client(SHOPIFY_STORE, SHOPIFY_TOKEN)
+
+# Fuld refresh med dette interval fanger slettede varianter og ændringer
+# der ikke flytter variantens updated_at (fx kostpris på inventory item)
+FULL_REFRESH_HOURS = float(os.getenv('SNAPSHOT_FULL_REFRESH_HOURS', '24'))
+# Lagertal fra ordrer flytter heller ikke updated_at - lageret for alle
+# varianter hentes med dette interval. Imellem kan snapshot'ets lager være
+# op til så mange timer gammelt; updateren sender lager uanset snapshot'et
+INVENTORY_REFRESH_HOURS = float(os.getenv('SNAPSHOT_INVENTORY_REFRESH_HOURS', '6'))
+# Overlap på high-water mark'et - merge er idempotent, så dobbelt-hentning er ufarlig
+SNAPSHOT_OVERLAP = timedelta(minutes=5)
+
+VARIANT_FIELDS = """
+        id
+        sku
+        price
+        inventoryQuantity
+        updatedAt
+        product {
+          id
+        }
+        inventoryItem {
+          id
+          unitCost {
+            amount
+          }
+        }
+"""
+
+BULK_PRODUCTS_QUERY = """
+{
+  productVariants {
+    edges {
+      node {%s      }
+    }
+  }
+}
+""" % VARIANT_FIELDS
+
+PRODUCTS_PAGE_QUERY = """
+query getProducts($cursor: String, $query: String) {
+  productVariants(first: 250, after: $cursor, query: $query) {
+    edges {
+      node {%s      }
+    }
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+  }
+}
+""" % VARIANT_FIELDS
+
+INVENTORY_FIELDS = """
+        id
+        inventoryQuantity
+"""
+
+BULK_INVENTORY_QUERY = """
+{
+  productVariants {
+    edges {
+      node {%s      }
+    }
+  }
+}
+""" % INVENTORY_FIELDS
+
+INVENTORY_PAGE_QUERY = """
+query getInventory($cursor: String, $query: String) {
+  productVariants(first: 250, after: $cursor, query: $query) {
+    edges {
+      node {%s      }
+    }
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+  }
+}
+""" % INVENTORY_FIELDS
+
+def add_product(catalog, node):
+    """Variant node -> række i kataloget"""
+    catalog.add(
+        str(node['sku']),
+        variant_id=numeric_id(node['id']),
+        product_id=numeric_id((node.get('product') or {}).get('id')),
+        inventory_item_id=numeric_id(node['inventoryItem'].get('id')),
+        price=float(node['price']) if node['price'] else 0,
+        inventory=node['inventoryQuantity'] or 0,
+        cost=float(node['inventoryItem']['unitCost']['amount']) if node['inventoryItem']['unitCost'] else 0,
+        updated_at=parse_timestamp(node.get('updatedAt'))
+    )
+
+def fetch_shopify_products_bulk():
+    """Hent ALLE produkter via en Bulk Operation (streamet JSONL)"""
+    products = CatalogBuilder()
+    for node in bulk_snapshot(client, BULK_PRODUCTS_QUERY):
+        if node.get('sku'):
+            add_product(products, node)
+    return products.build()
+
+def fetch_shopify_products(updated_since=None):
+    """Hent produkter fra Shopify med GraphQL - alle, eller kun dem ændret efter updated_since"""
+    search = None
+    if updated_since:
+        search = f"updated_at:>'{updated_since}'"
+        print(f"🚀 Fetching products updated since {updated_since}...")
+    elif use_bulk_snapshot():
+        return fetch_shopify_products_bulk()
+    else:
+        print("🚀 Fetching all products from Shopify...")
+    
+    products = CatalogBuilder()
     has_next_page = True
     cursor = None
     page = 0
     
     while has_next_page:
-        query = """
-        query getProducts($cursor: String) {
-          productVariants(first: 250, after: $cursor) {
-            edges {
-              node {
-                id
-                sku
-                price
-                inventoryQuantity
-                inventoryItem {
-                  unitCost {
-                    amount
-                  }
-                }
-              }
-            }
-            pageInfo {
-              hasNextPage
-              endCursor
-            }
-          }
-        }
-        """
-        
-        response = requests.post(
-            f"https://{SHOPIFY_STORE}/admin/api/2024-01/graphql.json",
-            headers={
-                'X-Shopify-Access-Token': SHOPIFY_TOKEN,
-                'Content-Type': 'application/json'
-            },
-            json={'query': query, 'variables': {'cursor': cursor}}
-        )
-        
-        data = response.json()
-        variants = data['data']['productVariants']
+        data = client.query(PRODUCTS_PAGE_QUERY, {'cursor': cursor, 'query': search})
+        variants = data['productVariants']
         
         # Process variants
         for edge in variants['edges']:
             node = edge['node']
             if node['sku']:
-                products[str(node['sku'])] = {
-                    'id': node['id'],
-                    'price': float(node['price']) if node['price'] else 0,
-                    'inventory': node['inventoryQuantity'] or 0,
-                    'cost': float(node['inventoryItem']['unitCost']['amount']) if node['inventoryItem']['unitCost'] else 0
-                }
+                add_product(products, node)
         
         has_next_page = variants['pageInfo']['hasNextPage']
         cursor = variants['pageInfo']['endCursor']
@@ -84,82 +153,134 @@ def fetch_shopify_products():
         
         print(f"  Fetched page {page} - Total products: {len(products)}")
     
+    return products.build()
+
+def fetch_shopify_inventory():
+    """[(variant_id, lager)] for alle varianter - kun id og inventoryQuantity"""
+    if use_bulk_snapshot():
+        nodes = bulk_snapshot(client, BULK_INVENTORY_QUERY)
+    else:
+        print("🚀 Fetching inventory for all variants...")
+        nodes = fetch_partitioned(client, INVENTORY_PAGE_QUERY)
+    return [(numeric_id(node['id']), node['inventoryQuantity'] or 0) for node in nodes]
+
+def inventory_due(store):
+    last = store.get_meta('snapshot_inventory_refresh')
+    return not last or datetime.now() - datetime.fromisoformat(last) >= timedelta(hours=INVENTORY_REFRESH_HOURS)
+
+def load_shopify_snapshot(store, cached=None):
+    """Snapshot fra state store + varianter ændret siden high-water mark.
+    
+    Fuld refresh første gang og hver FULL_REFRESH_HOURS. `cached` er et
+    katalog der allerede ligger i hukommelsen (daemon mode) - så merges
+    ændringerne direkte ind i det i stedet for at læse tabellen igen.
+    
+    Inkrementelle kørsler henter desuden lageret for alle varianter hver
+    INVENTORY_REFRESH_HOURS, da salg trækker lager uden at røre updated_at.
+    Det lægges på kataloget i hukommelsen, og kun ændrede rækker skrives.
+    """
+    high_water = store.get_meta('snapshot_high_water')
+    last_full = store.get_meta('snapshot_full_refresh')
+    full = (
+        not high_water or not last_full
+        or datetime.now() - datetime.fromisoformat(last_full) > timedelta(hours=FULL_REFRESH_HOURS)
+    )
+    
+    if full:
+        products = fetch_shopify_products()
+        store.replace_snapshot(products)
+        store.set_meta('snapshot_full_refresh', datetime.now().isoformat())
+        store.set_meta('snapshot_inventory_refresh', datetime.now().isoformat())
+        # High-water mark følger Shopify's ur, ikke vores
+        store.set_meta('snapshot_high_water', products.high_water() or '')
+        instrumentation.count('snapshot_full_refresh')
+        return products
+    
+    since = datetime.fromisoformat(high_water.replace('Z', '+00:00')) - SNAPSHOT_OVERLAP
+    changed = fetch_shopify_products(since.strftime('%Y-%m-%dT%H:%M:%SZ'))
+    store.merge_snapshot(changed)
+    store.set_meta('snapshot_high_water', max(changed.high_water() or high_water, high_water))
+    instrumentation.count('snapshot_changed_variants', len(changed))
+    print(f"🔄 Merged {len(changed)} changed variants into the stored snapshot")
+    
+    products = cached.merge(changed) if cached is not None else store.load_snapshot()
+    
+    if inventory_due(store):
+        products, moved = products.with_inventory(fetch_shopify_inventory())
+        store.confirm_variants('inventory', moved)
+        store.set_meta('snapshot_inventory_refresh', datetime.now().isoformat())
+        instrumentation.count('snapshot_inventory_changed', len(moved))
+        print(f"📦 Refreshed inventory - {len(moved)} variants changed outside the snapshot")
     return products
 
-def main():
-    print(f"🚀 VidaXL Direct Sync - {datetime.now()}")
+def sync_once(store, feed_state, cached=None):
+    """Én fetch/diff cyklus.
+    
+    Returnerer (changes, new_feed_state, catalog); changes er None hvis
+    feedet er uændret og Shopify ikke blev spurgt.
+    """
+    # Step 1: Hent VidaXL feed - kun hvis det er ændret siden sidste kørsel
+    print("📥 Fetching VidaXL feed...")
+    feed_chunks, new_feed_state = fetch_feed_if_changed(VIDAXL_URL, feed_state)
+    if feed_chunks is None:
+        print("✅ Feed unchanged since last run - skipping Shopify sync")
+        return None, feed_state, cached
+    print(f"✅ Loaded {sum(len(chunk) for chunk in feed_chunks)} products from VidaXL")
+    
+    changes, shopify_products = sync_feed(store, concat_chunks(feed_chunks), cached)
+    return changes, new_feed_state, shopify_products
+
+def sync_feed(store, feed, cached=None, markup=PRICE_MARKUP, rules=None):
+    """Diff et allerede hentet feed mod butikken og skriv CSV, changeset og change log.
     
-    # Step 1: Hent Shopify data
-    shopify_products = fetch_shopify_products()
+    Uden `rules` bruges PRICING_RULES_FILE, eller den flade `markup`.
+    Returnerer (changes, catalog).
+    """
+    rules = rules or load_rules(PRICING_RULES_FILE, markup)
+    # Step 2: Hent Shopify data
+    with instrumentation.stage('shopify_fetch') as record:
+        shopify_products = load_shopify_snapshot(store, cached)
+        record['variants'] = len(shopify_products)
     print(f"✅ Loaded {len(shopify_products)} products from Shopify")
     
-    # Step 2: Hent VidaXL feed
-    print("📥 Fetching VidaXL feed...")
-    response = requests.get(VIDAXL_URL)
-    vidaxl_data = pd.read_csv(StringIO(response.text))
-    print(f"✅ Loaded {len(vidaxl_data)} products from VidaXL")
-    
-    # Step 3: Find ændringer
-    changes = []
-    
-    for _, row in vidaxl_data.iterrows():
-        sku = str(row['SKU'])
-        vidaxl_price = calculate_retail_price(row['B2B price'])
-        vidaxl_cost = float(row['B2B price'])
-        vidaxl_stock = int(row['Stock'])
-        
-        if sku in shopify_products:
-            shopify = shopify_products[sku]
-            
-            # Check for ændringer
-            price_changed = abs(vidaxl_price - shopify['price']) > 0.01
-            cost_changed = abs(vidaxl_cost - shopify['cost']) > 0.01
-            stock_changed = vidaxl_stock != shopify['inventory']
-            
-            if price_changed or cost_changed or stock_changed:
-                changes.append({
-                    'sku': sku,
-                    'price': vidaxl_price,
-                    'cost': vidaxl_cost,
-                    'inventory': vidaxl_stock,
-                    'changes': {
-                        'price': price_changed,
-                        'cost': cost_changed,
-                        'stock': stock_changed
-                    }
-                })
+    # Step 3: Find ændringer - hele feedet på én gang
+    with instrumentation.stage('diff') as record:
+        changes = diff_against_shopify(feed, shopify_products, markup, rules)
+        record['changes'] = len(changes)
+    instrumentation.count('changes', len(changes))
     
     print(f"📊 Found {len(changes)} products with changes")
     
+    # Diff'en er fuld: køede SKUs den ikke har med er ikke længere ændringer
+    stale = ChangeQueue(store).retain(changes['sku'].astype(str))
+    if stale:
+        print(f"🧹 Dropped {stale} queued changes the feed no longer asks for")
+        instrumentation.count('queue_stale', stale)
+    
     # Step 4: Output CSV
-    if changes:
-        with open('matrixify_delta_update.csv', 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=[
-                'Variant SKU', 'Variant Price', 'Variant Cost', 
-                'Variant Inventory Qty', 'Variant Command'
-            ])
-            writer.writeheader()
-            
-            for change in changes:
-                writer.writerow({
-                    'Variant SKU': change['sku'],
-                    'Variant Price': change['price'],
-                    'Variant Cost': change['cost'],
-                    'Variant Inventory Qty': change['inventory'],
-                    'Variant Command': 'UPDATE'
-                })
-        
+    with instrumentation.stage('csv_write', rows=len(changes)):
+        write_matrixify_csv(changes)
+    with instrumentation.stage('changeset_write', rows=len(changes)):
+        write_changeset(changes)
+    with instrumentation.stage('changelog_append', rows=len(changes)):
+        ChangeLog().append(changes, instrumentation.current_run().run_id)
+    if len(changes):
         print(f"✅ Written {len(changes)} changes to matrixify_delta_update.csv")
     else:
-        # Tom fil
-        with open('matrixify_delta_update.csv', 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=[
-                'Variant SKU', 'Variant Price', 'Variant Cost', 
-                'Variant Inventory Qty', 'Variant Command'
-            ])
-            writer.writeheader()
-        
         print("ℹ️ No changes detected - created empty update file")
+    
+    return changes, shopify_products
+
+def main():
+    print(f"🚀 VidaXL Direct Sync - {datetime.now()}")
+    
+    with StateStore() as store:
+        changes, new_feed_state, _ = sync_once(store, load_feed_state())
+    
+    # Husk feedet først når ændringerne er skrevet
+    if changes is not None:
+        save_feed_state(new_feed_state)
 
 if __name__ == "__main__":
-    main()
+    with instrumentation.tracked_run('direct_sync', client):
+        main()
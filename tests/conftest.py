@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Scripts ligger flat i repo-roden
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,47 @@
+from catalog import CatalogBuilder
+
+
+def catalog(*variants):
+    builder = CatalogBuilder()
+    for sku, variant_id, inventory in variants:
+        builder.add(sku, variant_id=variant_id, product_id=variant_id // 10,
+                    inventory_item_id=variant_id * 10, price=99.0, cost=50.0, inventory=inventory)
+    return builder.build()
+
+
+def test_with_inventory_returns_only_changed_variants():
+    products = catalog(('A', 11, 5), ('B', 12, 3))
+
+    updated, moved = products.with_inventory([(11, 5), (12, 1), (99, 7)])
+
+    assert moved == [(12, 1)]
+    assert updated.inventory[updated.find('B')] == 1
+    assert products.inventory[products.find('B')] == 3  # originalen er urørt
+
+
+def test_positions_returns_minus_one_for_missing_skus():
+    products = catalog(('A', 11, 5), ('C', 13, 3))
+
+    assert products.positions(['C', 'B', 'A', 'D']).tolist() == [1, -1, 0, -1]
+    assert catalog().positions(['A']).tolist() == [-1]
+    assert 'B' not in products
+
+
+def test_duplicate_skus_keep_the_highest_variant_id():
+    products = catalog(('A', 12, 5), ('A', 11, 3), ('B', 13, 1))
+
+    assert products.keys() == ['A', 'B']
+    assert products.variant_id[products.find('A')] == 12
+    assert products.duplicate_skus.tolist() == [b'A']
+    assert products.duplicate_variant_ids.tolist() == [11]
+
+
+def test_merge_moves_a_renamed_sku():
+    products = catalog(('OLD', 11, 5), ('B', 12, 3))
+
+    merged = products.merge(catalog(('NEW', 11, 4)))
+
+    assert merged.keys() == ['B', 'NEW']
+    assert merged.find('OLD') == -1
+    assert merged.variant_id[merged.find('NEW')] == 11
+    assert merged.inventory[merged.find('NEW')] == 4
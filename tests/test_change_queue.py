@@ -0,0 +1,29 @@
+from change_queue import ChangeQueue
+from state_store import StateStore
+
+
+def changes(sku, price):
+    return {'sku': sku, 'price': price, 'cost': 100.0, 'inventory': 5, 'priority': 0.0,
+            'changes': {'price': True, 'cost': False, 'stock': False}}
+
+
+def test_full_diff_drops_stale_queued_target(tmp_path):
+    with StateStore(str(tmp_path / 'state.db')) as store:
+        queue = ChangeQueue(store)
+        queue.push([changes('A', 120), changes('B', 80)])
+
+        # Feedet er tilbage på Shopifys pris for A - den fulde diff har kun B
+        assert queue.retain(['B']) == 1
+        assert [change['sku'] for change in queue.load()] == ['B']
+
+
+def test_stock_is_not_dropped_against_confirmed_inventory(tmp_path):
+    with StateStore(str(tmp_path / 'state.db')) as store:
+        store.conn.execute("INSERT INTO shop_variants (variant_id, sku, price, cost, inventory) "
+                           "VALUES (1, 'A', 120, 100, 5)")
+        change = changes('A', 120)
+        change['changes']['stock'] = True
+
+        # Salg kan have trukket lageret siden snapshot'et - kun prisen er afgjort
+        assert ChangeQueue(store).push([change]) == (1, 0)
+        assert ChangeQueue(store).load()[0]['changes'] == {'price': False, 'cost': False, 'stock': True}
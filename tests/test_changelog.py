@@ -0,0 +1,41 @@
+import pandas as pd
+from changelog import ChangeLog
+
+
+def changes(sku, price, inventory, price_changed, stock_changed, priority=0.0):
+    return pd.DataFrame({
+        'sku': [sku], 'price': [price], 'cost': [100.0], 'inventory': [inventory],
+        'price_changed': [price_changed], 'cost_changed': [False], 'stock_changed': [stock_changed],
+        'priority': [priority],
+        'old_price': [199.0], 'old_cost': [100.0], 'old_inventory': [5],
+    })
+
+
+def test_compact_keeps_fields_of_dropped_events(tmp_path):
+    log = ChangeLog(str(tmp_path), segment_records=2)
+    log.append(changes('A', 149, 5, True, False, priority=500.0), 'run1')
+    log.append(changes('A', 149, 0, False, True, priority=1000.0), 'run2')
+    log.append(changes('B', 99, 1, True, False), 'run3')  # aktivt segment
+
+    assert log.compact() == (2, 1)
+
+    events = list(log.read(0))
+    merged = [event for event in events if event['sku'] == 'A']
+    assert len(merged) == 1
+    assert merged[0]['seq'] == 2
+    assert merged[0]['fields'] == 'price;stock'
+    assert merged[0]['price'] == 149 and merged[0]['inventory'] == 0
+    assert merged[0]['priority'] == 1000.0
+    assert merged[0]['old_price'] == 199.0
+
+
+def test_consumer_behind_offset_sees_merged_event(tmp_path):
+    log = ChangeLog(str(tmp_path), segment_records=2)
+    log.append(changes('A', 149, 5, True, False), 'run1')
+    log.append(changes('A', 149, 0, False, True), 'run2')
+    log.append(changes('B', 99, 1, True, False), 'run3')
+    log.compact()
+
+    events = log.poll('updater')
+    assert [event['sku'] for event in events] == ['A', 'B']
+    assert events[0]['fields'] == 'price;stock'
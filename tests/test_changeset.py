@@ -0,0 +1,34 @@
+import math
+import pandas as pd
+from changeset import read_changeset, write_changeset
+
+
+def test_round_trip_keeps_flags_missing_cost_unicode_and_ids(tmp_path):
+    path = str(tmp_path / 'changes.npy')
+    changes = pd.DataFrame({
+        'sku': ['8719883', 'Bænk-æøå'],
+        'price': [149.0, 99.95],
+        'cost': [80.5, float('nan')],
+        'inventory': [3, 0],
+        'price_changed': [True, False],
+        'cost_changed': [False, True],
+        'stock_changed': [True, True],
+        'priority': [12.5, 0.0],
+        'variant_id': [11, 0],
+        'product_id': [1, 0],
+        'inventory_item_id': [101, 0],
+    })
+
+    assert write_changeset(changes, path) == 2
+    first, second = read_changeset(path)
+
+    assert first == {
+        'sku': '8719883', 'price': '149.0', 'cost': '80.5', 'inventory': '3',
+        'changes': {'price': True, 'cost': False, 'stock': True},
+        'priority': 12.5, 'ids': (11, 1, 101),
+    }
+    assert second['sku'] == 'Bænk-æøå'
+    assert second['price'] == '99.95'
+    assert math.isnan(float(second['cost']))
+    assert second['changes'] == {'price': False, 'cost': True, 'stock': True}
+    assert second['ids'] is None
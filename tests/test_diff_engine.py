@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from catalog import CatalogBuilder
+from diff_engine import diff_against_previous, diff_against_shopify, feed_frame
+
+
+def feed(*rows):
+    return pd.DataFrame(rows, columns=['SKU', 'B2B price', 'Stock'])
+
+
+def shop(*variants):
+    builder = CatalogBuilder()
+    for sku, variant_id, price, cost, inventory in variants:
+        builder.add(sku, variant_id=variant_id, product_id=variant_id // 10,
+                    inventory_item_id=variant_id * 10, price=price, cost=cost, inventory=inventory)
+    return builder.build()
+
+
+def flags(changes, sku):
+    row = changes.set_index('sku').loc[sku]
+    return row['price_changed'], row['cost_changed'], row['stock_changed']
+
+
+def test_feed_frame_keeps_the_last_duplicate():
+    frame = feed_frame(feed(('A', 40.0, 1), ('B', 40.0, 2), ('A', 40.0, 7)))
+
+    assert sorted(frame['sku']) == ['A', 'B']
+    assert frame.set_index('sku').loc['A', 'inventory'] == 7
+
+
+def test_diff_against_shopify_masks_and_tolerance():
+    # 40 * 1.6 = 64 -> 69
+    products = shop(
+        ('SAME', 11, 69.0, 40.0, 5),
+        ('ROUNDING', 12, 69.0, 40.0, 5),
+        ('COST', 13, 69.0, 39.0, 5),
+        ('STOCK', 14, 69.0, 40.0, 5),
+        ('PRICE', 15, 99.0, 40.0, 5),
+    )
+    changes = diff_against_shopify(feed(
+        ('SAME', 40.0, 5),
+        ('ROUNDING', 40.005, 5),
+        ('COST', 40.0, 5),
+        ('STOCK', 40.0, 0),
+        ('PRICE', 40.0, 5),
+        ('NOT-IN-SHOP', 40.0, 5),
+    ), products)
+
+    assert sorted(changes['sku']) == ['COST', 'PRICE', 'STOCK']
+    assert flags(changes, 'COST') == (False, True, False)
+    assert flags(changes, 'STOCK') == (False, False, True)
+    assert flags(changes, 'PRICE') == (True, False, False)
+    row = changes.set_index('sku').loc['STOCK']
+    assert row['id'] == 'gid://shopify/ProductVariant/14'
+    assert (row['variant_id'], row['product_id'], row['inventory_item_id']) == (14, 1, 140)
+    assert row['old_inventory'] == 5
+
+
+def test_diff_against_shopify_uses_the_last_duplicate_feed_row():
+    products = shop(('A', 11, 69.0, 40.0, 5))
+
+    changes = diff_against_shopify(feed(('A', 40.0, 0), ('A', 40.0, 5)), products)
+
+    assert changes.empty
+
+
+def test_diff_against_previous_masks_and_tolerance():
+    current = feed_frame(feed(('SAME', 40.0, 5), ('ROUNDING', 40.005, 5), ('COST', 41.0, 5), ('STOCK', 40.0, 2)))
+    previous = pd.DataFrame({
+        'sku': ['SAME', 'ROUNDING', 'COST', 'STOCK'],
+        'price': [69.0, 69.0, 69.0, 69.0],
+        'cost': [40.0, 40.0, 40.0, 40.0],
+        'inventory': [5, 5, 5, 5],
+    })
+
+    changes = diff_against_previous(current, previous)
+
+    assert sorted(changes['sku']) == ['COST', 'STOCK']
+    assert flags(changes, 'COST') == (False, True, False)
+    assert flags(changes, 'STOCK') == (False, False, True)
+
+
+def test_diff_against_previous_flags_a_new_sku_on_every_field():
+    current = feed_frame(feed(('OLD', 40.0, 5), ('NEW', 40.0, 5)))
+    previous = pd.DataFrame({'sku': ['OLD'], 'price': [69.0], 'cost': [40.0], 'inventory': [5]})
+
+    changes = diff_against_previous(current, previous)
+
+    assert changes['sku'].tolist() == ['NEW']
+    assert flags(changes, 'NEW') == (True, True, True)
+    assert np.isnan(changes.loc[0, 'old_price'])
+    assert changes.loc[0, 'priority'] > 0
@@ -0,0 +1,23 @@
+import math
+import numpy as np
+from pricing import PricingRules
+from sync_config import PRICE_MARKUP
+
+
+def calculate_retail_price(b2b_price):
+    """Den oprindelige pris pr. række (før regelmotoren)"""
+    try:
+        price = float(b2b_price) * PRICE_MARKUP
+        return int(10 * math.ceil(price / 10) - 1)
+    except Exception:
+        return 0
+
+
+def test_default_rule_matches_calculate_retail_price():
+    rng = np.random.default_rng(22)
+    values = np.round(rng.uniform(0, 5000, 200_000), 2).tolist()
+    values += [0, 0.01, 6.25, 62.5, 100, 1e6, -12.5, float('nan'), float('inf'), None, '', 'n/a', '19.99']
+
+    prices = PricingRules(PRICE_MARKUP).price(values)
+
+    assert prices.tolist() == [calculate_retail_price(value) for value in values]
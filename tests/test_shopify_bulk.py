@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'benchmarks'))
+import shopify_bulk  # noqa: E402
+from mock_shopify import MockCatalog, MockShopifyServer  # noqa: E402
+from shopify_client import ShopifyClient  # noqa: E402
+
+RECORDED = [
+    {'id': 'gid://shopify/ProductVariant/1', 'sku': 'A', 'product': {'id': 'gid://shopify/Product/1'}},
+    {'id': 'gid://shopify/ProductVariant/2', 'sku': 'B', 'product': {'id': 'gid://shopify/Product/1'}},
+]
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(shopify_bulk, 'POLL_INTERVAL', 0)
+    path = tmp_path / 'variants.jsonl'
+    path.write_text(''.join(json.dumps(node) + '\n' for node in RECORDED))
+    server = MockShopifyServer(MockCatalog([]), bulk_jsonl=str(path), bulk_polls=2).start()
+    monkeypatch.setenv('SHOPIFY_API_URL', f"{server.url}/graphql")
+    yield server
+    server.shutdown()
+
+
+def test_bulk_snapshot_streams_the_recorded_jsonl(server):
+    client = ShopifyClient('mock.myshopify.com', 'test')
+
+    assert list(shopify_bulk.bulk_snapshot(client, '{ productVariants { edges { node { id sku } } } }')) == RECORDED
+    assert server.snapshot_stats()['operations']['currentBulkOperation'] == 2
+
+
+def test_bulk_query_waits_for_a_running_operation(server):
+    client = ShopifyClient('mock.myshopify.com', 'test')
+    first = shopify_bulk.run_bulk_query(client, '{ productVariants { edges { node { id } } } }')
+
+    # Den første er stadig RUNNING - den anden venter til den er færdig
+    second = shopify_bulk.run_bulk_query(client, '{ productVariants { edges { node { id } } } }')
+
+    assert first != second
+    assert list(shopify_bulk.stream_jsonl(shopify_bulk.wait_for_bulk_operation(client, second))) == RECORDED
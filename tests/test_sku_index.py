@@ -0,0 +1,12 @@
+from sku_index import index_entry, numeric_id
+
+
+def test_index_entry_reads_numeric_ids_from_a_variant_node():
+    node = {
+        'id': 'gid://shopify/ProductVariant/11',
+        'product': {'id': 'gid://shopify/Product/1'},
+        'inventoryItem': None,
+    }
+
+    assert index_entry(node) == (11, 1, 0)
+    assert numeric_id(None) == 0
@@ -0,0 +1,42 @@
+import sqlite3
+from catalog import CatalogBuilder
+from state_store import StateStore
+
+
+def test_snapshot_keeps_product_and_inventory_item_ids(tmp_path):
+    builder = CatalogBuilder()
+    builder.add('A', variant_id=11, product_id=1, inventory_item_id=101, price=99.0, cost=50.0, inventory=3)
+    with StateStore(str(tmp_path / 'state.db')) as store:
+        store.replace_snapshot(builder.build())
+        changed = CatalogBuilder()
+        changed.add('B', variant_id=12, product_id=2, inventory_item_id=102, price=49.0, cost=20.0, inventory=1)
+        store.merge_snapshot(changed.build())
+
+        snapshot = store.load_snapshot()
+        assert dict(snapshot.items()) == {'A': (11, 1, 101), 'B': (12, 2, 102)}
+
+
+def test_old_snapshot_table_is_migrated(tmp_path):
+    path = str(tmp_path / 'state.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        'CREATE TABLE shop_variants (variant_id INTEGER PRIMARY KEY, sku TEXT, price REAL, '
+        'cost REAL, inventory INTEGER, updated_at TEXT);'
+        'CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);'
+        "INSERT INTO meta VALUES ('snapshot_full_refresh', '2026-10-17T00:00:00');"
+    )
+    conn.close()
+    with StateStore(path) as store:
+        columns = {row[1] for row in store.conn.execute('PRAGMA table_info(shop_variants)')}
+        assert {'product_id', 'inventory_item_id'} <= columns
+        assert store.get_meta('snapshot_full_refresh') is None
+
+
+def test_load_ids_prefers_snapshot_over_cached_index(tmp_path):
+    with StateStore(str(tmp_path / 'state.db')) as store:
+        store.sync_index({'A': (11, 1, 101), 'C': (13, 3, 103)})
+        builder = CatalogBuilder()
+        builder.add('A', variant_id=21, product_id=2, inventory_item_id=201, price=99.0, cost=50.0, inventory=3)
+        store.replace_snapshot(builder.build())
+
+        assert store.load_ids() == {'A': (21, 2, 201), 'C': (13, 3, 103)}
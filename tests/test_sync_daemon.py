@@ -0,0 +1,38 @@
+import os
+import pandas as pd
+import pytest
+
+os.environ.setdefault('SHOPIFY_ACCESS_TOKEN', 'test')
+import sync_vidaxl_direct as direct  # noqa: E402
+from catalog import CatalogBuilder  # noqa: E402
+from state_store import StateStore  # noqa: E402
+from sync_daemon import SyncDaemon  # noqa: E402
+
+
+def shop_catalog():
+    builder = CatalogBuilder()
+    builder.add('A', variant_id=11, product_id=1, inventory_item_id=101, price=99.0, cost=50.0,
+                inventory=5, updated_at=1_790_000_000)
+    return builder.build()
+
+
+def test_second_cycle_reuses_the_warm_catalog(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    feeds = iter(range(10))
+    monkeypatch.setattr(direct, 'fetch_feed_if_changed', lambda url, state: (
+        [pd.DataFrame({'SKU': ['A'], 'B2B price': [50.0], 'Stock': [5]})], {'sha256': str(next(feeds))}
+    ))
+    monkeypatch.setattr(direct, 'fetch_shopify_products',
+                        lambda since=None: CatalogBuilder().build() if since else shop_catalog())
+    monkeypatch.setattr(direct, 'fetch_shopify_inventory', lambda: pytest.fail('inventory not due'))
+
+    with StateStore('state.db') as store:
+        daemon = SyncDaemon(store)
+        daemon.cycle()
+        first = daemon.catalog
+        assert first is not None and daemon.consecutive_failures == 0
+
+        monkeypatch.setattr(store, 'load_snapshot', lambda: pytest.fail('warm catalog reloaded'))
+        daemon.cycle()
+        assert daemon.consecutive_failures == 0
+        assert dict(daemon.catalog.items()) == dict(first.items())
@@ -0,0 +1,38 @@
+import os
+
+os.environ.setdefault('SHOPIFY_ACCESS_TOKEN', 'test')
+import sync_to_shopify_bulk as updater  # noqa: E402
+
+
+def change(sku, price, cost, price_changed=True, cost_changed=True):
+    return {'sku': sku, 'price': price, 'cost': cost, 'inventory': '3', 'priority': 0.0,
+            'changes': {'price': price_changed, 'cost': cost_changed, 'stock': False}}
+
+
+def test_cost_is_sent_on_the_inventory_item():
+    variant = updater.variant_input(change('A', '149.0', '80.5'), {'A': (11, 1, 101)})
+
+    assert variant == {'id': 'gid://shopify/ProductVariant/11', 'price': '149.0',
+                       'inventoryItem': {'cost': '80.5'}}
+
+
+def test_non_finite_values_are_not_sent():
+    changes = updater.drop_unknown_values([
+        change('A', '149.0', 'nan'),
+        change('B', 'nan', 'nan'),
+        change('C', '99.0', '50.0'),
+    ])
+
+    assert [c['sku'] for c in changes] == ['A', 'C']
+    assert changes[0]['changes'] == {'price': True, 'cost': False, 'stock': False}
+
+
+def test_search_term_escapes_quotes_and_backslashes():
+    assert updater.search_term('VX "12"\\A') == '"VX \\"12\\"\\\\A"'
+
+
+def test_search_with_errors_and_null_data_finds_nothing(monkeypatch):
+    body = {'errors': [{'message': 'Internal error'}], 'data': None}
+    monkeypatch.setattr(updater.client, 'execute', lambda query, variables=None, cost=None: body)
+
+    assert updater.search_variants(['A', 'B']) == {}
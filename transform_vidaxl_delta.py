@@ -1,141 +1,113 @@
-import csv
-import requests
 import pandas as pd
 from datetime import datetime
-from io import StringIO
 import os
-import json
+import instrumentation
+from vidaxl_feed import concat_chunks, read_feed
+from changelog import ChangeLog
+from changeset import write_changeset
+from diff_engine import diff_against_previous, feed_frame, write_matrixify_csv
+from state_store import StateStore
+from pricing import load_rules
+from sync_config import PRICE_MARKUP, PRICING_RULES_FILE, VIDAXL_URL
 
-VIDAXL_URL = "https://transport.productsup.io/de8254c69e698a08e904/channel/188044/vidaXL_dk_dropshipping.csv"
-PRICE_MARKUP = 1.60
 
-def calculate_retail_price(b2b_price):
-    try:
-        import math
-        price = float(b2b_price) * PRICE_MARKUP
-        return int(10 * math.ceil(price / 10) - 1)
-    except:
-        return 0
+def load_shop_skus(store):
+    """Load shop SKUs from the local state store"""
+    skus = store.shop_skus()
+    if skus:
+        print(f"✅ Loaded {len(skus)} shop SKUs from {store.path}")
+        return skus
+    print("⚠️ Shop SKUs not found - will process all changes")
+    return None
 
-def load_shop_skus():
-    """Load cached SKUs from GitHub"""
-    try:
-        response = requests.get(
-            'https://raw.githubusercontent.com/GabrielKeuer/vidaxl-shopify-sync/main/shop_skus.json'
-        )
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Loaded {data['count']} shop SKUs (updated: {data['updated']})")
-            return set(str(sku) for sku in data['skus'])  # Ensure all are strings
-        else:
-            print("⚠️ Shop SKUs not found - will process all changes")
-            return None
-    except Exception as e:
-        print(f"⚠️ Could not load shop SKUs: {e}")
-        return None
+def load_previous(store):
+    """Sidst kendte feed-værdier - migrerer fra last_prices.csv første gang"""
+    previous = store.load_prices()
+    if previous.empty and os.path.exists('last_prices.csv'):
+        print("📦 Migrating last_prices.csv into the state store")
+        last_prices = pd.read_csv('last_prices.csv', dtype={'SKU': str})
+        previous = pd.DataFrame({
+            'sku': last_prices['SKU'],
+            'price': last_prices['Retail_Price'],
+            'cost': float('nan'),
+            'inventory': last_prices['Stock'],
+        })
+    return previous
 
 print(f"🚀 Starting VidaXL Delta Sync - {datetime.now()}")
+metrics = instrumentation.start_run('delta_sync')
 
 # Hent VidaXL data
 try:
-    response = requests.get(VIDAXL_URL)
-    response.raise_for_status()
-    current_data = pd.read_csv(StringIO(response.text))
+    current_data = read_feed(VIDAXL_URL)
     print(f"✅ Loaded {len(current_data)} products from VidaXL")
 except Exception as e:
     print(f"❌ Failed to fetch VidaXL data: {e}")
     # Create empty update file
-    with open('matrixify_delta_update.csv', 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            'Variant SKU', 'Variant Price', 'Variant Cost', 
-            'Variant Inventory Qty', 'Variant Command'
-        ])
-        writer.writeheader()
+    empty = feed_frame(concat_chunks([]))
+    write_matrixify_csv(empty)
+    write_changeset(empty)
+    instrumentation.finish_run('error')
     exit(0)
 
-# Beregn retail priser
-current_data['Retail_Price'] = current_data['B2B price'].apply(calculate_retail_price)
-current_data['SKU'] = current_data['SKU'].astype(str)
+# Beregn retail priser - hele feedet på én gang
+with metrics.stage('pricing', rows=len(current_data)):
+    current = feed_frame(current_data, rules=load_rules(PRICING_RULES_FILE, PRICE_MARKUP))
+
+store = StateStore()
 
 # Load shop SKUs for filtering
-shop_skus = load_shop_skus()
+shop_skus = load_shop_skus(store)
 
 # Find ændringer
-changes_found = False
-if os.path.exists('last_prices.csv'):
+with metrics.stage('state_load'):
+    previous = load_previous(store)
+if not previous.empty:
     print("📊 Comparing with previous data...")
-    last_prices = pd.read_csv('last_prices.csv', dtype={'SKU': str})
-    
-    merged = current_data.merge(
-        last_prices[['SKU', 'Retail_Price', 'Stock']],
-        on='SKU',
-        how='left',
-        suffixes=('_new', '_old')
-    )
-    
-    price_changed = merged['Retail_Price_new'] != merged['Retail_Price_old']
-    stock_changed = merged['Stock_new'] != merged['Stock_old']
-    is_new = merged['Retail_Price_old'].isna()
-    
-    changes = merged[price_changed | stock_changed | is_new].copy()
+    with metrics.stage('diff') as record:
+        all_changes = diff_against_previous(current, previous)
+        record['changes'] = len(all_changes)
+    changes = all_changes
     
     if len(changes) > 0:
         print(f"📝 Found {len(changes)} products with changes")
         
         # FILTER: Kun produkter i shoppen
         if shop_skus:
-            changes['in_shop'] = changes['SKU'].isin(shop_skus)
-            filtered_changes = changes[changes['in_shop']].copy()
+            filtered_changes = changes[changes['sku'].isin(shop_skus)]
             
             print(f"🎯 Filtered: {len(changes)} total → {len(filtered_changes)} in shop")
             changes = filtered_changes
-        
-        changes_found = len(changes) > 0
 else:
-    print("🆕 No previous data - processing all as new")
-    changes = current_data.copy()
-    changes['Stock_new'] = changes['Stock']
-    changes['Retail_Price_new'] = changes['Retail_Price']
-    
-    # Filter even for initial run
-    if shop_skus:
-        changes = changes[changes['SKU'].isin(shop_skus)].copy()
-        print(f"🎯 Filtered to {len(changes)} products in shop")
-    
-    changes_found = len(changes) > 0
+    # Tomt state store (første kørsel eller cache miss) siger intet om hvad
+    # Shopify har - feedet gemmes som baseline i stedet for at hele
+    # kataloget sendes som nyt. Direct sync sammenligner mod Shopify.
+    print("⚠️ No previous data in the state store (cache miss?) - saving the feed as baseline, "
+          "no changes emitted")
+    all_changes = current
+    changes = current.iloc[:0]
 
 # Skriv output
-if changes_found and len(changes) > 0:
-    output_rows = []
-    for _, row in changes.iterrows():
-        output_rows.append({
-            'Variant SKU': row['SKU'],
-            'Variant Price': row.get('Retail_Price_new', row.get('Retail_Price')),
-            'Variant Cost': row['B2B price'],
-            'Variant Inventory Qty': row.get('Stock_new', row.get('Stock')),
-            'Variant Command': 'UPDATE'
-        })
-    
-    with open('matrixify_delta_update.csv', 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            'Variant SKU', 'Variant Price', 'Variant Cost', 
-            'Variant Inventory Qty', 'Variant Command'
-        ])
-        writer.writeheader()
-        writer.writerows(output_rows)
-    
-    print(f"✅ Written {len(output_rows)} changes to matrixify_delta_update.csv")
+metrics.count('changes', len(changes))
+with metrics.stage('csv_write', rows=len(changes)):
+    write_matrixify_csv(changes)
+with metrics.stage('changeset_write', rows=len(changes)):
+    write_changeset(changes)
+with metrics.stage('changelog_append', rows=len(changes)):
+    ChangeLog().append(changes, metrics.run_id)
+if len(changes) > 0:
+    print(f"✅ Written {len(changes)} changes to matrixify_delta_update.csv")
 else:
-    # Ingen ændringer - lav tom fil
+    # Ingen ændringer - tom fil
     print("ℹ️ No changes detected - creating empty update file")
-    with open('matrixify_delta_update.csv', 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            'Variant SKU', 'Variant Price', 'Variant Cost', 
-            'Variant Inventory Qty', 'Variant Command'
-        ])
-        writer.writeheader()
 
-# Gem current state
+# Gem kun de ændrede rækker
 print("💾 Saving current state...")
-current_data[['SKU', 'Retail_Price', 'Stock']].to_csv('last_prices.csv', index=False)
-print("✅ Delta sync complete!")
+if not store.has_prices():
+    # Første kørsel med state store'et - gem hele feedet én gang
+    all_changes = current
+with metrics.stage('state_save'):
+    saved = store.upsert_prices(all_changes)
+store.close()
+print(f"✅ Delta sync complete! ({saved} rows written to {store.path})")
+instrumentation.finish_run()
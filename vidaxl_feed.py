@@ -0,0 +1,173 @@
+"""Streaming indlæsning af VidaXL feedet.
+
+Feedet downloades i bidder og parses mens det hentes; kun SKU, B2B price
+og Stock læses, med kompakte dtypes, så hele feedet aldrig ligger i
+hukommelsen som bytes + str + StringIO + DataFrame med alle kolonner.
+
+fetch_feed_if_changed sender conditional requests (ETag/Last-Modified) og
+hasher indholdet undervejs, så et uændret feed kan afslutte kørslen før
+der laves Shopify-kald.
+
+Parsingen streames, diff'en gør ikke: bidderne samles og gives videre
+først når hele feedet er hashet. Kun sådan vides det om feedet er uændret,
+før Shopify-snapshot'et hentes. Diff'en kører derfor på det samlede feed
+(concat_chunks).
+"""
+import os
+import json
+import time
+import hashlib
+import pandas as pd
+import instrumentation
+from pricing import CATEGORY_COLUMN
+from shopify_client import http_session
+
+FEED_COLUMNS = ['SKU', 'B2B price', 'Stock']
+FEED_DTYPES = {'SKU': str, 'B2B price': 'float64', 'Stock': 'float64', CATEGORY_COLUMN: 'category'}
+CHUNK_ROWS = 20000
+FEED_STATE_FILE = 'feed_state.json'
+
+
+def _compact(chunk):
+    chunk['Stock'] = chunk['Stock'].fillna(0).astype('int32')
+    return chunk
+
+
+class HashingReader:
+    """File-like wrapper der hasher alle bytes pandas læser"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.bytes_read = 0
+        self.read_seconds = 0.0  # tid brugt på at vente på netværket
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self.raw.read(size)
+        self.read_seconds += time.perf_counter() - start
+        self.sha256.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def drain(self):
+        while self.read(1 << 16):
+            pass
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+def _read_chunks(stream, chunksize):
+    reader = pd.read_csv(
+        stream,
+        # Kategorien er valgfri - den bruges kun af kategori-prisregler
+        usecols=lambda column: column in FEED_COLUMNS or column == CATEGORY_COLUMN,
+        dtype=FEED_DTYPES,
+        chunksize=chunksize
+    )
+    for chunk in reader:
+        yield _compact(chunk)
+
+
+def _record_feed(stream, started, rows):
+    """Download og parse sker samtidig - del tiden op efter ventetid på netværket"""
+    elapsed = time.perf_counter() - started
+    instrumentation.observe('feed_download', stream.read_seconds, bytes=stream.bytes_read)
+    instrumentation.observe('feed_parse', max(0.0, elapsed - stream.read_seconds), rows=rows)
+    instrumentation.count('feed_bytes', stream.bytes_read)
+    instrumentation.count('feed_rows', rows)
+
+
+def iter_feed_chunks(url, chunksize=CHUNK_ROWS):
+    """Stream feedet og yield DataFrames med SKU, B2B price og Stock"""
+    started = time.perf_counter()
+    rows = 0
+    with http_session().get(url, stream=True) as response:
+        response.raise_for_status()
+        # urllib3 pakker gzip/deflate ud mens pandas læser
+        response.raw.decode_content = True
+        stream = HashingReader(response.raw)
+        for chunk in _read_chunks(stream, chunksize):
+            rows += len(chunk)
+            yield chunk
+    _record_feed(stream, started, rows)
+
+
+def concat_chunks(chunks):
+    """Saml feed-chunks til én kompakt DataFrame"""
+    if not chunks:
+        return pd.DataFrame({
+            'SKU': pd.Series(dtype=str),
+            'B2B price': pd.Series(dtype='float64'),
+            'Stock': pd.Series(dtype='int32'),
+        })
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_feed(url, chunksize=CHUNK_ROWS):
+    """Hele feedet som én kompakt DataFrame"""
+    return concat_chunks(list(iter_feed_chunks(url, chunksize)))
+
+
+def load_feed_state(path=FEED_STATE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_feed_state(state, path=FEED_STATE_FILE):
+    with open(path, 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+def fetch_feed_if_changed(url, state, chunksize=CHUNK_ROWS):
+    """Hent feedet kun hvis det er ændret siden sidst.
+
+    Returnerer (chunks, new_state), eller (None, state) hvis serveren svarer
+    304, ETag'en er uændret eller indholdet er byte-identisk med sidste kørsel.
+    Alle bidder returneres samlet - hash'en skal kendes før der diffes.
+    Kalderen gemmer new_state når feedet er behandlet.
+    """
+    known = state if state.get('url') == url else {}
+    headers = {}
+    if known.get('etag'):
+        headers['If-None-Match'] = known['etag']
+    if known.get('last_modified'):
+        headers['If-Modified-Since'] = known['last_modified']
+
+    started = time.perf_counter()
+    with http_session().get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            print("ℹ️ Feed not modified (304)")
+            instrumentation.count('feed_not_modified')
+            return None, state
+        response.raise_for_status()
+
+        etag = response.headers.get('ETag')
+        if etag and etag == known.get('etag'):
+            print("ℹ️ Feed ETag unchanged")
+            instrumentation.count('feed_not_modified')
+            return None, state
+
+        response.raw.decode_content = True
+        stream = HashingReader(response.raw)
+        chunks = list(_read_chunks(stream, chunksize))
+        stream.drain()
+    _record_feed(stream, started, sum(len(chunk) for chunk in chunks))
+
+    content_hash = stream.hexdigest()
+    if content_hash == known.get('sha256'):
+        print("ℹ️ Feed content identical to last run")
+        instrumentation.count('feed_not_modified')
+        return None, state
+
+    new_state = {
+        'url': url,
+        'etag': etag,
+        'last_modified': response.headers.get('Last-Modified'),
+        'sha256': content_hash,
+        'bytes': stream.bytes_read,
+    }
+    return chunks, new_state